@@ -9,7 +9,9 @@ from openai.types.chat.chat_completion_message import ChatCompletionMessage
 from redbot.core import commands
 from redbot.core.bot import Red
 
+from .common.embeddings import EmbeddingCache, VectorStore
 from .common.models import DB, GuildSettings
+from .common.tokens import TokenCache
 
 
 class CompositeMetaClass(CogMeta, ABCMeta):
@@ -21,6 +23,9 @@ class MixinMeta(metaclass=ABCMeta):
 
     bot: Red
     db: DB
+    vectors: VectorStore
+    embedding_cache: EmbeddingCache
+    token_cache: TokenCache
     mp_pool: Pool
     registry: Dict[str, Dict[str, dict]]
 
@@ -45,6 +50,10 @@ class MixinMeta(metaclass=ABCMeta):
     async def request_embedding(self, text: str, conf: GuildSettings) -> List[float]:
         raise NotImplementedError
 
+    @abstractmethod
+    async def request_embeddings(self, texts: List[str], conf: GuildSettings) -> List[List[float]]:
+        raise NotImplementedError
+
     @abstractmethod
     async def can_call_llm(self, conf: GuildSettings, ctx: Optional[commands.Context] = None) -> bool:
         raise NotImplementedError
@@ -11,14 +11,17 @@ from perftracker import perf
 from pydantic import ValidationError
 from redbot.core import Config, commands
 from redbot.core.bot import Red
+from redbot.core.data_manager import cog_data_path
 
 from .abc import CompositeMetaClass
 from .commands import AssistantCommands
 from .common.api import API
 from .common.chat import ChatHandler
 from .common.constants import CREATE_MEMORY, EDIT_MEMORY, LIST_MEMORIES, SEARCH_MEMORIES
+from .common.embeddings import EmbeddingCache, VectorStore
 from .common.functions import AssistantFunctions
-from .common.models import DB, Embedding, EmbeddingEntryExists, NoAPIKey
+from .common.models import DB, VECTORS, Embedding, EmbeddingEntryExists, NoAPIKey
+from .common.tokens import TokenCache
 from .common.utils import json_schema_invalid
 from .listener import AssistantListener
 
@@ -72,6 +75,12 @@ class Assistant(
         self.config = Config.get_conf(self, 117117117, force_registration=True)
         self.config.register_global(db={})
         self.db: DB = DB()
+        # Embedding vectors are kept out of the config, in a binary file per guild
+        self.vectors = VectorStore(cog_data_path(self) / "embeddings")
+        # Recently embedded texts, so repeated texts don't cost another request
+        self.embedding_cache = EmbeddingCache()
+        # Token counts per message and function schema, conversations are recounted every turn
+        self.token_cache = TokenCache()
         self.mp_pool = Pool()
 
         self.tokenizer: tiktoken.core.Encoding = tiktoken.get_encoding("cl100k_base")
@@ -104,6 +113,8 @@ class Assistant(
 
         log.info(f"Config loaded in {round((perf_counter() - start) * 1000, 2)}ms")
         await asyncio.to_thread(self._cleanup_db)
+        await asyncio.to_thread(self._load_vectors)
+        await asyncio.to_thread(self._load_indexes)
 
         # Register internal functions
         await self.register_function(self.qualified_name, CREATE_MEMORY)
@@ -130,8 +141,12 @@ class Assistant(
             start = perf_counter()
             if not self.db.persistent_conversations:
                 self.db.conversations.clear()
-            dump = await asyncio.to_thread(self.db.model_dump, mode="json")
+            # Vectors go to disk first, the config no longer holds them
+            await asyncio.to_thread(self._save_vectors)
+            # Left out of the config dump, embedding vectors are saved by the vector store
+            dump = await asyncio.to_thread(self.db.model_dump, mode="json", exclude=VECTORS)
             await self.config.db.set(dump)
+            await asyncio.to_thread(self._save_indexes)
             txt = f"Config saved in {round((perf_counter() - start) * 1000, 2)}ms"
             if self.first_run:
                 log.info(txt)
@@ -143,6 +158,43 @@ class Assistant(
         if not self.db.persistent_conversations and self.save_loop.is_running():
             self.save_loop.cancel()
 
+    def _load_vectors(self):
+        start = perf_counter()
+        for guild_id, conf in self.db.configs.items():
+            try:
+                missing = self.vectors.load(guild_id, conf.embeddings)
+            except Exception as e:
+                log.error(f"Failed to load embedding vectors for guild {guild_id}", exc_info=e)
+                continue
+            if missing:
+                log.warning(f"{missing} embeddings in guild {guild_id} have no vector, refresh them to fix")
+        log.info(f"Embedding vectors loaded in {round((perf_counter() - start) * 1000, 2)}ms")
+
+    def _save_vectors(self):
+        dtype = "float16" if self.db.float16_embeddings else "float32"
+        for guild_id, conf in self.db.configs.items():
+            self.vectors.save(guild_id, conf.embeddings, dtype)
+        for guild_id in set(self.vectors.saved) - set(self.db.configs):
+            self.vectors.forget(guild_id)
+
+    def _load_indexes(self):
+        folder = cog_data_path(self) / "ann"
+        for guild_id, conf in self.db.configs.items():
+            path = folder / f"{guild_id}.npz"
+            if not path.exists():
+                continue
+            try:
+                conf.index.load(path)
+            except Exception as e:
+                log.error(f"Failed to load the approximate embedding index for guild {guild_id}", exc_info=e)
+
+    def _save_indexes(self):
+        folder = cog_data_path(self) / "ann"
+        folder.mkdir(exist_ok=True)
+        for guild_id, conf in self.db.configs.items():
+            if conf.index.dirty:
+                conf.index.save(folder / f"{guild_id}.npz")
+
     def _cleanup_db(self):
         cleaned = False
         # Cleanup registry if any cogs no longer exist
@@ -203,6 +255,7 @@ class Assistant(
                     cleaned = True
                 new_embeddings[entry_name[:100]] = embedding
             conf.embeddings = new_embeddings
+            conf.index.invalidate()
 
         health = "BAD (Cleaned)" if cleaned else "GOOD"
         log.info(f"Config health: {health}")
@@ -248,6 +301,7 @@ class Assistant(
         if not embedding:
             return None
         conf.embeddings[name] = Embedding(text=text, embedding=embedding, ai_created=ai_created)
+        conf.index.touch(name)
         asyncio.create_task(self.save_conf())
         return embedding
 
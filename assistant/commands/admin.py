@@ -29,7 +29,7 @@ from redbot.core.utils.chat_formatting import (
 
 from ..abc import MixinMeta
 from ..common.calls import request_model
-from ..common.constants import CHAT, COMPLETION, MODELS, PRICES
+from ..common.constants import CHAT, COMPLETION, EMBED_BATCH_SIZE, EMBED_CONCURRENCY, MODELS, PRICES
 from ..common.models import DB, Embedding
 from ..common.utils import get_attachments
 from ..views import CodeMenu, EmbeddingMenu, SetAPI
@@ -170,6 +170,7 @@ class Admin(MixinMeta):
             _("`Top N Embeddings:  `{}\n").format(conf.top_n)
             + _("`Min Relatedness:   `{}\n").format(conf.min_relatedness)
             + _("`Embedding Method:  `{}\n").format(conf.embed_method)
+            + _("`ANN Probes:        `{}\n").format(conf.ann_probes or _("Exact"))
             + _("`Encodings:         `{}").format(encoded_by)
         )
         embed_num = humanize_number(len(conf.embeddings))
@@ -1015,6 +1016,7 @@ class Admin(MixinMeta):
             return await ctx.send(_("Not wiping embedding data"))
         conf = self.db.get_conf(ctx.guild)
         conf.embeddings = {}
+        conf.index.invalidate()
         await ctx.send(_("All embedding data has been wiped!"))
         await self.save_conf()
 
@@ -1068,6 +1070,28 @@ class Admin(MixinMeta):
         await ctx.send(_("Minimum relatedness has been set to **{}**").format(mimimum_relatedness))
         await self.save_conf()
 
+    @assistant.command(name="annprobes")
+    async def set_ann_probes(self, ctx: commands.Context, probes: int):
+        """
+        Set how many clusters the approximate embedding index searches
+
+        Guilds with a very large amount of embeddings can search a k-means clustered index instead of comparing against every embedding.
+        Only the embeddings in the clusters closest to the question are scored, more probes find more of the true matches but take longer.
+
+        The index is only used once there are at least 20,000 embeddings of the same size, and is trained in the background the first time it is needed.
+
+        Set to 0 to always compare against every embedding (default)
+        """
+        if not 0 <= probes <= 256:
+            return await ctx.send(_("Probes must be between 0 and 256"))
+        conf = self.db.get_conf(ctx.guild)
+        conf.ann_probes = probes
+        if not probes:
+            await ctx.send(_("Embeddings will be compared exactly"))
+        else:
+            await ctx.send(_("The approximate embedding index will search **{}** clusters").format(probes))
+        await self.save_conf()
+
     @assistant.command(name="regexblacklist")
     async def regex_blacklist(self, ctx: commands.Context, *, regex: str):
         """Remove certain words/phrases in the bot's responses"""
@@ -1175,35 +1199,36 @@ class Admin(MixinMeta):
 
         df = await asyncio.to_thread(pd.concat, frames)
 
-        entries = len(df.index)
-        split_by = 10
-        if entries > 300:
-            split_by = round(entries / 25)
-        imported = 0
-        for index, row in enumerate(df.values):
+        entries = []
+        for row in df.values:
             if pd.isna(row[0]) or pd.isna(row[1]):
                 continue
             name = str(row[0])
-            proc = _("processing")
             if name in conf.embeddings:
-                proc = _("overwriting")
                 if row[1] == conf.embeddings[name].text or not overwrite:
                     continue
-            text = str(row[1])[:4000]
-            if index and (index + 1) % split_by == 0:
+            entries.append((name, str(row[1])[:4000]))
+
+        # Texts are embedded in batches, a few requests at a time
+        split_by = EMBED_BATCH_SIZE * EMBED_CONCURRENCY
+        imported = 0
+        for start in range(0, len(entries), split_by):
+            chunk = entries[start : start + split_by]
+            if start:
                 with contextlib.suppress(discord.DiscordServerError):
                     await message.edit(
                         content=_("{}\n`Currently {}: `**{}** ({}/{})").format(
-                            message_text, proc, name, index + 1, len(df)
+                            message_text, _("processing"), chunk[0][0], start + 1, len(entries)
                         )
                     )
-            query_embedding = await self.request_embedding(text, conf)
-            if len(query_embedding) == 0:
-                await ctx.send(_("Failed to process embedding: `{}`").format(name))
-                continue
-
-            conf.embeddings[name] = Embedding(text=text, embedding=query_embedding)
-            imported += 1
+            embeddings = await self.request_embeddings([text for __, text in chunk], conf)
+            for (name, text), query_embedding in zip(chunk, embeddings):
+                if len(query_embedding) == 0:
+                    await ctx.send(_("Failed to process embedding: `{}`").format(name))
+                    continue
+                conf.embeddings[name] = Embedding(text=text, embedding=query_embedding)
+                conf.index.touch(name)
+                imported += 1
         await message.edit(content=_("{}\n**COMPLETE**").format(message_text))
         await ctx.send(_("Successfully imported {} embeddings!").format(humanize_number(imported)))
         await self.save_conf()
@@ -1239,6 +1264,7 @@ class Admin(MixinMeta):
                             continue
                         conf.embeddings[name] = Embedding.model_validate(em)
                         conf.embeddings[name].text = conf.embeddings[name].text[:4000]
+                        conf.index.touch(name)
                         imported += 1
                 except ValidationError:
                     await ctx.send(
@@ -1299,41 +1325,40 @@ class Admin(MixinMeta):
             message_text = _("Processing the following files in the background\n{}").format(box(humanize_list(files)))
             message = await ctx.send(message_text)
             df = await asyncio.to_thread(pd.concat, frames)
-            entries = len(df.index)
-            split_by = 10
-            if entries > 300:
-                split_by = round(entries / 25)
-            imported = 0
-            for index, row in df.iterrows():
+            entries = []
+            for __, row in df.iterrows():
                 name = row["name"]
                 text = row["text"]
-                proc = _("processing")
                 if name in conf.embeddings:
-                    proc = _("overwriting")
                     if not overwrite or conf.embeddings[name].text == text:
                         continue
-                created_tz = pd.to_datetime(row["created"]).tz_localize(tz)
+                entries.append(row)
 
-                if index and (index + 1) % split_by == 0:
+            # Texts are embedded in batches, a few requests at a time
+            split_by = EMBED_BATCH_SIZE * EMBED_CONCURRENCY
+            imported = 0
+            for start in range(0, len(entries), split_by):
+                chunk = entries[start : start + split_by]
+                if start:
                     with contextlib.suppress(discord.DiscordServerError):
                         await message.edit(
                             content=_("{}\n`Currently {}: `**{}** ({}/{})").format(
-                                message_text, proc, name, index + 1, len(df)
+                                message_text, _("processing"), chunk[0]["name"], start + 1, len(entries)
                             )
                         )
-
-                query_embedding = await self.request_embedding(text, conf)
-                if len(query_embedding) == 0:
-                    await ctx.send(_("Failed to process embedding: `{}`").format(name))
-                    continue
-
-                conf.embeddings[name] = Embedding(
-                    text=text,
-                    embedding=query_embedding,
-                    ai_created=row["ai_created"],
-                    created=created_tz,
-                )
-                imported += 1
+                embeddings = await self.request_embeddings([row["text"] for row in chunk], conf)
+                for row, query_embedding in zip(chunk, embeddings):
+                    if len(query_embedding) == 0:
+                        await ctx.send(_("Failed to process embedding: `{}`").format(row["name"]))
+                        continue
+                    conf.embeddings[row["name"]] = Embedding(
+                        text=row["text"],
+                        embedding=query_embedding,
+                        ai_created=row["ai_created"],
+                        created=pd.to_datetime(row["created"]).tz_localize(tz),
+                    )
+                    conf.index.touch(row["name"])
+                    imported += 1
 
             if imported:
                 await message.edit(content=_("{}\n**COMPLETE**").format(message_text))
@@ -1821,7 +1846,7 @@ class Admin(MixinMeta):
         def _dump():
             # Delete and convo data
             self.db.conversations.clear()
-            return self.db.json()
+            return orjson.dumps(self.db.dump_with_vectors()).decode()
 
         dump = await asyncio.to_thread(_dump)
 
@@ -1899,6 +1924,24 @@ class Admin(MixinMeta):
             await ctx.send(_("Persistent conversations have been **Enabled**"))
         await self.save_conf()
 
+    @assistant.command(name="float16")
+    @commands.is_owner()
+    async def toggle_float16_embeddings(self, ctx: commands.Context):
+        """
+        Toggle storing embedding vectors at half precision
+
+        Halves the size of the stored embeddings and the memory they use once reloaded, at a small cost to precision.
+        Every server's embeddings are rewritten the next time the config is saved.
+        """
+        if self.db.float16_embeddings:
+            self.db.float16_embeddings = False
+            await ctx.send(_("Embeddings will be stored at **full** precision"))
+        else:
+            self.db.float16_embeddings = True
+            await ctx.send(_("Embeddings will be stored at **half** precision"))
+        self.vectors.saved.clear()
+        await self.save_conf()
+
     @assistant.command(name="resetglobalembeddings")
     @commands.is_owner()
     async def wipe_global_embeddings(self, ctx: commands.Context, yes_or_no: bool):
@@ -1911,6 +1954,7 @@ class Admin(MixinMeta):
             return await ctx.send(_("Not wiping embedding data"))
         for conf in self.db.configs.values():
             conf.embeddings = {}
+            conf.index.invalidate()
         await ctx.send(_("All embedding data has been wiped for all servers!"))
         await self.save_conf()
 
@@ -3,10 +3,11 @@ import inspect
 import json
 import logging
 import math
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import aiohttp
 import discord
+import openai
 import tiktoken
 from aiohttp import ClientConnectionError
 from openai.types.chat.chat_completion import ChatCompletion
@@ -27,7 +28,15 @@ from .calls import (
     request_text_raw,
     request_tokens_raw,
 )
-from .constants import CHAT, MODELS, SUPPORTS_VISION
+from .constants import (
+    CHAT,
+    EMBED_BATCH_SIZE,
+    EMBED_BATCH_TOKENS,
+    EMBED_CONCURRENCY,
+    EMBED_MODEL,
+    MODELS,
+    SUPPORTS_VISION,
+)
 from .models import GuildSettings
 from .utils import compile_messages
 
@@ -137,6 +146,17 @@ class API(MixinMeta):
         return message
 
     async def request_embedding(self, text: str, conf: GuildSettings) -> List[float]:
+        return (await self.request_embeddings([text], conf))[0]
+
+    @perf()
+    async def request_embeddings(self, texts: List[str], conf: GuildSettings) -> List[List[float]]:
+        """Embed several texts at once, returned in the same order
+
+        Identical texts are only embedded once and recently embedded texts come from the cache.
+        The rest are split into batches within the request limits, a few batches are requested at a time.
+        Usage is recorded for every batch sent. A batch the API rejects as a bad request is retried one text at a time,
+        any other failure fails the whole batch. Texts that could not be embedded get an empty list.
+        """
         if conf.api_key:
             api_base = None
             api_key = conf.api_key
@@ -144,16 +164,73 @@ class API(MixinMeta):
             log.debug("Using external embedder")
             api_base = conf.endpoint_override or self.db.endpoint_override
             api_key = "unset"
+        endpoint = api_base or "openai"
+
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        pending: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            cached = self.embedding_cache.get(endpoint, EMBED_MODEL, text)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.setdefault(text, []).append(i)
+        if not pending:
+            return results
 
-        response: CreateEmbeddingResponse = await request_embedding_raw(text, api_key, api_base)
+        batches = await asyncio.to_thread(self.batch_texts, list(pending))
+        sem = asyncio.Semaphore(EMBED_CONCURRENCY)
 
-        conf.update_usage(
-            response.model,
-            response.usage.total_tokens,
-            response.usage.prompt_tokens,
-            0,
-        )
-        return response.data[0].embedding
+        async def embed(batch: List[str]):
+            try:
+                async with sem:
+                    response: CreateEmbeddingResponse = await request_embedding_raw(batch, api_key, api_base)
+            except openai.BadRequestError as e:
+                if len(batch) > 1:
+                    # One bad text fails the whole request, so the rest still get embedded on their own
+                    log.warning(f"Batch of {len(batch)} texts was rejected, retrying one at a time", exc_info=e)
+                    await asyncio.gather(*(embed([text]) for text in batch))
+                    return
+                log.error(f"Failed to embed text: {batch[0][:100]}", exc_info=e)
+                for i in pending[batch[0]]:
+                    results[i] = []
+                return
+            except Exception as e:
+                # Rate limits, auth and connection errors would fail each text the same way
+                log.error(f"Failed to embed a batch of {len(batch)} texts", exc_info=e)
+                for text in batch:
+                    for i in pending[text]:
+                        results[i] = []
+                return
+            conf.update_usage(
+                response.model,
+                response.usage.total_tokens,
+                response.usage.prompt_tokens,
+                0,
+            )
+            for text, data in zip(batch, sorted(response.data, key=lambda x: x.index)):
+                self.embedding_cache.put(endpoint, EMBED_MODEL, text, data.embedding)
+                for i in pending[text]:
+                    results[i] = data.embedding
+
+        await asyncio.gather(*(embed(batch) for batch in batches))
+        return results
+
+    def batch_texts(self, texts: List[str]) -> List[List[str]]:
+        """Group texts into batches that stay within the size and token limits of one embedding request"""
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for text in texts:
+            tokens = len(self.tokenizer.encode(text))
+            if batch and (len(batch) >= EMBED_BATCH_SIZE or batch_tokens + tokens > EMBED_BATCH_TOKENS):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
 
     # -------------------------------------------------------
     # -------------------------------------------------------
@@ -173,69 +250,91 @@ class API(MixinMeta):
             log.debug("Using external tokenizer")
             endpoint = conf.endpoint_override or self.db.endpoint_override
             num_tokens = 0
-            valid_endpoint = True
             for message in messages:
-                if not valid_endpoint:
-                    break
-                num_tokens += 4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
-                for key, value in message.items():
-                    if not value:
+                key = self.token_cache.key(endpoint, message)
+                count = self.token_cache.get(key)
+                if count is None:
+                    count = await self.count_message_tokens_external(message, endpoint)
+                    if count is None:
+                        # Fall back to local encoder
+                        break
+                    self.token_cache.put(key, count)
+                num_tokens += count
+            else:
+                return num_tokens
+
+        encoding = None
+        num_tokens = 2  # every reply is primed with <im_start>assistant
+        for message in messages:
+            key = self.token_cache.key(model, message)
+            count = self.token_cache.get(key)
+            if count is None:
+                if encoding is None:
+                    try:
+                        encoding = tiktoken.encoding_for_model(model)
+                    except KeyError:
+                        encoding = tiktoken.get_encoding("cl100k_base")
+                count = await asyncio.to_thread(self.count_message_tokens_local, message, encoding)
+                self.token_cache.put(key, count)
+            num_tokens += count
+        return num_tokens
+
+    async def count_message_tokens_external(self, message: dict, endpoint: str) -> Optional[int]:
+        """Token count of a single message from the endpoint's tokenizer, None if the endpoint can't tokenize"""
+        num_tokens = 4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
+        valid_endpoint = True
+        for key, value in message.items():
+            if not value:
+                continue
+            if isinstance(value, list):
+                for i in value:
+                    if i["type"] == "image_url":
+                        num_tokens += 65
                         continue
-                    if isinstance(value, list):
-                        for i in value:
-                            if i["type"] == "image_url":
-                                num_tokens += 65
-                                continue
-                            try:
-                                tokens = await request_tokens_raw(i, f"{endpoint}/tokenize")
-                                num_tokens += len(tokens)
-                            except (KeyError, ClientConnectionError):  # API probably old or bad endpoint
-                                # Break and fall back to local encoder
-                                valid_endpoint = False
                     try:
-                        tokens = await request_tokens_raw(value, f"{endpoint}/tokenize")
+                        tokens = await request_tokens_raw(i, f"{endpoint}/tokenize")
                         num_tokens += len(tokens)
-                        if key == "name":  # if there's a name, the role is omitted
-                            num_tokens += -1  # role is always required and always 1 token
                     except (KeyError, ClientConnectionError):  # API probably old or bad endpoint
-                        # Break and fall back to local encoder
                         valid_endpoint = False
-                num_tokens += 2  # every reply is primed with <im_start>assistant
-            else:
-                return num_tokens
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
-        num_tokens = 0
-        for message in messages:
-            num_tokens += 4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
-            for key, value in message.items():
-                if not value:
-                    continue
-                if isinstance(value, list):
-                    for i in value:
-                        if i["type"] == "image_url":
+            try:
+                tokens = await request_tokens_raw(value, f"{endpoint}/tokenize")
+                num_tokens += len(tokens)
+                if key == "name":  # if there's a name, the role is omitted
+                    num_tokens += -1  # role is always required and always 1 token
+            except (KeyError, ClientConnectionError):  # API probably old or bad endpoint
+                valid_endpoint = False
+        num_tokens += 2  # every reply is primed with <im_start>assistant, counted per message for external tokenizers
+        return num_tokens if valid_endpoint else None
+
+    @staticmethod
+    def count_message_tokens_local(message: dict, encoding: tiktoken.Encoding) -> int:
+        """Token count of a single message from a local tiktoken encoding"""
+        num_tokens = 4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
+        for key, value in message.items():
+            if not value:
+                continue
+            if isinstance(value, list):
+                for i in value:
+                    if i["type"] == "image_url":
+                        num_tokens += 65
+                        if i.get("detail", "") == "high":
                             num_tokens += 65
-                            if i.get("detail", "") == "high":
-                                num_tokens += 65
-                            continue
-                        try:
-                            encoded = await asyncio.to_thread(encoding.encode, i.get("text") or str(i))
-                        except Exception as e:
-                            log.error(f"Failed to encode: {i.get('text') or str(i)}", exc_info=e)
-                            encoded = []
-                        num_tokens += len(encoded)
-                else:
+                        continue
                     try:
-                        encoded = await asyncio.to_thread(encoding.encode, str(value))
+                        encoded = encoding.encode(i.get("text") or str(i))
                     except Exception as e:
-                        log.error(f"Failed to encode: {value}", exc_info=e)
+                        log.error(f"Failed to encode: {i.get('text') or str(i)}", exc_info=e)
                         encoded = []
                     num_tokens += len(encoded)
-                if key == "name":  # if there's a name, the role is omitted
-                    num_tokens += -1  # role is always required and always 1 token
-        num_tokens += 2  # every reply is primed with <im_start>assistant
+            else:
+                try:
+                    encoded = encoding.encode(str(value))
+                except Exception as e:
+                    log.error(f"Failed to encode: {value}", exc_info=e)
+                    encoded = []
+                num_tokens += len(encoded)
+            if key == "name":  # if there's a name, the role is omitted
+                num_tokens += -1  # role is always required and always 1 token
         return num_tokens
 
     async def count_function_tokens(
@@ -249,25 +348,33 @@ class API(MixinMeta):
             endpoint = conf.endpoint_override or self.db.endpoint_override
             num_tokens = 0
             for func in functions:
-                dump = json.dumps(func)
-                try:
-                    tokens = await request_tokens_raw(dump, f"{endpoint}/tokenize")
-                    num_tokens += len(tokens)
-                except (KeyError, ClientConnectionError):  # API probably old or bad endpoint
-                    # Break and fall back to local encoder
-                    break
+                key = self.token_cache.key(endpoint, func)
+                count = self.token_cache.get(key)
+                if count is None:
+                    try:
+                        count = len(await request_tokens_raw(json.dumps(func), f"{endpoint}/tokenize"))
+                    except (KeyError, ClientConnectionError):  # API probably old or bad endpoint
+                        # Break and fall back to local encoder
+                        break
+                    self.token_cache.put(key, count)
+                num_tokens += count
             else:
                 return num_tokens
 
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
+        encoding = None
         num_tokens = 0
         for func in functions:
-            dump = json.dumps(func)
-            encoded = await asyncio.to_thread(encoding.encode, dump)
-            num_tokens += len(encoded)
+            key = self.token_cache.key(model, func)
+            count = self.token_cache.get(key)
+            if count is None:
+                if encoding is None:
+                    try:
+                        encoding = tiktoken.encoding_for_model(model)
+                    except KeyError:
+                        encoding = tiktoken.get_encoding("cl100k_base")
+                count = len(await asyncio.to_thread(encoding.encode, json.dumps(func)))
+                self.token_cache.put(key, count)
+            num_tokens += count
         return num_tokens
 
     async def get_tokens(
@@ -342,13 +449,19 @@ class API(MixinMeta):
 
         sample = list(conf.embeddings.values())[0]
         sample_embed = await self.request_embedding(sample.text, conf)
+        if not sample_embed:
+            return 0
 
-        synced = 0
-        for name, em in conf.embeddings.items():
-            if len(em.embedding) != len(sample_embed):
-                em.embedding = await self.request_embedding(em.text, conf)
-                synced += 1
-                log.debug(f"Updating embedding {name}")
+        outdated = [em for em in conf.embeddings.values() if len(em.embedding) != len(sample_embed)]
+        synced = len(outdated)
+        if outdated:
+            embeddings = await self.request_embeddings([em.text for em in outdated], conf)
+            for em, embedding in zip(outdated, embeddings):
+                if not embedding:
+                    synced -= 1
+                    continue
+                em.embedding = embedding
+            conf.index.invalidate()
 
         if synced:
             await self.save_conf()
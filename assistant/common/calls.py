@@ -1,6 +1,6 @@
 import logging
 import typing as t
-from typing import List, Optional
+from typing import List, Optional, Union
 
 import aiohttp
 import httpx
@@ -15,7 +15,7 @@ from tenacity import (
     wait_random_exponential,
 )
 
-from .constants import MODELS_1106, SUPPORTS_FUNCTIONS, SUPPORTS_TOOLS
+from .constants import EMBED_MODEL, MODELS_1106, SUPPORTS_FUNCTIONS, SUPPORTS_TOOLS
 
 log = logging.getLogger("red.vrt.assistant.calls")
 
@@ -144,9 +144,8 @@ async def request_completion_raw(
     reraise=True,
 )
 @perf()
-@cached(ttl=3600)
 async def request_embedding_raw(
-    text: str,
+    text: Union[str, List[str]],
     api_key: str,
     api_base: Optional[str] = None,
 ) -> List[float]:
@@ -165,7 +164,7 @@ async def request_embedding_raw(
     )
     response = await client.embeddings.create(
         input=text,
-        model="text-embedding-ada-002",
+        model=EMBED_MODEL,
     )
     # log.debug(f"EMBED RESPONSE TYPE: {type(response)}")
     return response
@@ -26,6 +26,12 @@ MODELS = {
     "text-embedding-ada-002": 8191,
     "text-embedding-ada-002-v2": 8191,
 }
+# Model used for embeddings, and limits for batching texts into one embedding request
+EMBED_MODEL = "text-embedding-ada-002"
+EMBED_BATCH_SIZE = 2048  # Texts per request
+EMBED_BATCH_TOKENS = 100000  # Tokens per request
+EMBED_CONCURRENCY = 4  # Requests in flight at once
+
 PRICES = {
     "gpt-3.5-turbo": [0.0015, 0.002],
     "gpt-3.5-turbo-0301": [0.0015, 0.002],
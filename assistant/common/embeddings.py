@@ -0,0 +1,431 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+log = logging.getLogger("red.vrt.assistant.embeddings")
+
+# Smaller sets are always searched exactly, a full scan is already fast there
+ANN_MIN_ROWS = 20000
+# Rows sampled per cluster to train the centroids on
+KMEANS_SAMPLE = 64
+KMEANS_ITERATIONS = 10
+
+
+def kmeans(data: np.ndarray, clusters: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means over unit length rows, returns unit length centroids
+
+    Trained on a sample of the rows, clusters that end up empty are reseeded from a random row.
+    """
+    rng = np.random.default_rng(seed)
+    if len(data) > clusters * KMEANS_SAMPLE:
+        data = data[rng.choice(len(data), clusters * KMEANS_SAMPLE, replace=False)]
+    centroids = data[rng.choice(len(data), clusters, replace=False)].copy()
+    for __ in range(iterations):
+        labels = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        counts = np.bincount(labels, minlength=clusters)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        centroids = sums / norms
+    return centroids.astype(np.float32)
+
+
+def assign(rows: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    """Nearest centroid of every row, in chunks to keep the score matrix small"""
+    labels = np.empty(len(rows), dtype=np.int32)
+    for i in range(0, len(rows), chunk):
+        labels[i : i + chunk] = np.argmax(rows[i : i + chunk] @ centroids.T, axis=1)
+    return labels
+
+
+def checksums(rows: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    """Hash of the exact float32 bits of every row, tells whether a saved label still belongs to its row"""
+    weights = np.random.default_rng(0).integers(1, 2**63, rows.shape[1], dtype=np.uint64) | np.uint64(1)
+    sums = np.empty(len(rows), dtype=np.uint64)
+    for i in range(0, len(rows), chunk):
+        # Wraps around on overflow, which is fine for a hash
+        sums[i : i + chunk] = (rows[i : i + chunk].view(np.uint32).astype(np.uint64) * weights).sum(axis=1)
+    return sums
+
+
+class DimensionIndex:
+    """
+    Unit length float32 rows of every embedding with the same dimensions
+
+    Rows live in one contiguous matrix that grows by doubling, a deleted row is filled with the last row
+    so the first `size` rows are always the live ones.
+    Once centroids are installed every row is also labeled with its nearest one, an approximate query only
+    scores the rows in the clusters closest to the query (IVF).
+    """
+
+    def __init__(self, dims: int):
+        self.dims = dims
+        self.names: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.matrix = np.zeros((0, dims), dtype=np.float32)
+        self.labels = np.zeros(0, dtype=np.int32)
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0  # Rows the centroids were trained on
+        self.building = False
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def upsert(self, name: str, vector: List[float]):
+        row = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(row)
+        if norm:
+            row = row / norm
+        index = self.rows.get(name)
+        if index is None:
+            index = len(self.names)
+            if index == len(self.matrix):
+                size = max(16, index * 2)
+                grown = np.zeros((size, self.dims), dtype=np.float32)
+                grown[:index] = self.matrix[:index]
+                self.matrix = grown
+                labels = np.zeros(size, dtype=np.int32)
+                labels[:index] = self.labels[:index]
+                self.labels = labels
+            self.rows[name] = index
+            self.names.append(name)
+        self.matrix[index] = row
+        if self.centroids is not None:
+            self.labels[index] = int(np.argmax(self.centroids @ row))
+
+    def remove(self, name: str):
+        index = self.rows.pop(name, None)
+        if index is None:
+            return
+        last = len(self.names) - 1
+        if index != last:
+            moved = self.names[last]
+            self.matrix[index] = self.matrix[last]
+            self.labels[index] = self.labels[last]
+            self.names[index] = moved
+            self.rows[moved] = index
+        self.names.pop()
+
+    def needs_training(self) -> bool:
+        if self.building or len(self.names) < ANN_MIN_ROWS:
+            return False
+        return self.centroids is None or len(self.names) > self.trained_size * 2
+
+    def install(
+        self,
+        centroids: np.ndarray,
+        labels: Dict[str, int],
+        sums: Dict[str, int],
+        trained_size: int,
+    ) -> int:
+        """
+        Use new centroids with the labels they were trained or saved with
+
+        `sums` are the row checksums the labels were computed from. Rows missing from `labels`, or whose vector
+        changed since, are assigned to their nearest centroid. Returns how many rows that was.
+        """
+        size = len(self.names)
+        current = np.fromiter((labels.get(i, -1) for i in self.names), dtype=np.int32, count=size)
+        expected = np.fromiter((sums.get(i, 0) for i in self.names), dtype=np.uint64, count=size)
+        stale = np.flatnonzero((current < 0) | (expected != checksums(self.matrix[:size])))
+        if len(stale):
+            current[stale] = assign(self.matrix[stale], centroids)
+        self.labels[:size] = current
+        self.centroids = centroids
+        self.trained_size = trained_size
+        return len(stale)
+
+    def query(self, query: np.ndarray, top_n: int, min_score: float, probes: int = 0) -> List[Tuple[str, float]]:
+        """
+        Names and cosine similarity of the `top_n` closest rows scoring at least `min_score`, best first
+
+        With `probes` set and centroids installed only the rows in that many nearest clusters are scored,
+        more probes trade speed for recall.
+        """
+        size = len(self.names)
+        if probes and self.centroids is not None and probes < len(self.centroids):
+            probed = np.zeros(len(self.centroids), dtype=bool)
+            probed[np.argpartition(self.centroids @ query, -probes)[-probes:]] = True
+            rows = np.flatnonzero(probed[self.labels[:size]])
+            scores = self.matrix[rows] @ query
+        else:
+            rows = None
+            scores = self.matrix[:size] @ query
+        candidates = np.flatnonzero(scores >= min_score)
+        if len(candidates) > top_n:
+            candidates = candidates[np.argpartition(scores[candidates], -top_n)[-top_n:]]
+        candidates = candidates[np.argsort(scores[candidates])[::-1]]
+        found = candidates if rows is None else rows[candidates]
+        return [(self.names[i], float(s)) for i, s in zip(found.tolist(), scores[candidates].tolist())]
+
+
+class EmbeddingIndex:
+    """
+    Per dimension similarity indexes over a guild's embeddings
+
+    `sync` brings the index in line with the embeddings dict before each query. Code that adds, edits or deletes
+    an entry calls `touch` with its name and only those entries are compared on the next sync, by the identity of
+    their vector. A new index, or one that was `invalidate`d after bulk changes, compares every entry once.
+
+    Approximate queries train the centroids of any dimension with enough rows in a background thread,
+    exact search is used until they are ready. Centroids are retrained once the rows double.
+    """
+
+    def __init__(self):
+        self.indexes: Dict[int, DimensionIndex] = {}
+        self.sources: Dict[str, List[float]] = {}
+        self.lock = threading.Lock()
+        # Entries changed since the last sync, kept under their own lock so touching never waits on a query
+        self.changed: Set[str] = set()
+        self.stale = True
+        self.changed_lock = threading.Lock()
+        # Centroids, labels and row checksums read from disk, installed once the rows of their dimension are synced
+        self.saved: Dict[int, Tuple[np.ndarray, Dict[str, int], Dict[str, int], int]] = {}
+        self.dirty = False  # Centroids or labels changed since they were last saved
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def touch(self, *names: str):
+        """Have the next sync pick up entries that were added, edited or deleted"""
+        with self.changed_lock:
+            self.changed.update(names)
+
+    def invalidate(self):
+        """Have the next sync compare every entry, for bulk changes and replaced embedding dicts"""
+        with self.changed_lock:
+            self.stale = True
+
+    def sync(self, embeddings: dict):
+        with self.changed_lock:
+            stale, self.stale = self.stale, False
+            changed, self.changed = self.changed, set()
+        with self.lock:
+            names = set(self.sources).union(embeddings) if stale else changed
+            for name in names:
+                em = embeddings.get(name)
+                if em is None:
+                    self._remove(name)
+                elif self.sources.get(name) is not em.embedding:
+                    self._remove(name)
+                    self._add(name, em.embedding)
+            for dims in [i for i in self.saved if i in self.indexes]:
+                if self.indexes[dims].install(*self.saved.pop(dims)):
+                    self.dirty = True
+
+    def _add(self, name: str, vector: List[float]):
+        dims = len(vector)
+        if not dims:
+            return
+        if dims not in self.indexes:
+            self.indexes[dims] = DimensionIndex(dims)
+        index = self.indexes[dims]
+        index.upsert(name, vector)
+        self.sources[name] = vector
+        if index.centroids is not None:
+            self.dirty = True
+
+    def _remove(self, name: str):
+        vector = self.sources.pop(name, None)
+        if vector is not None:
+            index = self.indexes[len(vector)]
+            index.remove(name)
+            if index.centroids is not None:
+                self.dirty = True
+
+    def query(
+        self,
+        query_embedding: List[float],
+        top_n: int,
+        min_score: float,
+        probes: int = 0,
+    ) -> List[Tuple[str, float]]:
+        with self.lock:
+            index = self.indexes.get(len(query_embedding))
+            if not index:
+                return []
+            if probes and index.needs_training():
+                self.train(index)
+            query = np.asarray(query_embedding, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if not norm:
+                return []
+            return index.query(query / norm, top_n, min_score, probes)
+
+    def train(self, index: DimensionIndex):
+        """Train new centroids for a dimension in a background thread, the caller must hold the lock"""
+        index.building = True
+        size = len(index)
+        snapshot = index.matrix[:size].copy()
+        names = list(index.names)
+
+        def build():
+            try:
+                clusters = int(np.clip(np.sqrt(size), 16, 4096))
+                centroids = kmeans(snapshot, clusters)
+                labels = dict(zip(names, assign(snapshot, centroids).tolist()))
+                sums = dict(zip(names, checksums(snapshot).tolist()))
+                with self.lock:
+                    # Rows edited while training get relabeled here
+                    index.install(centroids, labels, sums, size)
+                    self.dirty = True
+                log.info(f"Trained {clusters} clusters over {size} embeddings of {index.dims} dimensions")
+            except Exception as e:
+                log.error(f"Failed to train the approximate index for {index.dims} dimensions", exc_info=e)
+            finally:
+                index.building = False
+
+        threading.Thread(target=build, name="assistant_ann", daemon=True).start()
+
+    def save(self, path: Path):
+        """Write the centroids and row labels of every trained dimension"""
+        with self.lock:
+            arrays = {}
+            for dims, index in self.indexes.items():
+                if index.centroids is None:
+                    continue
+                arrays[f"{dims}_centroids"] = index.centroids
+                arrays[f"{dims}_names"] = np.array(index.names, dtype=str)
+                arrays[f"{dims}_labels"] = index.labels[: len(index)].copy()
+                arrays[f"{dims}_checksums"] = checksums(index.matrix[: len(index)])
+                arrays[f"{dims}_trained"] = np.int64(index.trained_size)
+            self.dirty = False
+        if not arrays:
+            path.unlink(missing_ok=True)
+            return
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            np.savez(f, **arrays)
+        tmp.replace(path)
+
+    def load(self, path: Path):
+        with np.load(path) as f:
+            for key in f.files:
+                if not key.endswith("_centroids"):
+                    continue
+                dims = int(key.split("_")[0])
+                names = f[f"{dims}_names"].tolist()
+                labels = dict(zip(names, f[f"{dims}_labels"].tolist()))
+                # Without checksums every saved label is checked against the centroids again
+                sums = dict(zip(names, f[f"{dims}_checksums"].tolist())) if f"{dims}_checksums" in f.files else {}
+                self.saved[dims] = (f[key], labels, sums, int(f[f"{dims}_trained"]))
+
+
+class VectorStore:
+    """
+    Embedding vectors kept in a binary .npz file per guild instead of the JSON config
+
+    Each file holds the entry names and a float32 (or float16) matrix for every embedding size in the guild.
+    Loaded vectors stay rows of those matrices, a guild's file is only rewritten when its vectors changed
+    since it was last loaded or saved.
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+        self.saved: Dict[int, Dict[str, np.ndarray]] = {}  # Vectors each guild's file holds, by entry name
+
+    def path(self, guild_id: int) -> Path:
+        return self.folder / f"{guild_id}.npz"
+
+    def load(self, guild_id: int, embeddings: dict) -> int:
+        """Put stored vectors back on embeddings loaded from config, returns how many are still without one"""
+        saved = self.saved[guild_id] = {}
+        path = self.path(guild_id)
+        if path.exists():
+            with np.load(path) as f:
+                for key in f.files:
+                    if not key.endswith("_vectors"):
+                        continue
+                    names = f[key.replace("_vectors", "_names")].tolist()
+                    for name, vector in zip(names, f[key]):
+                        em = embeddings.get(name)
+                        # Configs from before the store still have their vectors inline
+                        if em is not None and not len(em.embedding):
+                            em.embedding = saved[name] = vector
+        return sum(not len(em.embedding) for em in embeddings.values())
+
+    def changed(self, guild_id: int, embeddings: dict) -> bool:
+        saved = self.saved.get(guild_id, {})
+        if len(saved) != len(embeddings):
+            return True
+        return any(saved.get(name) is not em.embedding for name, em in embeddings.items())
+
+    def save(self, guild_id: int, embeddings: dict, dtype: str = "float32") -> bool:
+        """
+        Write a guild's vectors if they changed, returns whether the file was written
+
+        Vectors that are still lists (new or edited since the last save) are swapped for compact arrays.
+        """
+        if not self.changed(guild_id, embeddings):
+            return False
+        groups: Dict[int, List[str]] = {}
+        for name, em in embeddings.items():
+            if not isinstance(em.embedding, np.ndarray) or em.embedding.dtype != dtype:
+                em.embedding = np.asarray(em.embedding, dtype=dtype)
+            if len(em.embedding):
+                groups.setdefault(len(em.embedding), []).append(name)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        path = self.path(guild_id)
+        if not groups:
+            path.unlink(missing_ok=True)
+        else:
+            arrays = {}
+            for dims, names in groups.items():
+                arrays[f"{dims}_names"] = np.array(names, dtype=str)
+                arrays[f"{dims}_vectors"] = np.stack([embeddings[name].embedding for name in names])
+            tmp = path.with_suffix(".tmp")
+            with tmp.open("wb") as f:
+                np.savez(f, **arrays)
+            tmp.replace(path)
+        self.saved[guild_id] = {name: em.embedding for name, em in embeddings.items()}
+        return True
+
+    def forget(self, guild_id: int):
+        self.saved.pop(guild_id, None)
+        self.path(guild_id).unlink(missing_ok=True)
+
+
+class EmbeddingCache:
+    """
+    Recently requested embeddings keyed by a hash of the endpoint, model and text
+
+    Vectors are kept as float32 arrays and handed back as lists like the API returns them.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def key(endpoint: str, model: str, text: str) -> str:
+        return hashlib.sha1(f"{endpoint}\n{model}\n{text}".encode()).hexdigest()
+
+    def get(self, endpoint: str, model: str, text: str) -> Optional[List[float]]:
+        key = self.key(endpoint, model, text)
+        vector = self.entries.get(key)
+        if vector is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return vector.tolist()
+
+    def put(self, endpoint: str, model: str, text: str, vector: List[float]):
+        self.entries[self.key(endpoint, model, text)] = np.asarray(vector, dtype=np.float32)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
@@ -111,6 +111,7 @@ class AssistantFunctions(MixinMeta):
         conf.embeddings[memory_name].text = memory_text
         conf.embeddings[memory_name].embedding = embedding
         conf.embeddings[memory_name].update()
+        conf.index.touch(memory_name)
         asyncio.create_task(self.save_conf())
         return "Your memory has been updated!"
 
@@ -7,10 +7,14 @@ import discord
 import numpy as np
 import orjson
 from perftracker import perf
-from pydantic import VERSION, BaseModel, Field
+from pydantic import VERSION, BaseModel, Field, PrivateAttr
 from redbot.core.bot import Red
 
+from .embeddings import EmbeddingIndex
+
 log = logging.getLogger("red.vrt.assistant.models")
+# Embedding vectors can be numpy rows, which pydantic can't serialize when dumping a parent model
+VECTORS = {"configs": {"__all__": {"embeddings": {"__all__": {"embedding"}}}}}
 
 
 class ImageSize(Enum):
@@ -36,7 +40,7 @@ class AssistantBaseModel(BaseModel):
 
 class Embedding(AssistantBaseModel):
     text: str
-    embedding: List[float]
+    embedding: List[float] = []  # Kept in the guild's vector store file, a numpy row once loaded from there
     ai_created: bool = False
     created: datetime = Field(default_factory=lambda: datetime.now(tz=timezone.utc))
     modified: datetime = Field(default_factory=lambda: datetime.now(tz=timezone.utc))
@@ -52,6 +56,13 @@ class Embedding(AssistantBaseModel):
     def update(self):
         self.modified = datetime.now(tz=timezone.utc)
 
+    def model_dump(self, *args, **kwargs):
+        if not isinstance(self.embedding, np.ndarray):
+            return super().model_dump(*args, **kwargs)
+        dump = super().model_dump(*args, **{**kwargs, "exclude": {"embedding"}})
+        dump["embedding"] = self.embedding.tolist()
+        return dump
+
     def __str__(self) -> str:
         return self.text
 
@@ -84,6 +95,7 @@ class GuildSettings(AssistantBaseModel):
     tutors: List[int] = []  # Role or user IDs
     top_n: int = 3
     min_relatedness: float = 0.75
+    ann_probes: int = 0  # Clusters searched by the approximate index on large memory stores, 0 searches exactly
     embed_method: str = "dynamic"
     channel_id: Optional[int] = 0
     api_key: Optional[str] = None
@@ -122,6 +134,12 @@ class GuildSettings(AssistantBaseModel):
     max_function_calls: int = 10  # Max calls in a row
     disabled_functions: List[str] = []
 
+    _index: EmbeddingIndex = PrivateAttr(default_factory=EmbeddingIndex)
+
+    @property
+    def index(self) -> EmbeddingIndex:
+        return self._index
+
     @perf()
     def get_related_embeddings(
         self,
@@ -129,9 +147,6 @@ class GuildSettings(AssistantBaseModel):
         top_n_override: Optional[int] = None,
         relatedness_override: Optional[float] = None,
     ) -> List[Tuple[str, str, float, int]]:
-        def cosine_similarity(a, b):
-            return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-
         # Name, text, score, dimensions
         q_length = len(query_embedding)
         top_n = top_n_override or self.top_n
@@ -140,25 +155,9 @@ class GuildSettings(AssistantBaseModel):
         if not top_n or q_length == 0 or not self.embeddings:
             return []
 
-        strings_and_relatedness = []
-        for name, em in self.embeddings.items():
-            if q_length != len(em.embedding):
-                continue
-            try:
-                score = cosine_similarity(query_embedding, em.embedding)
-                if score >= min_relatedness:
-                    strings_and_relatedness.append((name, em.text, score, len(em.embedding)))
-            except ValueError as e:
-                log.error(
-                    f"Failed to compare '{name}' embedding {q_length} - {len(em.embedding)}",
-                    exc_info=e,
-                )
-
-        if not strings_and_relatedness:
-            return []
-
-        strings_and_relatedness.sort(key=lambda x: x[2], reverse=True)
-        return strings_and_relatedness[:top_n]
+        self._index.sync(self.embeddings)
+        related = self._index.query(query_embedding, top_n, min_relatedness, self.ann_probes)
+        return [(name, self.embeddings[name].text, score, q_length) for name, score in related]
 
     def update_usage(
         self,
@@ -322,6 +321,7 @@ class DB(AssistantBaseModel):
     persistent_conversations: bool = False
     functions: Dict[str, CustomFunction] = {}
     listen_to_bots: bool = False
+    float16_embeddings: bool = False  # Store embedding vectors at half precision
 
     endpoint_override: Optional[str] = None
 
@@ -329,6 +329,16 @@ class DB(AssistantBaseModel):
         gid = guild if isinstance(guild, int) else guild.id
         return self.configs.setdefault(gid, GuildSettings())
 
+    def dump_with_vectors(self) -> dict:
+        """JSON safe dump of everything including the embedding vectors"""
+        dump = self.model_dump(mode="json", exclude=VECTORS)
+        # JSON mode may turn guild ID keys into strings, both dicts keep the same order
+        for conf, conf_dump in zip(self.configs.values(), dump["configs"].values()):
+            for em, em_dump in zip(conf.embeddings.values(), conf_dump["embeddings"].values()):
+                vector = em.embedding
+                em_dump["embedding"] = vector.tolist() if isinstance(vector, np.ndarray) else list(vector)
+        return dump
+
     def get_conversation(
         self,
         member_id: int,
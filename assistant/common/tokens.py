@@ -0,0 +1,42 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenCache:
+    """
+    Token counts of individual messages and function schemas keyed by a hash of the tokenizer and content
+
+    The tokenizer is the model name for local encoding or the endpoint for an external one, so a model switch
+    never reuses another encoding's counts. Messages don't change once they are in a conversation, so after
+    the first count every later turn and every degrade pass only pays for hashing them.
+    """
+
+    def __init__(self, max_entries: int = 8192):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def key(tokenizer: str, item: dict) -> str:
+        dump = json.dumps(item, sort_keys=True, default=str)
+        return hashlib.sha1(f"{tokenizer}\n{dump}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[int]:
+        count = self.entries.get(key)
+        if count is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return count
+
+    def put(self, key: str, count: int):
+        self.entries[key] = count
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
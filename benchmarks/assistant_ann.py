@@ -0,0 +1,90 @@
+"""
+Recall and latency of Assistant's approximate embedding index against exact search
+
+Run from the repo root with Red installed:
+    python -m benchmarks.assistant_ann [rows] [dims]
+
+Embeddings are drawn around random topics so the data has clusters like a real knowledge base,
+queries are noisy copies of stored rows. Recall is the share of the exact top 10 the index also returns.
+Every query goes through EmbeddingIndex.sync and query the way a guild's lookups do, the last column
+times the same queries with a few entries edited and touched before each one.
+"""
+import sys
+import time
+
+import numpy as np
+
+from assistant.common.embeddings import EmbeddingIndex, assign, checksums, kmeans
+from assistant.common.models import Embedding
+
+TOP_N = 10
+QUERIES = 200
+TOPICS = 2000
+PROBES = [1, 2, 4, 8, 16, 32, 64, 128]
+EDITS = 5  # Entries edited between queries for the touched column
+
+
+def build_data(rows: int, dims: int, rng: np.random.Generator) -> np.ndarray:
+    topics = rng.normal(size=(TOPICS, dims)).astype(np.float32)
+    data = topics[rng.integers(0, TOPICS, rows)] + rng.normal(scale=0.6, size=(rows, dims)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def run(
+    index: EmbeddingIndex,
+    embeddings: dict,
+    queries: list,
+    probes: int,
+    edits: list = None,
+) -> tuple:
+    found = []
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        if edits:
+            name, vector = edits[i % len(edits)]
+            embeddings[name].embedding = vector
+            index.touch(name)
+        index.sync(embeddings)
+        found.append({name for name, __ in index.query(query, TOP_N, -1.0, probes)})
+    return found, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main(rows: int, dims: int):
+    rng = np.random.default_rng(0)
+    data = build_data(rows, dims, rng)
+    embeddings = {str(i): Embedding(text="", embedding=row.tolist()) for i, row in enumerate(data)}
+    index = EmbeddingIndex()
+    start = time.perf_counter()
+    index.sync(embeddings)
+    print(f"Synced {rows} rows of {dims} dimensions in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    clusters = int(np.clip(np.sqrt(rows), 16, 4096))
+    centroids = kmeans(data, clusters)
+    labels = assign(data, centroids)
+    dim_index = index.indexes[dims]
+    sums = dict(zip(dim_index.names, checksums(data).tolist()))
+    dim_index.install(centroids, dict(zip(dim_index.names, labels.tolist())), sums, rows)
+    print(f"Trained {clusters} clusters in {time.perf_counter() - start:.2f}s\n")
+
+    noise = rng.normal(scale=0.5 / np.sqrt(dims), size=(QUERIES, dims)).astype(np.float32)
+    queries = data[rng.integers(0, rows, QUERIES)] + noise
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = [q.tolist() for q in queries]
+    # Re-embedding an entry swaps in a new vector, reusing its old values keeps the results comparable
+    edits = [(name, list(embeddings[name].embedding)) for name in map(str, rng.integers(0, rows, EDITS))]
+
+    exact, exact_ms = run(index, embeddings, queries, 0)
+    __, touched_ms = run(index, embeddings, queries, 0, edits)
+    print(f"{'probes':>8} {'recall@10':>10} {'ms/query':>9} {'speedup':>8} {'touched':>8}")
+    print(f"{'exact':>8} {1.0:>10.3f} {exact_ms:>9.2f} {1.0:>7.1f}x {touched_ms:>8.2f}")
+    for probes in PROBES:
+        if probes >= clusters:
+            break
+        found, ms = run(index, embeddings, queries, probes)
+        __, touched_ms = run(index, embeddings, queries, probes, edits)
+        recall = np.mean([len(a & b) / len(a) for a, b in zip(exact, found)])
+        print(f"{probes:>8} {recall:>10.3f} {ms:>9.2f} {exact_ms / ms:>7.1f}x {touched_ms:>8.2f}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000, int(sys.argv[2]) if len(sys.argv) > 2 else 384)
@@ -0,0 +1,84 @@
+"""
+Messages per second through LevelUp's message handler
+
+Run from the repo root with Red installed:
+    python -m benchmarks.levelup_messages [messages]
+
+Run it on two commits to compare them, the guild is set up with ignore lists,
+role and channel bonuses and a minimum length so every check in the hot path is exercised.
+"""
+import asyncio
+import random
+import sys
+import time
+from copy import deepcopy
+from types import SimpleNamespace
+
+from levelup.common.constants import default_guild
+from levelup.levelup import LevelUp
+
+GUILD_ID = 1
+USERS = 2000
+ROLES = 40
+
+
+def build_cog() -> LevelUp:
+    conf = deepcopy(default_guild)
+    conf["ignoredchannels"] = [10_000 + i for i in range(25)]
+    conf["ignoredroles"] = [20_000 + i for i in range(25)]
+    conf["ignoredusers"] = [30_000 + i for i in range(25)]
+    conf["rolebonuses"]["msg"] = {str(500 + i): [1, 3] for i in range(0, ROLES, 8)}
+    conf["channelbonuses"]["msg"] = {str(100 + i): [1, 2] for i in range(5)}
+    conf["length"] = 10
+    conf["cooldown"] = 60
+
+    # Skip __init__, it needs a running bot
+    cog = LevelUp.__new__(LevelUp)
+    cog.data = {GUILD_ID: conf}
+    cog.lastmsg = {GUILD_ID: {}}
+    cog.ranks = {}
+    cog.settings = {}
+    cog.activity = {}
+    cog.dirty = {}
+    cog.unsaved = {}
+
+    async def check_levelups(*args, **kwargs):
+        return
+
+    cog.check_levelups = check_levelups
+    return cog
+
+
+def build_messages(count: int) -> list:
+    guild = SimpleNamespace(id=GUILD_ID)
+    roles = [SimpleNamespace(id=500 + i) for i in range(ROLES)]
+    members = [
+        SimpleNamespace(id=100_000 + i, roles=random.sample(roles, random.randint(1, 12)), bot=False)
+        for i in range(USERS)
+    ]
+    channels = [SimpleNamespace(id=100 + i, category=None, category_id=None) for i in range(20)]
+    contents = ["hi", "hello there <@!123456789012345678>", "a longer message that passes the length check"]
+    return [
+        SimpleNamespace(
+            guild=guild,
+            author=random.choice(members),
+            channel=random.choice(channels),
+            content=random.choice(contents),
+        )
+        for _ in range(count)
+    ]
+
+
+async def main(count: int):
+    random.seed(0)
+    cog = build_cog()
+    messages = build_messages(count)
+    start = time.perf_counter()
+    for message in messages:
+        await cog.message_handler(message)
+    elapsed = time.perf_counter() - start
+    print(f"{count} messages in {elapsed:.3f}s, {count / elapsed:,.0f} messages/sec")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000))
@@ -1,10 +1,18 @@
 from abc import ABC, ABCMeta, abstractmethod
 from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 
 from discord.ext.commands.cog import CogMeta
 from redbot.core.bot import Red
 from redbot.core.config import Config
 
+if TYPE_CHECKING:
+    from .common.backgrounds import BackgroundStore
+    from .common.renderer import RenderEngine
+    from .utils.assetfetch import AssetFetcher
+    from .utils.imagecache import ImageCache
+    from .utils.voiceindex import VoiceIndex
+
 
 class CompositeMetaClass(CogMeta, ABCMeta):
     """Type detection"""
@@ -21,10 +29,20 @@ class MixinMeta(ABC):
     data: dict
     cache_seconds: int
     render_gifs: bool
+    render_workers: int
+    render_timeout: int
+    renderer: "RenderEngine"
+    fetcher: "AssetFetcher"
     bgdata: dict
+    bg_store: "BackgroundStore"
     fdata: dict
     stars: dict
+    voice: "VoiceIndex"
+    settings: dict
     profiles: dict
+    profile_cache: "ImageCache"
+    ranks: dict
+    activity: dict
 
     @abstractmethod
     def generate_profile(
@@ -0,0 +1,147 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from PIL import Image, ImageChops, ImageDraw
+
+# Longer or busier avatars are trimmed/thinned to these
+MAX_FRAMES = 60
+MAX_DURATION = 6000  # Milliseconds
+# Browsers and Discord clamp shorter frame times, so there is no point keeping them apart
+MIN_FRAME_DURATION = 20
+DEFAULT_DURATION = 100
+WORKERS = min(4, os.cpu_count() or 1)
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+class AnimatedImage(NamedTuple):
+    """An animation that is already encoded, passed back from the generator in place of a PIL image"""
+
+    data: bytes
+    ext: str
+
+
+def get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="levelup_anim")
+    return _pool
+
+
+@lru_cache(maxsize=8)
+def circle_mask(size: int) -> Image.Image:
+    """Circular alpha mask, drawn at 4x and scaled down once for smooth edges"""
+    mask = Image.new("L", (size * 4, size * 4), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, size * 4, size * 4), fill=255)
+    return mask.resize((size, size), Image.Resampling.LANCZOS)
+
+
+def crop_circle(img: Image.Image) -> Image.Image:
+    """Cut a square RGBA image to a circle, keeping its own transparency"""
+    img.putalpha(ImageChops.multiply(img.getchannel("A"), circle_mask(img.width)))
+    return img
+
+
+def extract_frames(
+    img: Image.Image,
+    size: int,
+    max_frames: int = MAX_FRAMES,
+    max_duration: int = MAX_DURATION,
+) -> Tuple[List[Image.Image], List[int]]:
+    """
+    Decode an animation into resized RGBA frames and their durations
+
+    Consecutive identical frames are merged into one longer frame, decoding stops once `max_duration` is reached,
+    and if more than `max_frames` are left every nth frame is kept with the skipped frame times folded into it.
+    """
+    frames: List[Image.Image] = []
+    durations: List[int] = []
+    last_hash = None
+    elapsed = 0
+    for i in range(img.n_frames):
+        img.seek(i)
+        duration = max(int(img.info.get("duration") or DEFAULT_DURATION), MIN_FRAME_DURATION)
+        frame = img.convert("RGBA").resize((size, size), Image.Resampling.NEAREST)
+        digest = hashlib.blake2b(frame.tobytes(), digest_size=16).digest()
+        if digest == last_hash:
+            durations[-1] += duration
+        else:
+            frames.append(frame)
+            durations.append(duration)
+            last_hash = digest
+        elapsed += duration
+        if elapsed >= max_duration:
+            break
+
+    if len(frames) > max_frames:
+        step = -(-len(frames) // max_frames)
+        frames = frames[::step]
+        durations = [sum(durations[i : i + step]) for i in range(0, len(durations), step)]
+    return frames, durations
+
+
+def _composite(base: Image.Image, overlay: Image.Image, frames: Sequence[Image.Image], box: Tuple[int, int, int, int]):
+    """Composite avatar frames over the region of the card they cover"""
+    region = base.crop(box)
+    out = []
+    for frame in frames:
+        layer = region.copy()
+        layer.alpha_composite(crop_circle(frame.copy()))
+        layer.alpha_composite(overlay)
+        out.append(layer)
+    return out
+
+
+def _quantize(frames: Sequence[Image.Image], palette: Image.Image) -> List[Image.Image]:
+    return [frame.convert("RGB").quantize(palette=palette, dither=Image.Dither.NONE) for frame in frames]
+
+
+def render_animated(
+    base: Image.Image,
+    overlay: Image.Image,
+    frames: List[Image.Image],
+    durations: List[int],
+    position: Tuple[int, int],
+) -> AnimatedImage:
+    """
+    Put animated avatar frames on a finished card and encode it as a GIF
+
+    `base` is the card with every static layer on it, `overlay` is anything drawn over the avatar (status icon etc.)
+    cropped to the avatar's box. Only the avatar's box changes between frames, so that region is composited per frame
+    in parallel chunks and pasted onto copies of the card. Every frame shares one palette taken from the first frame.
+    """
+    size = frames[0].width
+    box = (position[0], position[1], position[0] + size, position[1] + size)
+    pool = get_pool()
+    chunk = max(1, -(-len(frames) // WORKERS))
+    chunks = [frames[i : i + chunk] for i in range(0, len(frames), chunk)]
+    regions = [r for part in pool.map(lambda c: _composite(base, overlay, c, box), chunks) for r in part]
+
+    buffer = BytesIO()
+    # One palette for the whole animation, the static card is quantized once and only avatar regions per frame
+    first = base.copy()
+    first.paste(regions[0], box[:2])
+    palette = first.convert("RGB").quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+    card = base.convert("RGB").quantize(palette=palette, dither=Image.Dither.NONE)
+    chunks = [regions[i : i + chunk] for i in range(0, len(regions), chunk)]
+    quantized = []
+    for region in [r for part in pool.map(lambda c: _quantize(c, palette), chunks) for r in part]:
+        frame = card.copy()
+        frame.paste(region, box[:2])
+        quantized.append(frame)
+    # Pillow crops each frame to what changed from the previous one, skip its slower transparency optimisation
+    quantized[0].save(
+        buffer,
+        format="GIF",
+        save_all=True,
+        append_images=quantized[1:],
+        duration=durations,
+        loop=0,
+        disposal=1,
+        optimize=False,
+    )
+    return AnimatedImage(buffer.getvalue(), "gif")
@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import os
+import random
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, UnidentifiedImageError
+
+log = logging.getLogger("red.vrt.levelup.backgrounds")
+
+# Card type: (aspect ratio, final size)
+CARD_SIZES: Dict[str, Tuple[Tuple[int, int], Tuple[int, int]]] = {
+    "profile": ((21, 9), (1050, 450)),
+    "slim": ((27, 7), (900, 240)),
+    "levelup": ((18, 6), (900, 300)),
+}
+
+
+def force_aspect_ratio(image: Image.Image, aspect_ratio: Tuple[int, int]) -> Image.Image:
+    """Center crop an image to the largest area matching the aspect ratio"""
+    x, y = aspect_ratio
+    w, h = image.size
+    counter = max(1, min(w // x, h // y))
+    nw, nh = counter * x, counter * y
+
+    x_split = int((w - nw) / 2)
+    y_split = int((h - nh) / 2)
+    box = (x_split, y_split, w - x_split, h - y_split)
+    return image.crop(box)
+
+
+def prepare_card(image: Image.Image, kind: str) -> Image.Image:
+    """Crop, convert and resize a background so it is ready to render a card on"""
+    aspect_ratio, size = CARD_SIZES[kind]
+    card = force_aspect_ratio(image, aspect_ratio).convert("RGBA")
+    return card.resize(size, Image.Resampling.NEAREST)
+
+
+class BackgroundStore:
+    """
+    Prepared backgrounds for each card type
+
+    Each background is cropped, converted to RGBA and resized once per card type, then kept as raw RGBA
+    files in the cache folder so every render process can load them without decoding or resizing.
+    A few recently used ones are also held in memory.
+    Entries are keyed by file modification time, so replaced or removed backgrounds are never served stale.
+    """
+
+    def __init__(self, folders: List[Path], cache_dir: Path, max_loaded: int = 24):
+        self.folders = folders
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(exist_ok=True)
+        self.max_loaded = max_loaded
+        self.loaded: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._files: List[Path] = []
+        self._folder_mtimes: Tuple[int, ...] = ()
+
+    def invalidate(self):
+        """Force a rescan of the background folders, used when backgrounds are added or removed"""
+        self._folder_mtimes = ()
+
+    def files(self) -> List[Path]:
+        """Available background files, only relisted when a folder changes"""
+        mtimes = tuple(folder.stat().st_mtime_ns for folder in self.folders)
+        if mtimes != self._folder_mtimes:
+            self._files = [
+                file
+                for folder in self.folders
+                for file in folder.iterdir()
+                if not file.is_dir() and file.suffix != ".py"
+            ]
+            self._folder_mtimes = mtimes
+            self.prune()
+        return self._files
+
+    def find(self, name: str) -> Optional[Path]:
+        for file in self.files():
+            if name.lower() in file.name.lower():
+                return file
+        return None
+
+    def key(self, path: Path, kind: str) -> str:
+        stamp = f"{path}:{path.stat().st_mtime_ns}:{kind}"
+        return hashlib.sha1(stamp.encode()).hexdigest()
+
+    def get(self, path: Path, kind: str) -> Image.Image:
+        """Get a prepared copy of a background for a card type"""
+        key = self.key(path, kind)
+        if key in self.loaded:
+            self.loaded.move_to_end(key)
+            return self.loaded[key].copy()
+
+        size = CARD_SIZES[kind][1]
+        raw = self.cache_dir / f"{key}.raw"
+        if raw.exists():
+            card = Image.frombytes("RGBA", size, raw.read_bytes())
+        else:
+            with Image.open(path) as img:
+                card = prepare_card(img, kind)
+            tmp = raw.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_bytes(card.tobytes())
+            os.replace(tmp, raw)
+
+        self.loaded[key] = card
+        while len(self.loaded) > self.max_loaded:
+            self.loaded.popitem(last=False)
+        return card.copy()
+
+    def random(self, kind: str) -> Image.Image:
+        available = self.files().copy()
+        random.shuffle(available)
+        for path in available:
+            try:
+                return self.get(path, kind)
+            except (UnidentifiedImageError, OSError):
+                pass
+        return Image.new("RGBA", CARD_SIZES[kind][1], (0, 0, 0, 0))
+
+    def warm(self):
+        """Prepare every background for every card type ahead of time"""
+        for path in self.files():
+            for kind in CARD_SIZES:
+                try:
+                    self.get(path, kind)
+                except (UnidentifiedImageError, OSError) as e:
+                    log.warning(f"Failed to prepare background {path.name}: {e}")
+                    break
+        log.info(f"Prepared {len(self._files)} backgrounds")
+
+    def prune(self):
+        """Delete prepared files for backgrounds that no longer exist or have changed"""
+        valid = set()
+        for path in self._files:
+            try:
+                valid.update(f"{self.key(path, kind)}.raw" for kind in CARD_SIZES)
+            except FileNotFoundError:
+                continue
+        for file in self.cache_dir.iterdir():
+            if file.suffix == ".raw" and file.name not in valid:
+                file.unlink(missing_ok=True)
@@ -8,7 +8,7 @@ from abc import ABC
 from io import BytesIO
 from pathlib import Path
 from time import perf_counter
-from typing import Optional, Union
+from typing import Optional, Tuple, Union
 
 import discord
 import validators
@@ -18,18 +18,22 @@ from redbot.core.data_manager import bundled_data_path, cog_data_path
 from redbot.core.i18n import Translator, cog_i18n
 from redbot.core.utils.chat_formatting import box, humanize_list, humanize_number
 
+from levelup.utils.activity import parse_window
 from levelup.utils.formatter import (
     get_attachments,
     get_bar,
     get_content_from_url,
     get_leaderboard,
     get_level,
+    get_stat_key,
     get_twemoji,
     get_user_position,
     get_xp,
     hex_to_rgb,
     time_formatter,
 )
+from levelup.utils.imagecache import render_key
+from levelup.utils.rankindex import RankIndex
 
 from ..abc import MixinMeta
 from .constants import default_guild
@@ -49,24 +53,31 @@ _ = Translator("LevelUp", __file__)
 
 @cog_i18n(_)
 class UserCommands(MixinMeta, ABC):
-    # Generate level up image
-    async def gen_levelup_img(self, params: dict):
-        task = asyncio.to_thread(self.generate_levelup, **params)
-        try:
-            img = await asyncio.wait_for(task, timeout=60)
-        except asyncio.TimeoutError:
-            return None
-        return img
-
-    # Generate profile image
-    async def gen_profile_img(self, params: dict, full: bool = True):
-        method = self.generate_profile if full else self.generate_slim_profile
-        task = asyncio.to_thread(method, **params)
-        try:
-            img = await asyncio.wait_for(task, timeout=60)
-        except asyncio.TimeoutError:
-            return None
-        return img
+    # Swap the image urls in render params for their content so renders never wait on the network
+    async def prefetch_assets(self, params: dict) -> dict:
+        params = params.copy()
+        fields = ["profile_image", "role_icon"]
+        if params.get("prestige"):
+            fields.append("emoji")
+        bg = params.get("bg_image")
+        if isinstance(bg, str) and bg.lower().startswith("http"):
+            fields.append("bg_image")
+        fetched = await self.fetcher.fetch_many(params.get(i) for i in fields)
+        for i in fields:
+            if params.get(i):
+                params[i] = fetched.get(str(params[i]))
+        return params
+
+    # Generate level up image, returns the encoded image bytes and file extension
+    async def gen_levelup_img(self, params: dict) -> Optional[Tuple[bytes, str]]:
+        params = await self.prefetch_assets(params)
+        return await self.renderer.render("generate_levelup", params)
+
+    # Generate profile image, returns the encoded image bytes and file extension
+    async def gen_profile_img(self, params: dict, full: bool = True) -> Optional[Tuple[bytes, str]]:
+        method = "generate_profile" if full else "generate_slim_profile"
+        params = await self.prefetch_assets(params)
+        return await self.renderer.render(method, params)
 
     # Function to test a given URL and see if it's valid
     async def valid_url(self, ctx: commands.Context, image_url: str):
@@ -133,29 +144,22 @@ class UserCommands(MixinMeta, ABC):
         now = datetime.datetime.now()
         if gid not in self.profiles:
             self.profiles[gid] = {}
-        if uid not in self.profiles[gid]:
-            self.profiles[gid][uid] = {"img": None, "ts": now}
 
-        cache = self.profiles[gid][uid]
-        td = (now - cache["ts"]).total_seconds()
-        if td > self.cache_seconds or not cache["img"]:
+        # Identical render inputs always reuse the cached image
+        key = render_key(args, full)
+        img = self.profile_cache.get(key)
+        # Otherwise reuse the member's last render if it is still within the cache time
+        last = self.profiles[gid].get(uid)
+        if img is None and last and (now - last["ts"]).total_seconds() <= self.cache_seconds:
+            img = self.profile_cache.get(last["key"])
+        if img is None:
             img = await self.gen_profile_img(args, full)
-            self.profiles[gid][uid] = {"img": img, "ts": now}
-        else:
-            img = self.profiles[gid][uid]["img"]
-
-        if not img:
-            return None
-        animated = getattr(img, "is_animated", False)
-        ext = "GIF" if animated else "WEBP"
-        buffer = BytesIO()
-        buffer.name = f"{user.id}.{ext.lower()}"
-        try:
-            img.save(buffer, save_all=True, format=ext)
-        except KeyError:
-            img.save(buffer, save_all=True, format="PNG")
-        buffer.seek(0)
-        return discord.File(buffer, filename=buffer.name)
+            if not img:
+                return None
+            self.profile_cache.put(key, img)
+            self.profiles[gid][uid] = {"key": key, "ts": now}
+        raw, ext = img
+        return discord.File(BytesIO(raw), filename=f"{user.id}.{ext}")
 
     # Hacky way to get user banner
     @cached(ttl=7200)
@@ -204,10 +208,9 @@ class UserCommands(MixinMeta, ABC):
         if user_id not in users:
             return await ctx.send(_("No data available for that user yet!"))
         self.data[guild_id]["users"][user_id]["stars"] += 1
-        if self.data[guild_id]["weekly"]["on"]:
-            if guild_id not in self.data[guild_id]["weekly"]["users"]:
-                self.init_user_weekly(guild_id, user_id)
-            self.data[guild_id]["weekly"]["users"][user_id]["stars"] += 1
+        self.get_activity(guild_id).add(user_id, stars=1)
+        self.mark_dirty(guild_id, user_id)
+        self.update_rank(guild_id, user_id)
 
         name = user.mention if mention else f"**{user.name}**"
         await ctx.send(_("You just gave a star to {}!").format(name))
@@ -229,7 +232,7 @@ class UserCommands(MixinMeta, ABC):
         if DPY2:
             pfp = user.display_avatar.url
         else:
-            pfp = user.avatar_url
+            pfp = str(user.avatar_url)
         args = {
             "bg_image": banner,
             "profile_image": pfp,
@@ -238,14 +241,10 @@ class UserCommands(MixinMeta, ABC):
             "font_name": font,
         }
         img = await self.gen_levelup_img(args)
-        temp = BytesIO()
-        temp.name = f"{ctx.author.id}.webp"
-        try:
-            img.save(temp, format="WEBP")
-        except KeyError:
-            img.save(temp, format="PNG")
-        temp.seek(0)
-        file = discord.File(temp)
+        if not img:
+            return await ctx.send(_("Failed to generate level up image"))
+        raw, ext = img
+        file = discord.File(BytesIO(raw), filename=f"{ctx.author.id}.{ext}")
         await ctx.send(file=file)
 
     @commands.group(name="myprofile", aliases=["mypf", "pfset"])
@@ -365,6 +364,7 @@ class UserCommands(MixinMeta, ABC):
                 filename = f"{preferred_filename}{ext}"
         filepath = cog_data_path(self) / "backgrounds" / filename
         filepath.write_bytes(bytes_file)
+        self.bg_store.invalidate()
         await ctx.send(_("Your custom background has been saved as ") + f"`{filename}`")
 
     @set_profile.command(name="rembackground")
@@ -382,6 +382,7 @@ class UserCommands(MixinMeta, ABC):
             file.unlink(missing_ok=True)
         except Exception as e:
             return await ctx.send(_("Could not delete file: ") + str(e))
+        self.bg_store.invalidate()
         await ctx.send(_("Background named {} has been removed!").format(f"`{file.name}`"))
 
     @set_profile.command(name="defaultfontpath")
@@ -790,9 +791,6 @@ class UserCommands(MixinMeta, ABC):
             return await ctx.send("Bots can't have profiles!")
 
         gid = ctx.guild.id
-        if gid not in self.data:
-            await self.initialize()
-
         # Main config stuff
         conf = self.data[gid]
         buttons = conf["emojis"]
@@ -824,7 +822,7 @@ class UserCommands(MixinMeta, ABC):
 
         p = users[user_id]
         full = p["full"]
-        pos = await get_user_position(conf, user_id)
+        pos = get_user_position(self.get_rank_index(gid), user_id)
         position = humanize_number(pos["p"])  # Int
         percentage = pos["pr"]  # Float
 
@@ -907,7 +905,7 @@ class UserCommands(MixinMeta, ABC):
 
                 args = {
                     "bg_image": bg_image,  # Background image link
-                    "profile_image": pfp,  # User profile picture link
+                    "profile_image": str(pfp),  # User profile picture link
                     "level": level,  # User current level
                     "prev_xp": xp_prev,  # Preveious levels cap
                     "user_xp": xp,  # User current xp
@@ -923,7 +921,7 @@ class UserCommands(MixinMeta, ABC):
                     "stars": stars,
                     "balance": bal if showbal else 0,
                     "currency": currency_name,
-                    "role_icon": role_icon,
+                    "role_icon": str(role_icon) if role_icon else None,
                     "font_name": font,
                     "render_gifs": self.render_gifs,
                     "blur": blur,
@@ -1014,6 +1012,8 @@ class UserCommands(MixinMeta, ABC):
         self.data[ctx.guild.id]["users"][user_id]["emoji"] = emoji
         self.data[ctx.guild.id]["users"][user_id]["level"] = newlevel
         self.data[ctx.guild.id]["users"][user_id]["xp"] = leftover_xp
+        self.mark_dirty(ctx.guild.id, user_id)
+        self.update_rank(ctx.guild.id, user_id)
         embed = discord.Embed(
             description=_("You have reached Prestige ") + f"{pending_prestige}!",
             color=ctx.author.color,
@@ -1080,35 +1080,28 @@ class UserCommands(MixinMeta, ABC):
             return await ctx.send(txt)
 
         if global_stats:
-            conf = {"users": {}, "weekly": {"users": {}}}
-            for data in self.data.values():
-                # Load user stats
-                for uid, stats in data["users"].items():
-                    if uid in conf["users"]:
-                        conf["users"][uid]["xp"] += stats["xp"]
-                        conf["users"][uid]["voice"] += stats["voice"]
-                        conf["users"][uid]["messages"] += stats["messages"]
-                    else:
-                        conf["users"][uid] = {
-                            "xp": stats["xp"],
-                            "voice": stats["voice"],
-                            "messages": stats["messages"],
-                        }
+            conf = {"users": await self.global_totals(), "weekly": {}}
         else:
             conf = self.data[ctx.guild.id]
 
+        key = get_stat_key(stat)
         async with ctx.typing():
-            embeds = await asyncio.to_thread(get_leaderboard, ctx, conf, stat, "normal", global_stats)
-        if isinstance(embeds, str):
-            return await ctx.send(embeds)
-        if not embeds:
+            if global_stats:
+                items = [(uid, stats[key]) for uid, stats in conf["users"].items()]
+                index = await asyncio.to_thread(RankIndex.build, items)
+            else:
+                index = self.get_rank_index(ctx.guild.id, key)
+            pages = get_leaderboard(ctx, conf, index, stat, "normal", global_stats)
+        if isinstance(pages, str):
+            return await ctx.send(pages)
+        if not pages:
             return await ctx.send(_("No user data yet!"))
 
-        if len(embeds) == 1:
-            embed = embeds[0]
+        if len(pages) == 1:
+            embed = pages[0]
             await ctx.send(embed=embed)
         else:
-            await menu(ctx, embeds, DEFAULT_CONTROLS)
+            await menu(ctx, pages, DEFAULT_CONTROLS)
 
     @commands.command(name="startop", aliases=["starlb"])
     @commands.guild_only()
@@ -1120,14 +1113,7 @@ class UserCommands(MixinMeta, ABC):
     ):
         """View the star leaderboard"""
         if global_stars:
-            conf = {"users": {}, "weekly": {"users": {}}}
-            for data in self.data.values():
-                # Load user stats
-                for uid, stats in data["users"].items():
-                    if uid in conf["users"]:
-                        conf["users"][uid]["stars"] += stats["stars"]
-                    else:
-                        conf["users"][uid] = {"stars": stats["stars"]}
+            conf = {"users": await self.global_totals(), "weekly": {}}
         else:
             conf = self.data[ctx.guild.id]
 
@@ -1224,36 +1210,62 @@ class UserCommands(MixinMeta, ABC):
         if not stat:
             stat = "exp"
         if global_stats:
-            conf = {"users": {}, "weekly": {"users": {}}}
-            for data in self.data.values():
-                # Load user stats
-                for uid, stats in data["users"].items():
-                    if uid in conf["users"]:
-                        conf["users"][uid]["xp"] += stats["xp"]
-                        conf["users"][uid]["voice"] += stats["voice"]
-                        conf["users"][uid]["messages"] += stats["messages"]
-                    else:
-                        conf["users"][uid] = {
-                            "xp": stats["xp"],
-                            "voice": stats["voice"],
-                            "messages": stats["messages"],
-                        }
+            conf = {"users": await self.global_totals(), "weekly": {}}
         else:
             conf = self.data[ctx.guild.id]
             if not conf["weekly"]["on"]:
                 return await ctx.send(_("Weekly stats are disabled for this guild"))
-            if not conf["weekly"]["users"]:
-                return await ctx.send(_("There is no data for the weekly leaderboard yet, please chat a bit first."))
+        weekly = {} if global_stats else self.get_weekly_stats(ctx.guild.id)
+        if not global_stats and not weekly:
+            return await ctx.send(_("There is no data for the weekly leaderboard yet, please chat a bit first."))
+
+        key = get_stat_key(stat)
+        items = [(uid, stats[key]) for uid, stats in weekly.items()]
+        index = await asyncio.to_thread(RankIndex.build, items)
+        pages = get_leaderboard(ctx, conf, index, stat, "weekly", global_stats)
+        if isinstance(pages, str):
+            return await ctx.send(pages)
+
+        if len(pages) == 1:
+            embed = pages[0]
+            await ctx.send(embed=embed)
+        else:
+            await menu(ctx, pages, DEFAULT_CONTROLS)
 
-        embeds = await asyncio.to_thread(get_leaderboard, ctx, conf, stat, "weekly", global_stats)
-        if isinstance(embeds, str):
-            return await ctx.send(embeds)
+    @commands.command(name="activetop", aliases=["recentlb"])
+    @commands.guild_only()
+    @commands.bot_has_permissions(embed_links=True)
+    async def window_lb(self, ctx: commands.Context, window: str = "24h", stat: Optional[str] = None):
+        """
+        View the leaderboard for a recent stretch of time
+
+        **Arguments**
+        `window`: How far back to look, like `24h`, `3d`, `2w` or `month` (up to 5 weeks)
+        `stat`: What kind of stat to display the leaderboard for
+        - Valid options are `exp`, `messages`, `stars`, and `voice`
 
-        if len(embeds) == 1:
-            embed = embeds[0]
+        Abbreviations of those arguments may also be used
+        """
+        hours = parse_window(window)
+        if not hours:
+            return await ctx.send(_("That isn't a valid window, try something like `24h`, `7d` or `2w`"))
+        activity = self.activity.get(ctx.guild.id)
+        if not activity:
+            return await ctx.send(_("There is no recent activity recorded yet, please chat a bit first."))
+
+        key = get_stat_key(stat or "exp")
+        index = await asyncio.to_thread(RankIndex.build, activity.leaderboard(hours, key))
+        pages = get_leaderboard(ctx, self.data[ctx.guild.id], index, key, "window", False, window)
+        if isinstance(pages, str):
+            return await ctx.send(pages)
+        if not activity.covers(hours):
+            await ctx.send(_("Activity has only been recorded since <t:{}:f>").format(activity.since * 3600))
+
+        if len(pages) == 1:
+            embed = pages[0]
             await ctx.send(embed=embed)
         else:
-            await menu(ctx, embeds, DEFAULT_CONTROLS)
+            await menu(ctx, pages, DEFAULT_CONTROLS)
 
     @commands.command(name="lastweekly")
     @commands.guild_only()
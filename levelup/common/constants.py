@@ -1,3 +1,6 @@
+# Guild data below this version is run through the cog's cleanup once when it's loaded
+SCHEMA_VERSION = "v3"
+
 default_guild = {
     "schema": "v1",
     "users": {},  # All user level data
@@ -39,7 +42,6 @@ default_guild = {
     "notify": False,  # Toggle whether to notify member of levelups if notify log channel is not set,
     "showbal": False,  # Show economy balance
     "weekly": {  # Weekly tracking
-        "users": {},  # Wiped weekly
         "on": False,  # Weekly stats are being tracked for this guild or not
         "autoreset": False,  # Whether to auto reset once a week or require manual reset
         "reset_hour": 0,  # 0 - 23 hour (UTC time)
@@ -68,5 +70,9 @@ default_guild = {
 default_global = {
     "ignored_guilds": [],
     "cache_seconds": 15,
+    "profile_cache_size": 64,  # Megabytes of rendered profile images to keep in memory
     "render_gifs": False,
+    "render_workers": 0,  # Processes to render profiles with, 0 renders in a thread
+    "render_timeout": 60,  # Seconds before a render is abandoned
+    "prerender": 0.0,  # Fraction of a level's XP left when level-up cards start rendering ahead of time, 0 disables
 }
@@ -3,7 +3,7 @@ This is a red-like recursive menu for dpy2
 """
 import asyncio
 import functools
-from typing import List, Union
+from typing import List, Sequence, Union
 
 import discord
 from discord import ButtonStyle, Interaction
@@ -88,7 +88,7 @@ class MenuView(View):
     def __init__(
         self,
         ctx: commands.Context,
-        pages: Union[List[str], List[discord.Embed]],
+        pages: Union[List[str], List[discord.Embed], Sequence[discord.Embed]],
         controls: dict,
         message: discord.Message = None,
         page: int = 0,
@@ -153,7 +153,7 @@ class MenuView(View):
 
 async def menu(
     ctx: commands.Context,
-    pages: Union[List[str], List[discord.Embed]],
+    pages: Union[List[str], List[discord.Embed], Sequence[discord.Embed]],
     controls: dict,
     message: discord.Message = None,
     page: int = 0,
@@ -197,8 +197,9 @@ async def menu(
         raise RuntimeError("Must provide at least 1 page.")
     if not isinstance(pages[0], (discord.Embed, str)):
         raise RuntimeError("Pages must be of type discord.Embed or str")
-    if not all(isinstance(x, discord.Embed) for x in pages) and not all(
-        isinstance(x, str) for x in pages
+    # Lazy page sources format pages on demand, so only check plain lists
+    if isinstance(pages, list) and (
+        not all(isinstance(x, discord.Embed) for x in pages) and not all(isinstance(x, str) for x in pages)
     ):
         raise RuntimeError("All pages must be of the same type")
     for key, value in controls.items():
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Tuple, Union
+
+from PIL import ImageFont
+
+FontKey = Tuple[str, int]
+
+
+class FontManager:
+    """
+    FreeType fonts by (path, size), the least recently used are dropped once more than `max_fonts` are loaded
+
+    Font files found in `file_bytes` are parsed from memory instead of disk.
+    Text fitting binary searches the size, so a long name costs a handful of font loads instead of one per point.
+    """
+
+    def __init__(self, file_bytes: Dict[str, bytes], max_fonts: int = 128):
+        self.file_bytes = file_bytes
+        self.max_fonts = max_fonts
+        self.fonts: "OrderedDict[FontKey, ImageFont.FreeTypeFont]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path: Union[Path, str], size: int) -> ImageFont.FreeTypeFont:
+        key = (str(path), size)
+        with self.lock:
+            if key in self.fonts:
+                self.fonts.move_to_end(key)
+                return self.fonts[key]
+        raw = self.file_bytes.get(key[0])
+        font = ImageFont.truetype(BytesIO(raw) if raw else key[0], size)
+        with self.lock:
+            self.fonts[key] = font
+            while len(self.fonts) > self.max_fonts:
+                self.fonts.popitem(last=False)
+        return font
+
+    def fit(
+        self,
+        path: Union[Path, str],
+        text: str,
+        max_width: float,
+        size: int,
+        min_size: int = 1,
+    ) -> ImageFont.FreeTypeFont:
+        """Largest font at or below `size` that renders `text` no wider than `max_width`, or `min_size` if none do"""
+        font = self.get(path, size)
+        if font.getlength(text) <= max_width:
+            return font
+        low, high = min_size, size - 1
+        best = self.get(path, min_size)
+        while low <= high:
+            mid = (low + high) // 2
+            font = self.get(path, mid)
+            if font.getlength(text) <= max_width:
+                best = font
+                low = mid + 1
+            else:
+                high = mid - 1
+        return best
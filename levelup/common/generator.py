@@ -5,9 +5,8 @@ from abc import ABC
 from io import BytesIO
 from math import ceil, sqrt
 from pathlib import Path
-from typing import List, Union
+from typing import Dict, List, Optional, Tuple, Union
 
-import colorgram
 import requests
 from perftracker import perf
 from PIL import Image, ImageDraw, ImageFilter, ImageFont, UnidentifiedImageError
@@ -17,6 +16,11 @@ from redbot.core.utils.chat_formatting import humanize_number
 
 from ..abc import MixinMeta
 from ..utils.core import Pilmoji
+from ..utils.palette import image_key, mean_color, palette
+from ..utils.source import LocalTwemojiSource, Twemoji, emoji_cache
+from .animation import AnimatedImage, crop_circle, extract_frames, render_animated
+from .backgrounds import BackgroundStore, force_aspect_ratio, prepare_card
+from .fonts import FontManager
 
 log = logging.getLogger("red.vrt.levelup.generator")
 _ = Translator("LevelUp", __file__)
@@ -25,10 +29,23 @@ ASPECT_RATIO = (21, 9)
 
 @cog_i18n(_)
 class Generator(MixinMeta, ABC):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, maindir: Optional[Path] = None, savedir: Optional[Path] = None, **kwargs):
         super().__init__(*args, **kwargs)
+        # Render workers pass their folders in, Red's data manager isn't set up in their processes
+        self.setup_assets(maindir or bundled_data_path(self), savedir or cog_data_path(self))
+
+        # Cleanup old files from conversion to webp
+        delete: List[Path] = []
+        for file in self.backgrounds.iterdir():
+            if file.name.endswith(".py") or file.is_dir():
+                continue
+            if not file.name.endswith(".webp"):
+                delete.append(file)
+        for i in delete:
+            i.unlink(missing_ok=True)
+
+    def setup_assets(self, maindir: Path, savedir: Path):
         # Included Assets
-        maindir = bundled_data_path(self)
         self.star = maindir / "star.png"
         self.default_pfp = maindir / "defaultpfp.png"
         self.status = {
@@ -43,21 +60,97 @@ class Generator(MixinMeta, ABC):
         self.backgrounds = maindir / "backgrounds"
 
         # Saved Assets
-        savedir = cog_data_path(self)
         self.saved_bgs = savedir / "backgrounds"
         self.saved_bgs.mkdir(exist_ok=True)
         self.saved_fonts = savedir / "fonts"
         self.saved_fonts.mkdir(exist_ok=True)
 
-        # Cleanup old files from conversion to webp
-        delete: List[Path] = []
-        for file in self.backgrounds.iterdir():
-            if file.name.endswith(".py") or file.is_dir():
-                continue
-            if not file.name.endswith(".webp"):
-                delete.append(file)
-        for i in delete:
-            i.unlink(missing_ok=True)
+        # Backgrounds prepared for each card size
+        self.bg_store = BackgroundStore([self.backgrounds, self.saved_bgs], savedir / "bgcache")
+
+        # Emojis in names are read from a Twemoji set dropped in the cog's data folder when there is one,
+        # anything missing from it comes from the CDN
+        # One source is shared by every render and its images land in a cache shared by all renderers
+        emoji_cache.configure(savedir / "emojicache")
+        twemoji = savedir / "twemoji"
+        if LocalTwemojiSource.has_assets(twemoji):
+            self.emoji_source = LocalTwemojiSource(twemoji, fallback=Twemoji())
+        else:
+            self.emoji_source = Twemoji()
+
+        # Preloaded asset caches, filled by preload_assets in render workers
+        self.assets: Dict[str, Image.Image] = {}
+        self.file_bytes: Dict[str, bytes] = {}
+        self.font_manager = FontManager(self.file_bytes)
+
+    def preload_assets(self):
+        """Decode the bundled icons and read fonts into memory so renders skip disk reads"""
+        for path in [self.star, self.default_pfp, *self.status.values()]:
+            with Image.open(path) as img:
+                self.assets[str(path)] = img.convert("RGBA")
+        for folder in (self.fonts, self.saved_fonts):
+            for file in folder.iterdir():
+                if file.is_dir() or file.suffix == ".py":
+                    continue
+                self.file_bytes[str(file)] = file.read_bytes()
+        self.file_bytes[self.font] = Path(self.font).read_bytes()
+
+    def get_card(self, bg_image: Union[str, bytes, None], kind: str) -> Image.Image:
+        """Get a background ready to render a card on, from a saved background name, a url, or at random"""
+        if isinstance(bg_image, bytes):
+            try:
+                return prepare_card(Image.open(BytesIO(bg_image)), kind)
+            except UnidentifiedImageError:
+                return self.bg_store.random(kind)
+        if bg_image and str(bg_image) != "random":
+            if not bg_image.lower().startswith("http"):
+                if path := self.bg_store.find(bg_image):
+                    try:
+                        return self.bg_store.get(path, kind)
+                    except OSError:
+                        log.info(f"Failed to load {bg_image}")
+            else:
+                bg_bytes = self.get_image_content_from_url(bg_image)
+                try:
+                    if bg_bytes:
+                        return prepare_card(Image.open(BytesIO(bg_bytes)), kind)
+                except UnidentifiedImageError:
+                    pass
+        return self.bg_store.random(kind)
+
+    def get_asset(self, path: Union[Path, str]) -> Image.Image:
+        img = self.assets.get(str(path))
+        if img is not None:
+            return img.copy()
+        return Image.open(path)
+
+    def open_file(self, path: Union[Path, str]) -> Image.Image:
+        if raw := self.file_bytes.get(str(path)):
+            return Image.open(BytesIO(raw))
+        return Image.open(path)
+
+    def get_font(self, path: Union[Path, str], size: int) -> ImageFont.FreeTypeFont:
+        return self.font_manager.get(path, size)
+
+    def fit_font(self, path: Union[Path, str], text: str, max_width: float, size: int) -> ImageFont.FreeTypeFont:
+        """Largest font at or below `size` that fits `text` within `max_width`"""
+        return self.font_manager.fit(path, text, max_width, size)
+
+    @staticmethod
+    def encode_image(img: Union[Image.Image, AnimatedImage]) -> Tuple[bytes, str]:
+        """Encode a rendered image, returning the raw bytes and the file extension to send it with"""
+        if isinstance(img, AnimatedImage):
+            return img.data, img.ext
+        animated = getattr(img, "is_animated", False)
+        ext = "GIF" if animated else "WEBP"
+        buffer = BytesIO()
+        try:
+            img.save(buffer, save_all=True, format=ext)
+        except KeyError:
+            buffer = BytesIO()
+            ext = "PNG"
+            img.save(buffer, save_all=True, format=ext)
+        return buffer.getvalue(), ext.lower()
 
     @perf(max_entries=1000)
     def generate_profile(
@@ -86,35 +179,14 @@ class Generator(MixinMeta, ABC):
     ):
         # get profile pic
         if profile_image:
-            pfp_image = self.get_image_content_from_url(str(profile_image))
+            pfp_image = self.get_image_content_from_url(profile_image)
             profile_bytes = BytesIO(pfp_image)
             profile = Image.open(profile_bytes)
         else:
-            profile = Image.open(self.default_pfp)
+            profile = self.get_asset(self.default_pfp)
         # Get background
-        available = list(self.backgrounds.iterdir()) + list(self.saved_bgs.iterdir())
-        card = None
-        if bg_image and str(bg_image) != "random":
-            if not bg_image.lower().startswith("http"):
-                for file in available:
-                    if bg_image.lower() in file.name.lower():
-                        try:
-                            card = Image.open(file)
-                            break
-                        except OSError:
-                            log.info(f"Failed to load {bg_image}")
-
-            if not card and bg_image.lower().startswith("http"):
-                try:
-                    bg_bytes = self.get_image_content_from_url(bg_image)
-                    card = Image.open(BytesIO(bg_bytes))
-                except UnidentifiedImageError:
-                    pass
-
-        if not card:
-            card = self.get_random_background()
-
-        card = self.force_aspect_ratio(card).convert("RGBA").resize((1050, 450), Image.Resampling.NEAREST)
+        card = self.get_card(bg_image, "profile")
+        card_key = image_key(card)
 
         # Colors
         # Sample colors from profile pic to use for default colors
@@ -168,8 +240,7 @@ class Generator(MixinMeta, ABC):
         # x1, y1, x2, y2
         # Sample name box colors and make sure they're not too similar with the background
         namebox = (bar_start, name_y, bar_start + 50, name_y + 100)
-        namesection = self.get_sample_section(card, namebox)
-        namebg = self.get_img_color(namesection)
+        namebg = self.get_img_color(card, namebox, card_key)
         namefill = default_fill
         while self.distance(namecolor, namebg) < namedistance:
             namecolor = self.rand_rgb()
@@ -182,8 +253,7 @@ class Generator(MixinMeta, ABC):
 
         # Sample stat box colors and make sure they're not too similar with the background
         statbox = (bar_start, stats_y, bar_start + 400, bar_top)
-        statsection = self.get_sample_section(card, statbox)
-        statbg = self.get_img_color(statsection)
+        statbg = self.get_img_color(card, statbox, card_key)
         statstxtfill = default_fill
         while self.distance(statcolor, statbg) < statdistance:
             statcolor = self.rand_rgb()
@@ -195,8 +265,7 @@ class Generator(MixinMeta, ABC):
             statstxtfill = self.inv_rgb(statstxtfill)
 
         lvlbox = (bar_start, bar_top, bar_end, bar_bottom)
-        lvlsection = self.get_sample_section(card, lvlbox)
-        lvlbg = self.get_img_color(lvlsection)
+        lvlbg = self.get_img_color(card, lvlbox, card_key)
         while self.distance(lvlbarcolor, lvlbg) < lvldistance:
             lvlbarcolor = self.rand_rgb()
             iters += 1
@@ -271,51 +340,35 @@ class Generator(MixinMeta, ABC):
                 base_font = fontfile
         # base_font = self.get_random_font()
         # Setup font sizes
-        name_size = 60
-        name_font = ImageFont.truetype(base_font, name_size)
-        while (name_font.getlength(user_name) + bar_start + 20) > 900:
-            name_size -= 1
-            name_font = ImageFont.truetype(base_font, name_size)
-            name_y += 0.1
-        name_y = round(name_y)
+        name_font = self.fit_font(base_font, user_name, 900 - bar_start - 20, 60)
+        name_size = name_font.size
+        # Smaller names sit a bit lower
+        name_y = round(name_y + (60 - name_size) * 0.1)
         nameht = name_font.getbbox(user_name)
         name_y = name_y - int(nameht[1] * 0.6)
 
-        emoji_scale = 1.2
         stats_size = 35
         stat_offset = stats_size + 5
-        stats_font = ImageFont.truetype(base_font, stats_size)
-        while (stats_font.getlength(leveltxt) + bar_start + 10) > bar_start + 210:
-            stats_size -= 1
-            emoji_scale += 0.1
-            stats_font = ImageFont.truetype(base_font, stats_size)
-        # Also check message box
-        while (stats_font.getlength(message_count) + bar_start + 220) > final.width - 10:
-            stats_size -= 1
-            emoji_scale += 0.1
-            stats_font = ImageFont.truetype(base_font, stats_size)
-        # And rank box
-        while (stats_font.getlength(rank) + bar_start + 10) > bar_start + 210:
-            stats_size -= 1
-            emoji_scale += 0.1
-            stats_font = ImageFont.truetype(base_font, stats_size)
+        # Level and rank boxes, and the message box
+        stats_size = min(
+            self.fit_font(base_font, leveltxt, 200, stats_size).size,
+            self.fit_font(base_font, rank, 200, stats_size).size,
+            self.fit_font(base_font, message_count, final.width - 10 - bar_start - 220, stats_size).size,
+        )
+        # Emojis scale up as the text shrinks
+        emoji_scale = 1.2 + (35 - stats_size) * 0.1
         # And exp text
-        while (stats_font.getlength(exp) + bar_start + 10) > final.width - 10:
-            stats_size -= 1
-            stats_font = ImageFont.truetype(base_font, stats_size)
+        stats_font = self.fit_font(base_font, exp, final.width - 10 - bar_start - 10, stats_size)
+        stats_size = stats_font.size
 
-        star_fontsize = 60
-        star_font = ImageFont.truetype(base_font, star_fontsize)
-        while (star_font.getlength(stars) + star_text_x) > final.width - 10:
-            star_fontsize -= 1
-            star_font = ImageFont.truetype(base_font, star_fontsize)
+        star_font = self.fit_font(base_font, stars, final.width - 10 - star_text_x, 60)
 
         # Get status and star image and paste to profile
         blank = Image.new("RGBA", card.size, (255, 255, 255, 0))
         status = self.status[user_status] if user_status in self.status else self.status["offline"]
-        status_img = Image.open(status)
+        status_img = self.get_asset(status)
         status = status_img.convert("RGBA").resize((60, 60), Image.Resampling.NEAREST)
-        star = Image.open(self.star).resize((50, 50), Image.Resampling.NEAREST)
+        star = self.get_asset(self.star).resize((50, 50), Image.Resampling.NEAREST)
         # Role icon
         role_bytes = self.get_image_content_from_url(role_icon) if role_icon else None
         if role_bytes:
@@ -343,7 +396,8 @@ class Generator(MixinMeta, ABC):
 
         # Add stats text
         # Render name and credits text through pilmoji in case there are emojis
-        with Pilmoji(final) as pilmoji:
+        with Pilmoji(final, source=self.emoji_source) as pilmoji:
+            pilmoji.prefetch(user_name, bal if balance else "")
             # Name text
             name_bbox = name_font.getbbox(user_name)
             name_emoji_y = name_bbox[3] - name_size
@@ -454,82 +508,19 @@ class Generator(MixinMeta, ABC):
         # If animated and render gifs enabled, render as a gif
         is_animated = getattr(profile, "is_animated", False)
         if is_animated and render_gifs:
-            duration = self.get_avg_duration(profile)
-            frames = []
-            for i in range(profile.n_frames):
-                profile.seek(i)
-                prof_img = profile.convert("RGBA").resize((300, 300), Image.Resampling.NEAREST)
-                # Mask to crop profile pic image to a circle
-                # draw at 4x size and resample down to 1x for a nice smooth circle
-                mask = Image.new("RGBA", ((card.size[0] * 4), (card.size[1] * 4)), 0)
-                mask_draw = ImageDraw.Draw(mask)
-                mask_draw.ellipse(
-                    [
-                        circle_x * 4,
-                        circle_y * 4,
-                        (300 + circle_x) * 4,
-                        (300 + circle_y) * 4,
-                    ],
-                    fill=(255, 255, 255, 255),
-                )
-                mask = mask.resize(card.size, Image.Resampling.NEAREST)
-                # make a new Image to set up card-sized image for pfp layer and the circle mask for it
-                profile_pic_holder = Image.new("RGBA", card.size, (255, 255, 255, 0))
-                # paste on square profile pic in appropriate spot
-                profile_pic_holder.paste(prof_img, (circle_x, circle_y))
-                # make a new Image at card size to crop pfp with transparency to the circle mask
-                pfp_composite_holder = Image.new("RGBA", card.size, (0, 0, 0, 0))
-                pfp_composite_holder = Image.composite(profile_pic_holder, pfp_composite_holder, mask)
-                # Profile image is on the background tile now
-                pre = Image.alpha_composite(final, pfp_composite_holder)
-                # Paste status over profile ring
-                blank = Image.new("RGBA", card.size, (255, 255, 255, 0))
-                blank.paste(status, (circle_x + 230, circle_y + 240))
-                pre = Image.alpha_composite(pre, blank)
-                frames.append(pre)
-
-            tmp = BytesIO()
-            frames[0].save(
-                tmp,
-                save_all=True,
-                append_images=frames[1:],
-                duration=duration,
-                format="GIF",
-                loop=0,
-                quality=25,
-            )
-            tmp.seek(0)
-            final = Image.open(tmp)
-
-        else:
-            profile = profile.convert("RGBA").resize((300, 300), Image.Resampling.NEAREST)
-            # Mask to crop profile pic image to a circle
-            # draw at 4x size and resample down to 1x for a nice smooth circle
-            mask = Image.new("RGBA", ((card.size[0] * 4), (card.size[1] * 4)), 0)
-            mask_draw = ImageDraw.Draw(mask)
-            mask_draw.ellipse(
-                [
-                    circle_x * 4,
-                    circle_y * 4,
-                    (300 + circle_x) * 4,
-                    (300 + circle_y) * 4,
-                ],
-                fill=(255, 255, 255, 255),
-            )
-            mask = mask.resize(card.size, Image.Resampling.NEAREST)
-            # make a new Image to set up card-sized image for pfp layer and the circle mask for it
-            profile_pic_holder = Image.new("RGBA", card.size, (255, 255, 255, 0))
-            # paste on square profile pic in appropriate spot
-            profile_pic_holder.paste(profile, (circle_x, circle_y))
-            # make a new Image at card size to crop pfp with transparency to the circle mask
-            pfp_composite_holder = Image.new("RGBA", card.size, (0, 0, 0, 0))
-            pfp_composite_holder = Image.composite(profile_pic_holder, pfp_composite_holder, mask)
-            # Profile image is on the background tile now
-            final = Image.alpha_composite(final, pfp_composite_holder)
-            # Paste status over profile ring
-            blank = Image.new("RGBA", card.size, (255, 255, 255, 0))
-            blank.paste(status, (circle_x + 230, circle_y + 240))
-            final = Image.alpha_composite(final, blank)
+            frames, durations = extract_frames(profile, 300)
+            # Status icon sits over the bottom right of the profile ring
+            overlay = Image.new("RGBA", (300, 300), (255, 255, 255, 0))
+            overlay.paste(status, (230, 240))
+            return render_animated(final, overlay, frames, durations, (circle_x, circle_y))
+
+        profile = profile.convert("RGBA").resize((300, 300), Image.Resampling.NEAREST)
+        # Crop the profile pic to a circle where it sits on the card
+        final.alpha_composite(crop_circle(profile), (circle_x, circle_y))
+        # Paste status over profile ring
+        blank = Image.new("RGBA", card.size, (255, 255, 255, 0))
+        blank.paste(status, (circle_x + 230, circle_y + 240))
+        final = Image.alpha_composite(final, blank)
 
         return final
 
@@ -585,34 +576,8 @@ class Generator(MixinMeta, ABC):
         outlinecolor = (0, 0, 0)
         text_bg = (0, 0, 0)
 
-        # Set canvas
-        aspect_ratio = (27, 7)
-
         # Get background
-        available = list(self.backgrounds.iterdir()) + list(self.saved_bgs.iterdir())
-        card = None
-        if bg_image and str(bg_image) != "random":
-            if not bg_image.lower().startswith("http"):
-                for file in available:
-                    if bg_image.lower() in file.name.lower():
-                        try:
-                            card = Image.open(file)
-                            break
-                        except OSError:
-                            log.info(f"Failed to load {bg_image}")
-
-            if not card and bg_image.lower().startswith("http"):
-                try:
-                    bg_bytes = self.get_image_content_from_url(bg_image)
-                    card = Image.open(BytesIO(bg_bytes))
-                except UnidentifiedImageError:
-                    pass
-
-        if not card:
-            card = self.get_random_background()
-
-        card = self.force_aspect_ratio(card, aspect_ratio)
-        card = card.convert("RGBA").resize((900, 240), Image.Resampling.NEAREST)
+        card = self.get_card(bg_image, "slim")
         try:
             bgcolor = self.get_img_color(card)
         except Exception as e:
@@ -687,22 +652,10 @@ class Generator(MixinMeta, ABC):
         namesize = 45
         statsize = 30
         starsize = 45
-        namefont = ImageFont.truetype(base_font, namesize)
-        statfont = ImageFont.truetype(base_font, statsize)
-        starfont = ImageFont.truetype(base_font, starsize)
-
-        while (namefont.getlength(name) + 260) > 770:
-            namesize -= 1
-            namefont = ImageFont.truetype(base_font, namesize)
-        while (statfont.getlength(messages) + 465) > 890:
-            statsize -= 1
-            statfont = ImageFont.truetype(base_font, statsize)
-        while (statfont.getlength(level) + 260) > 455:
-            statsize -= 1
-            statfont = ImageFont.truetype(base_font, statsize)
-        while (starfont.getlength(stars) + 825) > 890:
-            starsize -= 1
-            starfont = ImageFont.truetype(base_font, starsize)
+        namefont = self.fit_font(base_font, name, 770 - 260, namesize)
+        statsize = self.fit_font(base_font, messages, 890 - 465, statsize).size
+        statfont = self.fit_font(base_font, level, 455 - 260, statsize)
+        starfont = self.fit_font(base_font, stars, 890 - 825, starsize)
 
         # Stat text
         draw.text(
@@ -789,11 +742,11 @@ class Generator(MixinMeta, ABC):
 
         # get profile pic
         if profile_image:
-            pfp_image = self.get_image_content_from_url(str(profile_image))
+            pfp_image = self.get_image_content_from_url(profile_image)
             profile_bytes = BytesIO(pfp_image)
             profile = Image.open(profile_bytes)
         else:
-            profile = Image.open(self.default_pfp)
+            profile = self.get_asset(self.default_pfp)
 
         profile = profile.convert("RGBA").resize((180, 180), Image.Resampling.NEAREST)
 
@@ -820,9 +773,9 @@ class Generator(MixinMeta, ABC):
         pre = Image.alpha_composite(pre, progress_bar)
 
         status = self.status[user_status] if user_status in self.status else self.status["offline"]
-        status_img = Image.open(status)
+        status_img = self.get_asset(status)
         status = status_img.convert("RGBA").resize((40, 40), Image.Resampling.NEAREST)
-        rep_icon = Image.open(self.star)
+        rep_icon = self.get_asset(self.star)
         rep_icon = rep_icon.convert("RGBA").resize((40, 40), Image.Resampling.NEAREST)
 
         # Status badge
@@ -844,32 +797,10 @@ class Generator(MixinMeta, ABC):
         color: tuple = (0, 0, 0),
         font_name: str = None,
     ):
-        available = list(self.backgrounds.iterdir()) + list(self.saved_bgs.iterdir())
-        card = None
-        if bg_image and str(bg_image) != "random":
-            if not bg_image.lower().startswith("http"):
-                for file in available:
-                    if bg_image.lower() in file.name.lower():
-                        try:
-                            card = Image.open(file)
-                            break
-                        except OSError:
-                            log.info(f"Failed to load {bg_image}")
-
-            if not card and bg_image.lower().startswith("http"):
-                try:
-                    bg_bytes = self.get_image_content_from_url(bg_image)
-                    card = Image.open(BytesIO(bg_bytes))
-                except UnidentifiedImageError:
-                    pass
-
-        if not card:
-            card = self.get_random_background()
+        card = self.get_card(bg_image, "levelup")
 
         # Get coords and fonts setup
         card_size = (180, 60)
-        aspect_ratio = (18, 6)
-        card: Image = self.force_aspect_ratio(card, aspect_ratio).convert("RGBA")
         fillcolor = (0, 0, 0)
         txtcolor = color
 
@@ -882,10 +813,8 @@ class Generator(MixinMeta, ABC):
             if os.path.exists(fontfile):
                 base_font = fontfile
         # base_font = self.get_random_font()
-        font = ImageFont.truetype(base_font, fontsize)
-        while font.getlength(string) + int(card.height * 1.2) > card.width - (int(card.height * 1.2) - card.height):
-            fontsize -= 1
-            font = ImageFont.truetype(base_font, fontsize)
+        max_width = card.width - (int(card.height * 1.2) - card.height) - int(card.height * 1.2)
+        font = self.fit_font(base_font, string, max_width, fontsize)
 
         # Draw rounded rectangle at 4x size and scale down to crop card to
         mask = Image.new("RGBA", ((card.size[0]), (card.size[1])), 0)
@@ -902,12 +831,12 @@ class Generator(MixinMeta, ABC):
         final = Image.composite(card, composite_holder, mask)
 
         # Prep profile to paste
-        pfp_image = self.get_image_content_from_url(str(profile_image))
+        pfp_image = self.get_image_content_from_url(profile_image)
         if pfp_image:
             profile_bytes = BytesIO(pfp_image)
             profile = Image.open(profile_bytes)
         else:
-            profile = Image.open(self.default_pfp)
+            profile = self.get_asset(self.default_pfp)
         profile = profile.convert("RGBA").resize(pfpsize, Image.Resampling.LANCZOS)
 
         # Create mask for profile image crop
@@ -953,20 +882,16 @@ class Generator(MixinMeta, ABC):
         draw = ImageDraw.Draw(img)
         for index, i in enumerate(fonts):
             fontname = i.replace(".ttf", "")
-            font = ImageFont.truetype(os.path.join(self.fonts, i), fontsize)
+            font = self.get_font(os.path.join(self.fonts, i), fontsize)
             draw.text((5, index * (fontsize + 15)), fontname, color, font=font, stroke_width=1, stroke_fill=(0, 0, 0))
         return img
 
     @perf(max_entries=1000)
     def get_all_backgrounds(self):
-        available: List[Path] = list(self.saved_bgs.iterdir()) + list(self.backgrounds.iterdir())
         imgs = []
-        for file in available:
-            if file.is_dir() or file.suffix == ".py":
-                continue
+        for file in self.bg_store.files():
             try:
-                img = self.force_aspect_ratio(Image.open(file))
-                img = img.convert("RGBA").resize((1050, 450), Image.Resampling.NEAREST)
+                img = self.bg_store.get(file, "profile")
                 draw = ImageDraw.Draw(img)
                 ext_replace = [".png", ".jpg", ".jpeg", ".webp", ".gif"]
                 txt = file.name
@@ -1041,9 +966,12 @@ class Generator(MixinMeta, ABC):
 
     @staticmethod
     @perf(max_entries=1000)
-    def get_image_content_from_url(url: str) -> Union[bytes, None]:
+    def get_image_content_from_url(url: Union[str, bytes, None]) -> Union[bytes, None]:
         if url is None:
             return None
+        # Already fetched by the cog's asset fetcher
+        if isinstance(url, bytes):
+            return url
         if str(url) == "None":
             return None
         try:
@@ -1058,10 +986,13 @@ class Generator(MixinMeta, ABC):
 
     @staticmethod
     @perf(max_entries=1000)
-    def get_img_color(img: Union[Image.Image, str, bytes, BytesIO]) -> tuple:
+    def get_img_color(
+        img: Union[Image.Image, str, bytes, BytesIO], box: tuple = None, key: str = None
+    ) -> tuple:
         try:
-            colors = colorgram.extract(img, 1)
-            return colors[0].rgb
+            if not isinstance(img, Image.Image):
+                img = Image.open(BytesIO(img) if isinstance(img, bytes) else img)
+            return mean_color(img, box, key)
         except Exception as e:
             log.warning(f"Failed to get image color: {e}")
             return 0, 0, 0
@@ -1070,9 +1001,9 @@ class Generator(MixinMeta, ABC):
     @perf(max_entries=1000)
     def get_img_colors(img: Union[Image.Image, str, bytes, BytesIO], amount: int) -> list:
         try:
-            colors = colorgram.extract(img, amount)
-            extracted = [color.rgb for color in colors]
-            return extracted
+            if not isinstance(img, Image.Image):
+                img = Image.open(BytesIO(img) if isinstance(img, bytes) else img)
+            return palette(img, amount) or [(0, 0, 0)]
         except Exception as e:
             log.warning(f"Failed to extract image colors: {e}")
             extracted = [(0, 0, 0) for _ in range(amount)]
@@ -1113,38 +1044,7 @@ class Generator(MixinMeta, ABC):
     @staticmethod
     @perf(max_entries=1000)
     def force_aspect_ratio(image: Image.Image, aspect_ratio: tuple = ASPECT_RATIO) -> Image:
-        x, y = aspect_ratio
-        w, h = image.size
-
-        counter = 1
-        while True:
-            nw, nh = counter * x, counter * y
-            if (counter + 1) * x > w or (counter + 1) * y > h:
-                break
-            counter += 1
-
-        x_split = int((w - nw) / 2)
-        x1 = x_split
-        x2 = w - x_split
-
-        y_split = int((h - nh) / 2)
-        y1 = y_split
-        y2 = h - y_split
-
-        box = (x1, y1, x2, y2)
-        cropped = image.crop(box)
-        return cropped
-
-    @perf(max_entries=1000)
-    def get_random_background(self) -> Image:
-        available = list(self.backgrounds.iterdir()) + list(self.saved_bgs.iterdir())
-        random.shuffle(available)
-        for path in available:
-            try:
-                return Image.open(path)
-            except UnidentifiedImageError:
-                pass
-        return Image.new("RGBA", (2000, 1000), (0, 0, 0, 0))
+        return force_aspect_ratio(image, aspect_ratio)
 
     def get_random_font(self) -> str:
         available = list(self.fonts.iterdir()) + list(self.saved_fonts.iterdir())
@@ -1159,20 +1059,6 @@ class Generator(MixinMeta, ABC):
         else:
             return "unicode"
 
-    @staticmethod
-    @perf(max_entries=1000)
-    def get_avg_duration(image: Image) -> Union[int, None]:
-        """Get average duration sequence of gif frames"""
-        if not getattr(image, "is_animated"):
-            return None
-        times = []
-        for i in range(1, image.n_frames):
-            image.seek(i)
-            times.append(image.info["duration"])
-        if not times:
-            return None
-        return int(sum(times) / len(times))
-
     @staticmethod
     @perf(max_entries=1000)
     def get_durations(image: Image) -> Union[tuple, None]:
@@ -5,7 +5,7 @@
 import asyncio
 import contextlib
 import functools
-from typing import Iterable, List, Union
+from typing import Iterable, List, Sequence, Union
 
 import discord
 from redbot.core import commands
@@ -16,7 +16,7 @@ _ReactableEmoji = Union[str, discord.Emoji]
 
 async def menu(
     ctx: commands.Context,
-    pages: Union[List[str], List[discord.Embed]],
+    pages: Union[List[str], List[discord.Embed], Sequence[discord.Embed]],
     controls: dict,
     message: discord.Message = None,
     page: int = 0,
@@ -58,8 +58,9 @@ async def menu(
     """
     if not isinstance(pages[0], (discord.Embed, str)):
         raise RuntimeError("Pages must be of type discord.Embed or str")
-    if not all(isinstance(x, discord.Embed) for x in pages) and not all(
-        isinstance(x, str) for x in pages
+    # Lazy page sources format pages on demand, so only check plain lists
+    if isinstance(pages, list) and (
+        not all(isinstance(x, discord.Embed) for x in pages) and not all(isinstance(x, str) for x in pages)
     ):
         raise RuntimeError("All pages must be of the same type")
     for key, value in controls.items():
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Optional, Set, Tuple
+
+from .generator import Generator
+
+log = logging.getLogger("red.vrt.levelup.renderer")
+
+# Generator instance owned by each pool worker process
+_worker: Optional["RenderWorker"] = None
+# Rendered once whenever the pool starts, workers import the cog by package name so this proves they can
+SMOKE_RENDER = ("generate_levelup", {"bg_image": None, "profile_image": None, "level": 1, "color": (255, 255, 255)})
+
+
+class RenderWorker(Generator):
+    """Standalone generator used inside pool workers, assets are loaded once when the worker starts"""
+
+    def __init__(self, maindir: str, savedir: str):
+        super().__init__(maindir=Path(maindir), savedir=Path(savedir))
+        self.preload_assets()
+
+
+def init_worker(maindir: str, savedir: str):
+    global _worker
+    _worker = RenderWorker(maindir, savedir)
+
+
+def render_job(method: str, params: dict) -> Optional[Tuple[bytes, str]]:
+    img = getattr(_worker, method)(**params)
+    if img is None:
+        return None
+    return _worker.encode_image(img)
+
+
+class RenderEngine:
+    """
+    Renders profile and level-up images in a process pool
+
+    Jobs are the name of a Generator method plus its keyword arguments, which must be plain picklable values.
+    Results come back as encoded image bytes and their file extension.
+    If no workers are configured, or the workers fail a test render when the pool starts,
+    jobs run in a thread using the fallback generator instead.
+
+    A timed out job keeps its worker busy until it finishes, so once timed out jobs hold half the workers
+    the pool is replaced and their processes are ended.
+    """
+
+    def __init__(self, fallback: Generator, maindir: Path, savedir: Path, workers: int = 0, timeout: int = 60):
+        self.fallback = fallback
+        self.maindir = str(maindir)
+        self.savedir = str(savedir)
+        self.workers = workers
+        self.timeout = timeout
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.stalled: Set[Future] = set()  # Timed out jobs still running in the current pool
+        self.smoke_task: Optional[asyncio.Task] = None
+        self.busy = 0  # Renders in flight, background renders wait for this to drop to zero
+
+    def start(self):
+        self.shutdown()
+        if self.workers < 1:
+            return
+        self.stalled = set()
+        # Workers start from a fresh interpreter, forking the bot would copy its event loop, threads and held locks
+        context = multiprocessing.get_context("spawn")
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(self.maindir, self.savedir),
+        )
+        # Spin the workers up now so the first renders don't pay for the asset preload
+        for __ in range(self.workers):
+            self.pool.submit(int)
+        log.info(f"Render pool started with {self.workers} workers")
+
+    def shutdown(self, kill: bool = False):
+        if self.pool is None:
+            return
+        pool, self.pool = self.pool, None
+        # Shutting down doesn't stop jobs that are already running, stuck ones have to be ended with their process
+        processes = list((getattr(pool, "_processes", None) or {}).values()) if kill else []
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def configure(self, workers: int, timeout: int):
+        self.timeout = timeout
+        if workers != self.workers or (workers and self.pool is None):
+            self.workers = workers
+            self.start()
+            if self.pool is not None:
+                self.smoke_task = asyncio.create_task(self.smoke_test())
+
+    async def smoke_test(self):
+        """Render a card in the pool, falling back to rendering in a thread if the workers can't"""
+        pool = self.pool
+        method, params = SMOKE_RENDER
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(pool.submit(render_job, method, params)), 60)
+            if result is None:
+                raise ValueError("Test render returned nothing")
+        except Exception as e:
+            if pool is not self.pool:
+                return
+            log.error("Render workers failed a test render, rendering in a thread instead", exc_info=e)
+            self.shutdown(kill=True)
+
+    def stall(self, job: Future):
+        """Track a timed out job, replacing the pool once timed out jobs hold half of its workers"""
+        if job.done():
+            return
+        stalled = self.stalled
+        stalled.add(job)
+        job.add_done_callback(stalled.discard)
+        if len(stalled) * 2 >= self.workers:
+            log.warning(f"{len(stalled)} timed out renders are holding up the render pool, restarting it")
+            self.shutdown(kill=True)
+            self.start()
+
+    async def render(self, method: str, params: dict) -> Optional[Tuple[bytes, str]]:
+        pool = self.pool
+        job = None
+        if pool is None:
+            task = asyncio.to_thread(self._render_local, getattr(self.fallback, method), params)
+        else:
+            job = pool.submit(render_job, method, params)
+            task = asyncio.wrap_future(job)
+        self.busy += 1
+        try:
+            return await asyncio.wait_for(task, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            log.warning(f"{method} took longer than {self.timeout}s to render")
+            if job is not None and pool is self.pool:
+                self.stall(job)
+        except BrokenProcessPool:
+            # Jobs of a pool that was already replaced fail this way too
+            if pool is self.pool:
+                log.error("Render pool broke, restarting it")
+                self.start()
+        except Exception as e:
+            log.error(f"Failed to render {method}", exc_info=e)
+        finally:
+            self.busy -= 1
+        return None
+
+    def _render_local(self, func: Callable, params: dict) -> Optional[Tuple[bytes, str]]:
+        img = func(**params)
+        if img is None:
+            return None
+        return self.fallback.encode_image(img)
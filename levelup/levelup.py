@@ -2,25 +2,23 @@ import asyncio
 import contextlib
 import json
 import logging
-import math
+import os
 import random
-import re
 import sys
-from datetime import datetime
+from datetime import datetime, timezone
 from io import BytesIO
 from time import monotonic, perf_counter
 from typing import Dict, List, Optional, Set, Tuple, Union
 
 import discord
+import numpy as np
 import plotly.graph_objects as go
-from aiohttp import ClientSession, ClientTimeout
 from discord.ext import tasks
 from perftracker import get_stats, perf
 from redbot.core import Config, VersionInfo, commands, version_info
 from redbot.core.bot import Red
-from redbot.core.data_manager import cog_data_path
+from redbot.core.data_manager import bundled_data_path, cog_data_path
 from redbot.core.i18n import Translator, cog_i18n
-from redbot.core.utils import AsyncIter
 from redbot.core.utils.chat_formatting import (
     box,
     humanize_list,
@@ -28,29 +26,42 @@ from redbot.core.utils.chat_formatting import (
     humanize_timedelta,
 )
 from redbot.core.utils.predicates import MessagePredicate
-from tenacity import (
-    retry,
-    retry_if_exception_type,
-    stop_after_attempt,
-    wait_random_exponential,
-)
 
+from levelup.utils.activity import ActivityLog, hours_since
+from levelup.utils.assetfetch import AssetFetcher
+from levelup.utils.compiled import MENTION_EMOJI_REGEX, GuildSettings, compile_settings
 from levelup.utils.formatter import (
     get_attachments,
     get_content_from_url,
+    get_effective_xp,
     get_level,
     get_next_reset,
     get_twemoji,
     get_xp,
     hex_to_rgb,
     time_formatter,
-    time_to_level,
 )
+from levelup.utils.imagecache import ImageCache, render_key
+from levelup.utils.importer import (
+    AmariSource,
+    ImportFailed,
+    ImportResult,
+    ImportSource,
+    LeaderboardImporter,
+    MEE6Source,
+    PolarisSource,
+)
+from levelup.utils.journal import XPJournal
+from levelup.utils.levelcurve import get_curve, time_to_levels
+from levelup.utils.rankindex import RankIndex
+from levelup.utils.rolesync import RoleSyncQueue
+from levelup.utils.voiceindex import VoiceIndex
 
 from .abc import CompositeMetaClass
 from .common import constants
 from .common.base import UserCommands
 from .common.generator import Generator
+from .common.renderer import RenderEngine
 
 log = logging.getLogger("red.vrt.levelup")
 _ = Translator("LevelUp", __file__)
@@ -96,9 +107,11 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
 
     async def red_delete_data_for_user(self, *, requester, user_id: int):
         deleted = False
+        await self.load_guilds(self.bot.guilds)
         for gid in self.data.copy().keys():
             if str(user_id) in self.data[gid]["users"]:
                 del self.data[gid]["users"][user_id]
+                self.reset_ranks(gid)
                 deleted = True
         if deleted:
             await self.save_cache()
@@ -117,6 +130,14 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         self.ignored_guilds = []
         self.cache_seconds = 15
         self.render_gifs = False
+        self.render_workers = 0
+        self.render_timeout = 60
+        self.prerender = 0.0
+
+        # Profile and level-up image rendering, runs in a process pool when workers are configured
+        self.renderer = RenderEngine(self, bundled_data_path(self), cog_data_path(self))
+        # Avatars, banners and role icons are fetched ahead of renders and cached on disk
+        self.fetcher = AssetFetcher(cog_data_path(self) / "assetcache")
 
         # Keep background compilation cached
         self.bgdata = {"img": None, "names": []}
@@ -125,10 +146,37 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
 
         # Guild IDs as strings, user IDs as strings
         self.lastmsg = {}  # Last sent message for users
-        self.voice = {}  # Voice channel info
+        self.voice = VoiceIndex()  # Members currently in voice
         self.stars = {}  # Keep track of star cooldowns
         self.first_run = True
-        self.profiles = {}
+        # Guild data is loaded on first use, or by initialize in the background, one load per guild at a time
+        self.guild_locks: Dict[int, asyncio.Lock] = {}
+        self.journal_backlog: Dict[int, Dict[str, dict]] = {}  # Journaled changes of guilds not loaded yet
+        self.ready = asyncio.Event()  # Set once global settings and the journal backlog are in, guilds wait on it
+        self.init_error: Optional[Exception] = None  # Why initialize failed before the journal backlog was in
+        self.load_times: Dict[str, float] = {}  # Seconds spent on each startup step
+        self.startup_report = ""
+        # Stat changes are journaled every few seconds and folded into config by the cache dumper
+        self.journal = XPJournal(cog_data_path(self) / "journal.jsonl")
+        self.journal_lock = asyncio.Lock()
+        self.dirty: Dict[int, Set[str]] = {}  # Changed since the last journal flush
+        self.unsaved: Dict[int, Set[str]] = {}  # Journaled but not in config yet
+        # Compiled settings checked on every message, dropped whenever a command runs in the guild
+        self.settings: Dict[int, GuildSettings] = {}
+        self.profiles = {}  # Key of the last profile rendered for each member
+        # Level role changes are queued and applied in the background, one role edit per member
+        self.role_sync = RoleSyncQueue(_("Level roles"))
+        self.profile_cache = ImageCache(constants.default_global["profile_cache_size"] * 1024**2)
+        # Level-up cards rendered ahead of time for members close to their next level
+        self.levelup_cache = ImageCache(16 * 1024**2)
+        self.prerendered: Dict[int, Dict[str, Tuple[tuple, Optional[str]]]] = {}  # Render inputs and cache key
+        self.prerender_queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+        self.prerender_task: Optional[asyncio.Task] = None
+
+        # Sorted stat leaderboards for rank lookups (Guild ID keys are ints, then stat name keys)
+        self.ranks: Dict[int, Dict[str, RankIndex]] = {}
+        # Hourly activity buckets for rolling window and weekly leaderboards (Guild ID keys are ints)
+        self.activity: Dict[int, ActivityLog] = {}
 
         # For importing user levels from Fixator's Leveler cog
         self._db_ready = False
@@ -150,13 +198,20 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
 
         # Loopies
         self.cache_dumper.start()
+        self.journal_writer.start()
         self.voice_checker.start()
         self.weekly_checker.start()
 
     def cog_unload(self):
         self.cache_dumper.cancel()
+        self.journal_writer.cancel()
         self.voice_checker.cancel()
         self.weekly_checker.cancel()
+        self.role_sync.stop()
+        if self.prerender_task is not None:
+            self.prerender_task.cancel()
+        self.renderer.shutdown()
+        asyncio.create_task(self.fetcher.close())
         asyncio.create_task(self.save_cache())
 
     @staticmethod
@@ -169,14 +224,55 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
 
     @commands.Cog.listener()
     async def on_guild_join(self, new_guild: discord.Guild):
-        if new_guild.id not in self.data:
-            await self.initialize()
+        await self.load_guild(new_guild)
 
     @commands.Cog.listener()
     async def on_guild_remove(self, old_guild: discord.Guild):
         if old_guild.id in self.data:
             await self.save_cache(old_guild)
             del self.data[old_guild.id]
+            self.reset_ranks(old_guild.id)
+            self.voice.clear(old_guild.id)
+            self.settings.pop(old_guild.id, None)
+            self.activity.pop(old_guild.id, None)
+            self.prerendered.pop(old_guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(
+        self,
+        member: discord.Member,
+        before: discord.VoiceState,
+        after: discord.VoiceState,
+    ):
+        if member.bot:
+            return
+        guild = member.guild
+        gid = guild.id
+        if gid not in self.data:
+            return
+        now = datetime.now()
+        before_id = before.channel.id if before.channel else None
+        after_id = after.channel.id if after.channel else None
+        if before_id == after_id:
+            # Mute, deafen or stream toggled, settle the time spent in the old state first
+            self.accrue_voice(guild, member.id, now)
+            self.voice.update(gid, member.id, after)
+            return
+
+        # The human count of both channels changes, so settle everyone in them under the old count
+        affected = {member.id}
+        if before_id:
+            affected.update(self.voice.members(gid, before_id))
+        if after_id:
+            affected.update(self.voice.members(gid, after_id))
+        for member_id in affected:
+            self.accrue_voice(guild, member_id, now)
+
+        had_session = self.voice.leave(gid, member.id) is not None
+        if after_id:
+            self.voice.join(gid, member.id, after, now)
+        if had_session and str(gid) not in self.ignored_guilds:
+            await self.check_levelups(gid, str(member.id), channel_obj=before.channel)
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
@@ -221,7 +317,7 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         receiver = msg.author
 
         if guild.id not in self.data:
-            await self.initialize()
+            await self.load_guild(guild)
 
         can_give = False
         if giver_id not in self.stars[gid]:
@@ -244,11 +340,9 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             return
 
         self.data[gid]["users"][uid]["stars"] += 1
-        if self.data[gid]["weekly"]["on"]:
-            weekly_users = self.data[gid]["weekly"]["users"]
-            if uid not in weekly_users:
-                self.init_user_weekly(gid, uid)
-            self.data[gid]["weekly"]["users"][uid]["stars"] += 1
+        self.get_activity(gid).add(uid, stars=1)
+        self.mark_dirty(gid, uid)
+        self.update_rank(gid, uid)
 
         if not self.data[gid]["starmention"]:
             return
@@ -295,41 +389,163 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             return
         gid = message.guild.id
         if gid not in self.data:
-            await self.initialize()
-        if message.author.id in self.data[gid]["ignoredusers"]:
+            await self.load_guild(message.guild)
+        settings = self.get_settings(gid)
+        if message.author.id in settings.ignored_users:
             return
-        if message.channel.id in self.data[gid]["ignoredchannels"]:
+        if message.channel.id in settings.ignored_channels:
             return
         await self.message_handler(message)
 
+    def get_settings(self, guild_id: int) -> GuildSettings:
+        """Compiled view of a guild's settings, rebuilt after any command in the guild changes them"""
+        settings = self.settings.get(guild_id)
+        if settings is None:
+            settings = compile_settings(self.data[guild_id])
+            self.settings[guild_id] = settings
+        return settings
+
+    async def cog_before_invoke(self, ctx: commands.Context):
+        # Guilds load in the background on startup, commands can't wait for their turn
+        if ctx.guild:
+            await self.load_guild(ctx.guild)
+
+    async def cog_after_invoke(self, ctx: commands.Context):
+        if ctx.guild:
+            self.settings.pop(ctx.guild.id, None)
+            # Profile commands edit the author's own data without saving
+            if ctx.guild.id in self.data and str(ctx.author.id) in self.data[ctx.guild.id]["users"]:
+                self.mark_dirty(ctx.guild.id, str(ctx.author.id))
+
     @perf()
     async def initialize(self):
-        self.ignored_guilds = await self.config.ignored_guilds()
-        self.cache_seconds = await self.config.cache_seconds()
-        self.render_gifs = await self.config.render_gifs()
-        allclean = []
-        for guild in self.bot.guilds:
-            gid = guild.id
-            if gid in self.data:  # Already in cache
-                continue
+        if self.init_error is not None:
+            # An earlier attempt failed before the journal was in, start over
+            self.init_error = None
+            self.ready.clear()
+        start = perf_counter()
+        try:
+            self.ignored_guilds = await self.config.ignored_guilds()
+            self.cache_seconds = await self.config.cache_seconds()
+            self.profile_cache.resize(await self.config.profile_cache_size() * 1024**2)
+            self.render_gifs = await self.config.render_gifs()
+            self.render_workers = await self.config.render_workers()
+            self.render_timeout = await self.config.render_timeout()
+            self.prerender = await self.config.prerender()
+            self.renderer.configure(self.render_workers, self.render_timeout)
+            if not self.first_run or self.ready.is_set():
+                # The journal was already replayed, by an earlier run or one still loading guilds
+                return await self.load_guilds(self.bot.guilds)
+
+            self.load_times = {"settings": perf_counter() - start}
+            step = perf_counter()
+            records = await asyncio.to_thread(self.journal.replay)
+            if self.ready.is_set():
+                # Another initialize got through the replay first
+                return await self.load_guilds(self.bot.guilds)
+            for (gid, uid), record in records.items():
+                self.journal_backlog.setdefault(gid, {})[uid] = record
+            self.load_times["journal"] = perf_counter() - step
+        except Exception as e:
+            self.init_error = e
+            log.error("Failed to initialize, guilds won't load until the cog is reloaded", exc_info=e)
+            raise
+        finally:
+            # Guilds waiting on this load, or fail on init_error, instead of waiting forever
+            self.ready.set()
+        # Guilds that see activity while this runs load themselves ahead of their turn
+        step = perf_counter()
+        await self.load_guilds(self.bot.guilds)
+        self.load_times["guilds"] = perf_counter() - step
+        if records:
+            log.info(f"Replayed {len(records)} journaled user changes")
+        self.journal_backlog.clear()  # Left over from guilds the bot is no longer in
+        asyncio.create_task(asyncio.to_thread(self.bg_store.warm))
+        self.first_run = False
+
+        total = perf_counter() - start
+        steps = ", ".join(f"{k} {round(v, 2)}s" for k, v in self.load_times.items())
+        self.startup_report = _("{} guilds loaded in {}s ({})").format(len(self.data), round(total, 2), steps)
+        log.info(f"Config initialized: {self.startup_report}")
+
+    async def load_guilds(self, guilds: List[discord.Guild], concurrency: int = 16):
+        """Load several guilds at once, each guild still only loads once"""
+        sem = asyncio.Semaphore(concurrency)
+
+        async def load(guild: discord.Guild):
+            async with sem:
+                try:
+                    await self.load_guild(guild)
+                except Exception as e:
+                    log.error(f"Failed to load {guild.name}", exc_info=e)
+
+        await asyncio.gather(*(load(guild) for guild in guilds if guild.id not in self.data))
+
+    async def load_guild(self, guild: discord.Guild):
+        """
+        Load a guild's data into the cache if it isn't there yet
+
+        Guild data from before the current schema version is cleaned up and saved back once.
+        Changes journaled for the guild before a restart are applied on top.
+        """
+        gid = guild.id
+        if gid in self.data:
+            return
+        lock = self.guild_locks.setdefault(gid, asyncio.Lock())
+        async with lock:
+            await self.ready.wait()
+            if self.init_error is not None:
+                raise RuntimeError("LevelUp failed to initialize") from self.init_error
+            if gid in self.data:
+                return
+            step = perf_counter()
             data = await self.config.guild(guild).all()
-            cleaned, newdata = self.cleanup(data.copy())
-            if cleaned:
-                data = newdata
-                for i in cleaned:
-                    if i not in allclean:
-                        allclean.append(i)
-                log.info(f"Cleaned up {guild.name} config")
+            self.add_load_time("config", step)
+
+            migrated = data["schema"] != constants.SCHEMA_VERSION
+            weekly_users = data["weekly"].get("users")
+            if migrated:
+                step = perf_counter()
+                cleaned, data = self.cleanup(data.copy())
+                data["schema"] = constants.SCHEMA_VERSION
+                if cleaned:
+                    log.info(f"Cleaned up {guild.name} config: {humanize_list(sorted(set(cleaned)))}")
+                self.add_load_time("migrations", step)
+
+            backlog = self.journal_backlog.pop(gid, {})
+            for uid, record in backlog.items():
+                if record["s"] is None:
+                    data["users"].pop(uid, None)
+                else:
+                    data["users"][uid] = record["s"]
+            if backlog:
+                self.unsaved.setdefault(gid, set()).update(backlog)
+
             self.data[gid] = data
+            if migrated:
+                self.mark_all_unsaved(gid)
             self.stars[gid] = {}
-            self.voice[gid] = {}
+            self.voice.seed(guild, datetime.now())
+            self.settings.pop(gid, None)
+            self.reset_ranks(gid)
             self.lastmsg[gid] = {}
-        if allclean and self.first_run:
-            log.info(allclean)
-            await self.save_cache()
+            path = cog_data_path(self) / "activity" / f"{gid}.npz"
+            if gid not in self.activity and path.exists():
+                step = perf_counter()
+                try:
+                    self.activity[gid] = await asyncio.to_thread(ActivityLog.load, path)
+                except Exception as e:
+                    log.error(f"Failed to load activity log for {guild.name}", exc_info=e)
+                self.add_load_time("activity", step)
+            if migrated:
+                self.seed_weekly(gid, weekly_users)
+        if migrated:
+            await self.save_cache(guild)
+
+    def add_load_time(self, key: str, start: float):
+        # Summed across guilds loading in parallel, so these can add up to more than the wall time
         if self.first_run:
-            log.info("Config initialized")
-        self.first_run = False
+            self.load_times[key] = self.load_times.get(key, 0) + perf_counter() - start
 
     @staticmethod
     def cleanup(data: dict) -> tuple:
@@ -339,6 +555,9 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         if isinstance(conf["channelbonuses"]["voice"], list):
             conf["channelbonuses"]["voice"] = {}
         cleaned = []
+        # Weekly stats are read from the activity log now
+        if conf["weekly"].pop("users", None) is not None:
+            cleaned.append("weekly users moved to activity log")
         # Check prestige data
         if conf["prestigedata"]:
             for prestige_level, prestige_data in conf["prestigedata"].items():
@@ -416,21 +635,115 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
 
     @perf(max_entries=1000)
     async def save_cache(self, target_guild: discord.Guild = None):
-        if not target_guild:
-            await self.config.ignored_guilds.set(self.ignored_guilds)
-            await self.config.cache_seconds.set(self.cache_seconds)
-            await self.config.render_gifs.set(self.render_gifs)
-
-        cache = self.data.copy()
-        for gid, data in cache.items():
-            if target_guild and target_guild.id != gid:
-                continue
-            guild = self.bot.get_guild(gid)
-            if not guild:
+        async with self.journal_lock:
+            await self.flush_journal()
+            if not target_guild:
+                await self.config.ignored_guilds.set(self.ignored_guilds)
+                await self.config.cache_seconds.set(self.cache_seconds)
+                await self.config.profile_cache_size.set(self.profile_cache.max_bytes // 1024**2)
+                await self.config.render_gifs.set(self.render_gifs)
+                await self.config.render_workers.set(self.render_workers)
+                await self.config.render_timeout.set(self.render_timeout)
+                await self.config.prerender.set(self.prerender)
+                await asyncio.to_thread(self.journal.rotate)
+                await self.save_activity()
+
+            cache = self.data.copy()
+            for gid, data in cache.items():
+                if target_guild and target_guild.id != gid:
+                    continue
+                guild = self.bot.get_guild(gid)
+                if not guild:
+                    continue
+                async with self.config.guild(guild).all() as conf:
+                    for k, v in data.copy().items():
+                        conf[k] = v
+
+            # Everything journaled before this point is now in config
+            if target_guild:
+                self.unsaved.pop(target_guild.id, None)
+                await asyncio.to_thread(self.journal.write, [self.journal.encode({"g": target_guild.id})])
+            else:
+                self.unsaved.clear()
+                await asyncio.to_thread(self.journal.commit)
+
+    def get_activity(self, guild_id: int) -> ActivityLog:
+        if guild_id not in self.activity:
+            self.activity[guild_id] = ActivityLog()
+        return self.activity[guild_id]
+
+    async def save_activity(self):
+        """Write every guild's activity log to disk, the arrays are gathered on the loop and written in a thread"""
+        folder = cog_data_path(self) / "activity"
+        folder.mkdir(exist_ok=True)
+        for gid, activity in list(self.activity.items()):
+            await asyncio.to_thread(ActivityLog.write, folder / f"{gid}.npz", activity.snapshot())
+
+    def mark_dirty(self, guild_id: int, user_id: str):
+        """Queue a user's stats to be written to the journal"""
+        self.dirty.setdefault(guild_id, set()).add(user_id)
+
+    def mark_all_unsaved(self, guild_id: int):
+        """Have the next save write every user of a guild, for bulk changes that don't mark users one at a time"""
+        self.unsaved.setdefault(guild_id, set()).update(self.data[guild_id]["users"])
+
+    async def flush_journal(self):
+        """Write users changed since the last flush to the journal, the caller must hold the journal lock"""
+        dirty, self.dirty = self.dirty, {}
+        lines = []
+        for gid, uids in dirty.items():
+            conf = self.data.get(gid)
+            if conf is None:
                 continue
-            async with self.config.guild(guild).all() as conf:
-                for k, v in data.copy().items():
-                    conf[k] = v
+            for uid in uids:
+                record = {"g": gid, "u": uid, "s": conf["users"].get(uid)}
+                lines.append(self.journal.encode(record))
+            self.unsaved.setdefault(gid, set()).update(uids)
+        await asyncio.to_thread(self.journal.write, lines)
+
+    @perf(max_entries=1000)
+    async def compact_journal(self):
+        """Fold the users changed since the last compaction into config, costs O(changes) rather than O(users)"""
+        async with self.journal_lock:
+            await self.flush_journal()
+            unsaved, self.unsaved = self.unsaved, {}
+            await asyncio.to_thread(self.journal.rotate)
+            try:
+                for gid, uids in unsaved.items():
+                    conf = self.data.get(gid)
+                    if conf is None:
+                        continue
+                    # One config write per guild, each write saves the whole file
+                    async with self.config.guild_from_id(gid).users() as users:
+                        self.fold_users(users, conf["users"], uids)
+            except Exception as e:
+                # The rotated journal is kept and these users are retried on the next compaction
+                log.error("Failed to compact the XP journal", exc_info=e)
+                for gid, uids in unsaved.items():
+                    self.unsaved.setdefault(gid, set()).update(uids)
+                return
+            await asyncio.to_thread(self.journal.commit)
+
+    @staticmethod
+    def fold_users(saved: dict, current: dict, user_ids: Set[str]):
+        """Copy the current stats of the given users over the saved ones, removing users that are gone"""
+        for uid in user_ids:
+            if uid in current:
+                saved[uid] = current[uid]
+            else:
+                saved.pop(uid, None)
+
+    async def global_totals(self) -> Dict[str, Dict[str, float]]:
+        """Stats of every user summed across all guilds"""
+        await self.load_guilds(self.bot.guilds)
+        totals = {}
+        for data in self.data.values():
+            for uid, stats in data["users"].items():
+                if uid not in totals:
+                    totals[uid] = {"xp": 0, "messages": 0, "voice": 0, "stars": 0}
+                for key in totals[uid]:
+                    totals[uid][key] += stats.get(key, 0)
+        return totals
 
     def init_user(self, guild_id: int, user_id: str):
         if user_id in self.data[guild_id]["users"]:
@@ -449,16 +762,152 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             "font": None,
             "blur": False,
         }
-
-    def init_user_weekly(self, guild_id: int, user_id: str):
-        if user_id in self.data[guild_id]["weekly"]["users"]:
+        self.mark_dirty(guild_id, user_id)
+        self.update_rank(guild_id, user_id)
+
+    def get_rank_index(self, guild_id: int, stat: str = "xp") -> RankIndex:
+        """Get the leaderboard index of a stat for a guild, building it on first use"""
+        indexes = self.ranks.setdefault(guild_id, {})
+        if stat in indexes:
+            return indexes[stat]
+        conf = self.data[guild_id]
+        if stat == "xp":
+            items = ((uid, get_effective_xp(data, conf)) for uid, data in conf["users"].items())
+        else:
+            items = ((uid, data[stat]) for uid, data in conf["users"].items())
+        indexes[stat] = RankIndex.build(items)
+        return indexes[stat]
+
+    def update_rank(self, guild_id: int, user_id: str):
+        """Move a user to their current place in any leaderboard index already built for the guild"""
+        conf = self.data[guild_id]
+        if user_id in conf["users"]:
+            user = conf["users"][user_id]
+            for stat, index in self.ranks.get(guild_id, {}).items():
+                index.update(user_id, get_effective_xp(user, conf) if stat == "xp" else user[stat])
+
+    def reset_ranks(self, guild_id: int):
+        """Drop a guild's leaderboard indexes after bulk changes, they will be rebuilt on next use"""
+        self.ranks.pop(guild_id, None)
+
+    def seed_weekly(self, guild_id: int, users: Optional[Dict[str, dict]]):
+        """Carry weekly stats saved before the activity log into its current hour, minus what it already counted"""
+        if not users:
             return
-        self.data[guild_id]["weekly"]["users"][user_id] = {
-            "xp": 0,
-            "voice": 0,  # Seconds,
-            "messages": 0,
-            "stars": 0,
-        }
+        weekly = self.get_weekly_stats(guild_id)
+        activity = self.get_activity(guild_id)
+        for uid, stats in users.items():
+            counted = weekly.get(uid, {})
+            seed = {}
+            for key in ("xp", "messages", "voice", "stars"):
+                seed[key] = max(stats.get(key, 0) - counted.get(key, 0), 0)
+            if any(seed.values()):
+                activity.add(uid, **seed)
+
+    def get_weekly_stats(self, guild_id: int) -> Dict[str, Dict[str, float]]:
+        """Stats of everyone active since the last weekly reset, counted from the start of the hour it happened in"""
+        activity = self.activity.get(guild_id)
+        if activity is None:
+            return {}
+        return activity.stats(hours_since(self.data[guild_id]["weekly"]["last_reset"]))
+
+    def recompute_levels(self, guild_id: int) -> List[str]:
+        """Set every user's level from their XP in one pass over the guild, returns the users whose level changed"""
+        conf = self.data[guild_id]
+        users = conf["users"]
+        if not users:
+            return []
+        uids = list(users)
+        xp = np.floor(np.fromiter((users[uid]["xp"] for uid in uids), dtype=np.float64, count=len(uids)))
+        levels = get_curve(conf["base"], conf["exp"]).levels(xp)
+        stored = np.fromiter((users[uid]["level"] for uid in uids), dtype=np.int64, count=len(uids))
+        changed = []
+        for i in np.flatnonzero(levels != stored).tolist():
+            uid = uids[i]
+            users[uid]["level"] = int(levels[i])
+            self.mark_dirty(guild_id, uid)
+            changed.append(uid)
+        return changed
+
+    def relevel(self, guild: discord.Guild) -> int:
+        """Recompute a guild's levels after the curve or XP changed in bulk, then sync level roles in the background"""
+        changed = self.recompute_levels(guild.id)
+        if changed:
+            self.sync_level_roles(guild, changed)
+        return len(changed)
+
+    def get_role_changes(
+        self, guild: discord.Guild, member: discord.Member
+    ) -> Tuple[Set[discord.Role], Set[discord.Role]]:
+        """Level and prestige roles a member should gain and lose for their current level and prestige"""
+        conf = self.data[guild.id]
+        level_roles = conf["levelroles"]
+        prestiges = conf["prestigedata"]
+        data = conf["users"][str(member.id)]
+        user_level = data["level"]
+        prestige_level = data["prestige"]
+        to_add = set()
+        to_remove = set()
+        if conf["autoremove"]:
+            highest_level = 0
+            for level, role_id in level_roles.items():
+                if int(user_level) >= int(level) >= highest_level:
+                    highest_level = int(level)
+
+            if highest_level:
+                role_id = level_roles[str(highest_level)]
+                if role := guild.get_role(role_id):
+                    to_add.add(role)
+                    for user_role in member.roles:
+                        if user_role.id in level_roles.values() and user_role.id != role.id:
+                            to_remove.add(user_role)
+
+            highest_prestige = 0
+            for prestige_level_requirement in prestiges:
+                if int(prestige_level) >= int(prestige_level_requirement) >= highest_prestige:
+                    highest_prestige = int(prestige_level_requirement)
+
+            if highest_prestige:
+                prestige_role_ids = [i["role"] for i in prestiges.values()]
+                role_id = prestiges[str(highest_prestige)]["role"]
+                if role := guild.get_role(role_id):
+                    to_add.add(role)
+                    for user_role in member.roles:
+                        if user_role.id in prestige_role_ids and user_role.id != role.id:
+                            to_remove.add(user_role)
+
+        else:
+            user_role_ids = [role.id for role in member.roles]
+            for lvl, role_id in level_roles.items():
+                if role := guild.get_role(int(role_id)):
+                    if int(lvl) <= int(user_level) and role.id not in user_role_ids:
+                        to_add.add(role)
+
+            for lvl, prestige in prestiges.items():
+                if role := guild.get_role(int(prestige["role"])):
+                    if int(lvl) <= int(prestige_level) and role.id not in user_role_ids:
+                        to_add.add(role)
+        return to_add, to_remove
+
+    def sync_level_roles(self, guild: discord.Guild, user_ids: List[str]) -> int:
+        """Queue level and prestige roles for a batch of members, returns how many members had changes to make"""
+        if not guild.me.guild_permissions.manage_roles:
+            return 0
+        conf = self.data.get(guild.id)
+        if not conf or (not conf["levelroles"] and not conf["prestigedata"]):
+            return 0
+        queued = 0
+        for uid in user_ids:
+            member = guild.get_member(int(uid))
+            if not member or uid not in conf["users"]:
+                continue
+            to_add, to_remove = self.get_role_changes(guild, member)
+            adding = [r for r in to_add - to_remove if r not in member.roles]
+            removing = [r for r in to_remove - to_add if r in member.roles]
+            if adding or removing:
+                self.role_sync.enqueue(member, adding, removing)
+                queued += 1
+        return queued
 
     def give_star_to_user(self, guild: discord.Guild, user: discord.Member) -> bool:
         if guild.id not in self.data:
@@ -466,6 +915,9 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         if str(user.id) not in self.data[guild.id]["users"]:
             return False
         self.data[guild.id]["users"][str(user.id)]["stars"] += 1
+        self.get_activity(guild.id).add(str(user.id), stars=1)
+        self.mark_dirty(guild.id, str(user.id))
+        self.update_rank(guild.id, str(user.id))
         return True
 
     async def check_levelups(
@@ -483,11 +935,14 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         xp = user["xp"]
         maybe_new_level = get_level(int(xp), base, exp)
         if maybe_new_level == level:
+            if self.prerender:
+                self.maybe_prerender(guild_id, user_id)
             return
         guild = self.bot.get_guild(guild_id)
         if not guild:
             return
         self.data[guild_id]["users"][user_id]["level"] = maybe_new_level
+        self.mark_dirty(guild_id, user_id)
         await self.level_up(guild, user_id, maybe_new_level, background, message, channel_obj)
 
     # User has leveled up, send message and check if any roles are associated with it
@@ -528,14 +983,7 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             return
         mentionuser = member.mention
         name = member.name
-        pfp = None
-        try:
-            if self.dpy2:
-                pfp = member.display_avatar.url
-            else:
-                pfp = member.avatar_url
-        except AttributeError:
-            log.warning(f"Failed to get avatar url for {member.name} in {guild.name}. DPY2 = {self.dpy2}")
+        pfp = self.get_avatar_url(member)
 
         # Get roles to be added and removed
         roles_to_add = []
@@ -604,31 +1052,16 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
                         log.warning(f"Failed to send levelup alert to {channel.name}!", exc_info=e)
 
         else:
-            # Generate LevelUP Image
-            banner = bg if bg else await self.get_banner(member)
-
-            color = str(member.colour)
-            if color == "#000000":  # Don't use default color
-                color = str(discord.Color.random())
-            color = hex_to_rgb(color)
-            font = conf["users"][str(user)]["font"]
-            args = {
-                "bg_image": banner,
-                "profile_image": pfp,
-                "level": new_level,
-                "color": color,
-                "font_name": font,
-            }
-            img = await self.gen_levelup_img(args)
-            temp = BytesIO()
-            try:
-                temp.name = f"{member.id}.webp"
-                img.save(temp, format="WEBP")
-            except KeyError:
-                temp.name = f"{member.id}.png"
-                img.save(temp, format="PNG")
-            temp.seek(0)
-            file = discord.File(temp)
+            # Generate LevelUP Image, unless it was rendered ahead of time with the same inputs
+            args = await self.get_levelup_args(member, new_level, bg)
+            img = self.take_prerender(guild.id, user, render_key(args))
+            if img is None:
+                img = await self.gen_levelup_img(self.with_levelup_color(args))
+            if img:
+                raw, ext = img
+                file = discord.File(BytesIO(raw), filename=f"{member.id}.{ext}")
+            else:
+                file = None
 
             if notify:
                 if dm:
@@ -658,202 +1091,279 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             return
 
         leveltime = monotonic()
-        if roles_to_add:
-            try:
-                await member.add_roles(*roles_to_add, reason=_("Leveled Up!"))
-            except discord.Forbidden:
-                log.warning(f"Lacking permissions to add roles to {member.name} in {member.guild.name}")
-        if roles_to_remove:
-            try:
-                await member.add_roles(*roles_to_remove, reason=_("Auto-remove previous level roles"))
-            except discord.Forbidden:
-                log.warning(f"Lacking permissions to remove roles from {member.name} in {member.guild.name}")
-
+        self.role_sync.enqueue(member, roles_to_add, roles_to_remove)
         t = int((monotonic() - leveltime) * 1000)
         get_stats().add("levelup.level_assignment", t)
 
+    def get_avatar_url(self, member: discord.Member) -> Optional[str]:
+        try:
+            if self.dpy2:
+                return member.display_avatar.url
+            return member.avatar_url
+        except AttributeError:
+            log.warning(f"Failed to get avatar url for {member.name} in {member.guild.name}. DPY2 = {self.dpy2}")
+
+    async def get_levelup_args(self, member: discord.Member, level: int, bg: str = None) -> dict:
+        """Level-up render inputs, the color is left as None for members without one so a random one is picked later"""
+        color = str(member.colour)
+        return {
+            "bg_image": bg if bg else await self.get_banner(member),
+            "profile_image": str(self.get_avatar_url(member)),
+            "level": level,
+            "color": None if color == "#000000" else hex_to_rgb(color),
+            "font_name": self.data[member.guild.id]["users"][str(member.id)]["font"],
+        }
+
+    @staticmethod
+    def with_levelup_color(args: dict) -> dict:
+        if args["color"]:
+            return args
+        # Don't use default color
+        return {**args, "color": hex_to_rgb(str(discord.Color.random()))}
+
+    def maybe_prerender(self, guild_id: int, user_id: str):
+        """
+        Queue a member's next level-up card to render ahead of time if their XP is close to the threshold
+
+        A member is queued again whenever their avatar, background, color or font no longer match the inputs of their
+        last pre-render, and the card is only ever used if its render key still matches at level up.
+        """
+        conf = self.data[guild_id]
+        if not conf["usepics"] or not conf["notify"]:
+            return
+        user = conf["users"][user_id]
+        level = user["level"]
+        current = get_xp(level, conf["base"], conf["exp"])
+        target = get_xp(level + 1, conf["base"], conf["exp"])
+        if target - user["xp"] > (target - current) * self.prerender:
+            return
+        guild = self.bot.get_guild(guild_id)
+        member = guild.get_member(int(user_id)) if guild else None
+        if not member:
+            return
+        inputs = (level + 1, str(self.get_avatar_url(member)), user["background"], str(member.colour), user["font"])
+        last = self.prerendered.get(guild_id, {}).get(user_id)
+        if last and last[0] == inputs:
+            return
+        # Mark as queued so it isn't queued again by every message until it renders
+        self.drop_prerender(guild_id, user_id)
+        self.prerendered.setdefault(guild_id, {})[user_id] = (inputs, None)
+        try:
+            self.prerender_queue.put_nowait((guild_id, user_id, inputs))
+        except asyncio.QueueFull:
+            del self.prerendered[guild_id][user_id]
+            return
+        if self.prerender_task is None or self.prerender_task.done():
+            self.prerender_task = asyncio.create_task(self.prerender_worker())
+
+    def drop_prerender(self, guild_id: int, user_id: str):
+        last = self.prerendered.get(guild_id, {}).pop(user_id, None)
+        if last and last[1]:
+            self.levelup_cache.pop(last[1])
+
+    def take_prerender(self, guild_id: int, user_id: str, key: str) -> Optional[Tuple[bytes, str]]:
+        last = self.prerendered.get(guild_id, {}).get(user_id)
+        img = self.levelup_cache.get(key) if last and last[1] == key else None
+        self.drop_prerender(guild_id, user_id)
+        return img
+
+    async def prerender_worker(self):
+        """Render queued level-up cards one at a time, only while no other renders are running"""
+        while True:
+            guild_id, user_id, inputs = await self.prerender_queue.get()
+            while self.renderer.busy:
+                await asyncio.sleep(1)
+            last = self.prerendered.get(guild_id, {}).get(user_id)
+            if not last or last[0] != inputs:
+                # Leveled up or changed their profile since this was queued
+                continue
+            guild = self.bot.get_guild(guild_id)
+            member = guild.get_member(int(user_id)) if guild else None
+            if not member or user_id not in self.data.get(guild_id, {}).get("users", {}):
+                self.prerendered.get(guild_id, {}).pop(user_id, None)
+                continue
+            try:
+                bg = self.data[guild_id]["users"][user_id]["background"]
+                args = await self.get_levelup_args(member, inputs[0], bg)
+                img = await self.gen_levelup_img(self.with_levelup_color(args))
+            except Exception as e:
+                log.warning(f"Failed to pre-render level-up for {member.name} in {guild.name}", exc_info=e)
+                img = None
+            if self.prerendered.get(guild_id, {}).get(user_id) is not last:
+                continue
+            if not img:
+                self.prerendered.get(guild_id, {}).pop(user_id, None)
+                continue
+            key = render_key(args)
+            self.levelup_cache.put(key, img)
+            self.prerendered[guild_id][user_id] = (inputs, key)
+
     @perf(max_entries=1000)
     async def message_handler(self, message: discord.Message):
         now = datetime.now()
         guild = message.guild
         gid = guild.id
         if gid not in self.data:
-            await self.initialize()
+            await self.load_guild(guild)
         conf = self.data[gid]
-        xpmin = int(conf["xp"][0])
-        xpmax = int(conf["xp"][1]) + 1
-        xp = random.choice(range(xpmin, xpmax))
-        bonuses = conf["rolebonuses"]["msg"]
-        channel_bonuses = conf["channelbonuses"]["msg"]
-        bonusrole = None
+        settings = self.get_settings(gid)
 
-        users = self.data[gid]["users"]
+        users = conf["users"]
         uid = str(message.author.id)
         if uid not in users:
             self.init_user(gid, uid)
 
-        weekly_users = conf["weekly"]["users"]
-        weekly_on = conf["weekly"]["on"]
-        if weekly_on and uid not in weekly_users:
-            self.init_user_weekly(gid, uid)
-
         # Whether to award xp
         addxp = False
         if uid not in self.lastmsg[gid]:
             addxp = True
         else:
             td = (now - self.lastmsg[gid][uid]).total_seconds()
-            if td > conf["cooldown"]:
+            if td > settings.cooldown:
                 addxp = True
-        try:
-            roles = list(message.author.roles)
-        except AttributeError:  # User sent message and then left?
-            return
         # Ignored stuff
-        for role in roles:
-            rid = str(role.id)
-            if role.id in conf["ignoredroles"]:
-                addxp = False
-            if rid in bonuses:
-                bonusrole = rid
-        if message.channel.id in conf["ignoredchannels"]:
+        bonusrole = None
+        if settings.checks_roles:
+            try:
+                roles = message.author.roles
+            except AttributeError:  # User sent message and then left?
+                return
+            for role in roles:
+                if role.id in settings.ignored_roles:
+                    addxp = False
+                if role.id in settings.role_bonuses:
+                    bonusrole = role.id
+        if message.channel.id in settings.ignored_channels:
             addxp = False
-        if int(uid) in conf["ignoredusers"]:
+        if message.author.id in settings.ignored_users:
             addxp = False
 
-        if conf["length"]:  # Make sure message meets minimum length requirements
-            regex = r"<(@!|#)[0-9]{18}>|<a{0,1}:[a-zA-Z0-9_.]{2,32}:[0-9]{18,19}>"
-            cleaned = re.sub(regex, "", message.content)
-            if len(cleaned) < conf["length"]:
+        if addxp and settings.length:  # Make sure message meets minimum length requirements
+            cleaned = MENTION_EMOJI_REGEX.sub("", message.content)
+            if len(cleaned) < settings.length:
                 addxp = False
 
         if addxp:  # Give XP
-            xp_to_give = xp
+            xp_to_give = random.randint(*settings.xp)
             if bonusrole:
-                bonusrange = bonuses[bonusrole]
-                bmin = int(bonusrange[0])
-                bmax = int(bonusrange[1]) + 1
-                bxp = random.choice(range(bmin, bmax))
-                xp_to_give += bxp
-            cid = str(message.channel.id)
-            try:
-                cat_cid = str(message.channel.category.id) if message.channel.category else "0"
-            except discord.ClientException:
-                cat_cid = "0"
-            if cid in channel_bonuses or cat_cid in channel_bonuses:
+                xp_to_give += random.randint(*settings.role_bonuses[bonusrole])
+            channel_bonuses = settings.channel_bonuses
+            if channel_bonuses:
+                cid = message.channel.id
+                try:
+                    cat_cid = message.channel.category_id or 0
+                except AttributeError:
+                    cat_cid = 0
                 bonus_id = cid if cid in channel_bonuses else cat_cid
-                bonuschannelrange = channel_bonuses[bonus_id]
-                bmin = int(bonuschannelrange[0])
-                bmax = int(bonuschannelrange[1]) + 1
-                bxp = random.choice(range(bmin, bmax))
-                xp_to_give += bxp
+                if bonus_id in channel_bonuses:
+                    xp_to_give += random.randint(*channel_bonuses[bonus_id])
             self.lastmsg[gid][uid] = now
-            self.data[gid]["users"][uid]["xp"] += xp_to_give
-            if weekly_on:
-                self.data[gid]["weekly"]["users"][uid]["xp"] += xp_to_give
+            users[uid]["xp"] += xp_to_give
 
-        self.data[gid]["users"][uid]["messages"] += 1
-        if weekly_on:
-            self.data[gid]["weekly"]["users"][uid]["messages"] += 1
+        users[uid]["messages"] += 1
+        self.get_activity(gid).add(uid, xp=xp_to_give if addxp else 0, messages=1)
+        self.mark_dirty(gid, uid)
+        self.update_rank(gid, uid)
         await self.check_levelups(gid, uid, message)
 
-    async def check_voice(self, guild: discord.guild):
-        jobs = []
+    def accrue_voice(self, guild: discord.Guild, member_id: int, now: datetime, tick: bool = False) -> bool:
+        """
+        Credit a member with the voice time and XP earned since their session was last settled
+
+        This runs on every voice check and whenever a member's voice state or the humans in their channel change,
+        so time is always credited under the state it was spent in.
+        Flat role, channel and stream bonuses are only rolled on the periodic voice check.
+        """
         gid = guild.id
-        if str(gid) in self.ignored_guilds:
-            return
-        if gid not in self.data:
-            await self.initialize()
+        session = self.voice.get(gid, member_id)
+        if session is None:
+            return False
+        td = (now - session.since).total_seconds()
+        session.since = now
+        if str(gid) in self.ignored_guilds or gid not in self.data:
+            return False
+        member = guild.get_member(member_id)
+        if not member:
+            return False
 
         conf = self.data[gid]
-        xp_per_minute = conf["voicexp"]
         bonuses = conf["rolebonuses"]["voice"]
-        channel_bonuses = conf["channelbonuses"]["voice"]
-        stream_bonus = conf["streambonus"]
-        weekly_on = conf["weekly"]["on"]
-        bonusrole = None
-        async for member in AsyncIter(guild.members, steps=100, delay=0.001):
-            member: discord.Member = member
-            if member.bot:
-                continue
-            now = datetime.now()
-            uid = str(member.id)
-            voice_state = member.voice
-            if not voice_state:  # Only cache if user is in a vc
-                if uid in self.voice[gid]:
-                    del self.voice[gid][uid]
-                continue
-
-            if uid not in self.voice[gid]:
-                self.voice[gid][uid] = now
-            if uid not in self.data[gid]["users"]:
-                self.init_user(gid, uid)
-
-            if weekly_on and uid not in self.data[gid]["weekly"]["users"]:
-                self.init_user_weekly(gid, uid)
+        uid = str(member_id)
+        if uid not in self.data[gid]["users"]:
+            self.init_user(gid, uid)
 
-            ts = self.voice[gid][uid]
-            td = (now - ts).total_seconds()
-            xp_to_give = (td / 60) * xp_per_minute
-            addxp = True
-            # Ignore muted users
-            if conf["muted"] and voice_state.self_mute:
-                addxp = False
-            # Ignore deafened users
-            if conf["deafened"] and voice_state.self_deaf:
-                addxp = False
-            # Ignore offline/invisible users
-            if conf["invisible"] and member.status.name == "offline":
-                addxp = False
-            # Ignore if user is only one in channel
-            in_voice = 0
-            if voice_state.channel:
-                for mem in voice_state.channel.members:
-                    if mem.bot:
-                        continue
-                    in_voice += 1
-            if conf["solo"] and in_voice <= 1:
-                addxp = False
-            # Check ignored roles
-            for role in member.roles:
-                rid = str(role.id)
-                if role.id in conf["ignoredroles"]:
-                    addxp = False
-                if rid in bonuses:
-                    bonusrole = rid
-            # Check ignored users
-            if int(uid) in conf["ignoredusers"]:
-                addxp = False
-            # Check ignored channels
-            if voice_state.channel.id in conf["ignoredchannels"]:
+        xp_to_give = (td / 60) * conf["voicexp"]
+        addxp = True
+        # Ignore muted users
+        if conf["muted"] and session.muted:
+            addxp = False
+        # Ignore deafened users
+        if conf["deafened"] and session.deafened:
+            addxp = False
+        # Ignore offline/invisible users
+        if conf["invisible"] and member.status.name == "offline":
+            addxp = False
+        # Ignore if user is only one in channel
+        if conf["solo"] and self.voice.humans(gid, session.channel_id) <= 1:
+            addxp = False
+        # Check ignored roles
+        bonusrole = None
+        for role in member.roles:
+            rid = str(role.id)
+            if role.id in conf["ignoredroles"]:
                 addxp = False
-            if addxp:
+            if rid in bonuses:
+                bonusrole = rid
+        # Check ignored users
+        if member_id in conf["ignoredusers"]:
+            addxp = False
+        # Check ignored channels
+        if session.channel_id in conf["ignoredchannels"]:
+            addxp = False
+        if addxp:
+            if tick:
+                channel_bonuses = conf["channelbonuses"]["voice"]
+                stream_bonus = conf["streambonus"]
                 if bonusrole:
                     bonusrange = bonuses[bonusrole]
                     bmin = int(bonusrange[0])
                     bmax = int(bonusrange[1]) + 1
                     bxp = random.choice(range(bmin, bmax))
                     xp_to_give += bxp
-                cid = str(voice_state.channel.id)
+                cid = str(session.channel_id)
                 if cid in channel_bonuses:
                     bonuschannelrange = channel_bonuses[cid]
                     bmin = int(bonuschannelrange[0])
                     bmax = int(bonuschannelrange[1]) + 1
                     bxp = random.choice(range(bmin, bmax))
                     xp_to_give += bxp
-                if stream_bonus and voice_state.self_stream:
+                if stream_bonus and session.streaming:
                     bmin = int(stream_bonus[0])
                     bmax = int(stream_bonus[1]) + 1
                     bxp = random.choice(range(bmin, bmax))
                     xp_to_give += bxp
-                self.data[gid]["users"][uid]["xp"] += xp_to_give
-                if weekly_on:
-                    self.data[gid]["weekly"]["users"][uid]["xp"] += xp_to_give
-            self.data[gid]["users"][uid]["voice"] += td
-            if weekly_on:
-                self.data[gid]["weekly"]["users"][uid]["voice"] += td
-            self.voice[gid][uid] = now
-            jobs.append(self.check_levelups(gid, uid, channel_obj=voice_state.channel))
+            self.data[gid]["users"][uid]["xp"] += xp_to_give
+        self.data[gid]["users"][uid]["voice"] += td
+        self.get_activity(gid).add(uid, xp=xp_to_give if addxp else 0, voice=td)
+        self.mark_dirty(gid, uid)
+        self.update_rank(gid, uid)
+        return True
+
+    async def check_voice(self, guild: discord.guild):
+        gid = guild.id
+        if str(gid) in self.ignored_guilds:
+            return
+        if gid not in self.data:
+            await self.load_guild(guild)
+
+        # Only members in the voice index are visited, everyone else is idle
+        jobs = []
+        now = datetime.now()
+        for member_id, session in list(self.voice.guild(gid).items()):
+            if not self.accrue_voice(guild, member_id, now, tick=True):
+                continue
+            channel = guild.get_channel(session.channel_id)
+            jobs.append(self.check_levelups(gid, str(member_id), channel_obj=channel))
         await asyncio.gather(*jobs)
 
     @tasks.loop(seconds=20)
@@ -875,7 +1385,17 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
 
     @tasks.loop(minutes=3)
     async def cache_dumper(self):
-        await self.save_cache()
+        await self.compact_journal()
+        await self.save_activity()
+
+    @tasks.loop(seconds=10)
+    async def journal_writer(self):
+        async with self.journal_lock:
+            await self.flush_journal()
+
+    @journal_writer.before_loop
+    async def before_journal_writer(self):
+        await self.bot.wait_until_red_ready()
 
     @cache_dumper.before_loop
     async def before_cache_dumper(self):
@@ -899,7 +1419,7 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             if not w["autoreset"] or not w["on"]:
                 continue
             now = datetime.utcnow()
-            last_reset = datetime.fromtimestamp(w["last_reset"])
+            last_reset = datetime.utcfromtimestamp(w["last_reset"])
             if last_reset.day == now.day:
                 continue
 
@@ -928,14 +1448,14 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
     async def reset_weekly_stats(self, guild: discord.Guild, ctx: commands.Context = None):
         """Announce and reset the weekly leaderboard"""
         w = self.data[guild.id]["weekly"].copy()
-        users = {
-            guild.get_member(int(k)): v for k, v in w["users"].items() if (v["xp"] > 0 and guild.get_member(int(k)))
-        }
+        weekly = self.get_weekly_stats(guild.id)
+        users = {guild.get_member(int(k)): v for k, v in weekly.items() if (v["xp"] > 0 and guild.get_member(int(k)))}
         channel = guild.get_channel(w["channel"]) if w["channel"] else None
         if not users:
             if ctx:
                 await ctx.send(_("There are no users with exp"))
-            self.data[guild.id]["weekly"]["last_reset"] = int(datetime.utcnow().timestamp())
+            self.data[guild.id]["weekly"]["last_reset"] = int(datetime.now(timezone.utc).timestamp())
+            await self.save_cache(guild)
             return
 
         total_xp = humanize_number(round(sum(v["xp"] for v in users.values())))
@@ -1013,8 +1533,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             for uid in top_uids:
                 self.data[guild.id]["users"][uid]["xp"] += bonus
 
-        self.data[guild.id]["weekly"]["last_reset"] = int(datetime.utcnow().timestamp())
-        self.data[guild.id]["weekly"]["users"].clear()
+        # Starting the window over is all a reset takes, the stats themselves live in the activity log
+        self.data[guild.id]["weekly"]["last_reset"] = int(datetime.now(timezone.utc).timestamp())
         self.data[guild.id]["weekly"]["last_embed"] = em.to_dict()
         await self.save_cache(guild)
 
@@ -1245,6 +1765,21 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         await ctx.tick()
         await self.save_cache()
 
+    @admin_group.command(name="profilecachesize")
+    @commands.is_owner()
+    async def set_profile_cache_size(self, ctx: commands.Context, megabytes: int):
+        """
+        Set how much memory cached profile images may use
+
+        Rendered profiles are cached by their content, so a member whose stats, colors and images haven't changed gets their cached profile instantly.
+        Once the cache goes over this size the least recently viewed profiles are dropped.
+        """
+        if megabytes < 0:
+            return await ctx.send(_("Cache size cannot be negative"))
+        self.profile_cache.resize(megabytes * 1024**2)
+        await ctx.send(_("Profile image cache size set to {}MB").format(megabytes))
+        await self.save_cache()
+
     @admin_group.command(name="rendergifs")
     @commands.is_owner()
     async def toggle_gif_render(self, ctx: commands.Context):
@@ -1259,6 +1794,60 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         await ctx.tick()
         await self.save_cache()
 
+    @admin_group.command(name="renderworkers")
+    @commands.is_owner()
+    async def set_render_workers(self, ctx: commands.Context, workers: int, timeout: int = 60):
+        """
+        Set how many processes to render profile images with
+
+        Renders are spread across a pool of worker processes so several can run in parallel across cores.
+        Each worker loads the bundled fonts, backgrounds and icons once when it starts.
+
+        **Arguments**
+        `workers` - number of worker processes, set to 0 to render in a thread instead
+        `timeout` - seconds a single render may take before it is abandoned
+        """
+        if workers < 0:
+            return await ctx.send(_("Worker count cannot be negative"))
+        if timeout < 5:
+            return await ctx.send(_("Timeout must be at least 5 seconds"))
+        cores = os.cpu_count() or 1
+        if workers > cores:
+            return await ctx.send(_("This machine only has {} cores").format(cores))
+        self.render_workers = workers
+        self.render_timeout = timeout
+        self.renderer.configure(workers, timeout)
+        if workers:
+            await ctx.send(_("Profiles will now render across {} worker processes").format(workers))
+        else:
+            await ctx.send(_("Profiles will now render in a thread"))
+        await self.save_cache()
+
+    @admin_group.command(name="prerender")
+    @commands.is_owner()
+    async def set_prerender(self, ctx: commands.Context, fraction: float):
+        """
+        Render level-up cards ahead of time for members close to their next level
+
+        When a member has less than this fraction of their current level's XP left to go, their level-up card is
+        rendered in the background whenever no other renders are running, so it can be sent as soon as they level up.
+        Only applies to servers using image level-ups with notifications on.
+
+        **Arguments**
+        `fraction` - between 0 and 1, for example 0.1 starts rendering with 10% of the level left, 0 disables
+        """
+        if not 0 <= fraction <= 1:
+            return await ctx.send(_("Fraction must be between 0 and 1"))
+        self.prerender = fraction
+        if not fraction:
+            self.prerendered.clear()
+            self.levelup_cache.clear()
+            await ctx.send(_("Level-up cards will no longer be rendered ahead of time"))
+        else:
+            txt = _("Level-up cards will be rendered ahead of time with {}% of a level left")
+            await ctx.send(txt.format(round(fraction * 100, 1)))
+        await self.save_cache()
+
     @admin_group.command(name="globalreset")
     @commands.is_owner()
     async def reset_all(self, ctx: commands.Context):
@@ -1269,8 +1858,10 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         if not yes:
             text = _("Not resetting all guilds")
             return await msg.edit(content=text)
+        await self.load_guilds(self.bot.guilds)
         for gid in self.data.copy():
             self.data[gid] = constants.default_guild
+            self.reset_ranks(gid)
         await msg.edit(content=_("Settings and stats for all guilds have been reset"))
         await ctx.tick()
         await self.save_cache()
@@ -1285,6 +1876,7 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             text = _("Not resetting config")
             return await msg.edit(content=text)
         self.data[ctx.guild.id] = constants.default_guild
+        self.reset_ranks(ctx.guild.id)
         await msg.edit(content=_("All settings and stats reset"))
         await ctx.tick()
         await self.save_cache(ctx.guild)
@@ -1311,6 +1903,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
                 self.data[ctx.guild.id]["users"][uid]["prestige"] = 0
                 self.data[ctx.guild.id]["users"][uid]["stars"] = 0
                 deleted += 1
+            self.reset_ranks(ctx.guild.id)
+            self.mark_all_unsaved(ctx.guild.id)
             text = _("Reset stats for ") + str(deleted) + _(" users")
             await msg.edit(content=text)
         await ctx.tick()
@@ -1321,7 +1915,7 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         """View current loop times and cached data"""
         cache = [
             self.data.copy(),
-            self.voice.copy(),
+            self.voice.sessions.copy(),
             self.stars.copy(),
             self.profiles.copy(),
         ]
@@ -1330,7 +1924,25 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         em = discord.Embed(description=_("Cog Stats"), color=ctx.author.color)
 
         cachetxt = _("`Profile Cache Time: `") + (_("Disabled\n") if not ct else f"{humanize_number(ct)} seconds\n")
-        cachetxt += _("`Cache Size:         `") + cachesize
+        cachetxt += _("`Cache Size:         `") + cachesize + "\n"
+        cachetxt += _("`Profile Images:     `") + _("{} ({}/{})").format(
+            humanize_number(len(self.profile_cache)),
+            self.get_size(self.profile_cache.size),
+            self.get_size(self.profile_cache.max_bytes),
+        )
+        cachetxt += "\n" + _("`XP Journal:         `") + _("{} ({} unsaved users)").format(
+            self.get_size(self.journal.size()),
+            humanize_number(sum(len(i) for i in self.unsaved.values())),
+        )
+        cachetxt += "\n" + _("`Asset Fetches:      `") + _("{} cached, {} downloaded").format(
+            humanize_number(self.fetcher.hits),
+            humanize_number(self.fetcher.misses),
+        )
+        cachetxt += "\n" + _("`Level-Up Prerender: `") + _("{} ({})").format(
+            humanize_number(len(self.levelup_cache)),
+            self.get_size(self.levelup_cache.size),
+        )
+        cachetxt += "\n" + _("`Role Sync Queue:    `") + _("{} members").format(humanize_number(len(self.role_sync)))
         em.add_field(name=_("Cache"), value=cachetxt, inline=False)
 
         render = _("(Disabled)")
@@ -1341,6 +1953,16 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
 
         em.add_field(name=_("GIF Rendering ") + render, value=txt, inline=False)
 
+        if self.render_workers:
+            txt = _("Rendering across {} worker processes with a {}s timeout").format(
+                self.render_workers, self.render_timeout
+            )
+        else:
+            txt = _("Rendering in a thread with a {}s timeout").format(self.render_timeout)
+        em.add_field(name=_("Render Engine"), value=txt, inline=False)
+        if self.startup_report:
+            em.add_field(name=_("Startup"), value=self.startup_report, inline=False)
+
         stats = get_stats()
         results = []
         for key in stats.function_times:
@@ -1368,6 +1990,7 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
     @commands.bot_has_permissions(attach_files=True)
     async def backup_cog(self, ctx):
         """Create a backup of the LevelUp config"""
+        await self.load_guilds(self.bot.guilds)
         buffer = BytesIO(json.dumps(self.data).encode())
         buffer.name = f"LevelUp_GLOBAL_config_{int(datetime.now().timestamp())}.json"
         buffer.seek(0)
@@ -1403,11 +2026,17 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             return await ctx.send(_("This is an invalid global config!"))
 
         for gid, data in config.items():
+            weekly_users = data["weekly"].get("users")
             cleaned, newdata = self.cleanup(data.copy())
             if cleaned:
                 data = newdata
 
             self.data[int(gid)] = data
+            self.seed_weekly(int(gid), weekly_users)
+            self.reset_ranks(int(gid))
+            self.mark_all_unsaved(int(gid))
+            if guild := self.bot.get_guild(int(gid)):
+                self.relevel(guild)
 
         await self.save_cache()
         await ctx.send(_("Config restored from backup file!"))
@@ -1429,10 +2058,15 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         default = self.config.defaults["GUILD"]
         if not all([key in default for key in config.keys()]):
             return await ctx.send(_("This is an invalid guild config!"))
+        weekly_users = config["weekly"].get("users")
         cleaned, newdata = self.cleanup(config.copy())
         if cleaned:
             config = newdata
         self.data[ctx.guild.id] = config
+        self.seed_weekly(ctx.guild.id, weekly_users)
+        self.reset_ranks(ctx.guild.id)
+        self.mark_all_unsaved(ctx.guild.id)
+        self.relevel(ctx.guild)
         await self.save_cache()
         await ctx.send(_("Config restored from backup file!"))
 
@@ -1465,6 +2099,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         data = json.loads(path.read_text())["1099710897114110101"]["MEMBER"]
         imported = 0
         async with ctx.typing():
+            # Guilds that haven't loaded yet would otherwise be skipped
+            await self.load_guilds(self.bot.guilds)
             for guild in self.bot.guilds:
                 if guild.id not in self.data:
                     continue
@@ -1503,60 +2139,95 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
                     imported += 1
         if not imported:
             return await ctx.send(_("There were no profiles to import"))
+        for guild in self.bot.guilds:
+            if guild.id not in self.data:
+                continue
+            self.reset_ranks(guild.id)
+            self.relevel(guild)
         txt = _("Imported {} profile(s)").format(imported)
         await ctx.send(txt)
 
-    @retry(
-        retry=retry_if_exception_type(json.JSONDecodeError),
-        wait=wait_random_exponential(min=120, max=600),
-        stop=stop_after_attempt(6),
-        reraise=True,
-    )
-    async def fetch_mee6_payload(self, guild_id: int, page: int):
-        url = f"https://mee6.xyz/api/plugins/levels/leaderboard/{guild_id}?page={page}&limit=1000"
-        timeout = ClientTimeout(total=60)
-        async with ClientSession(timeout=timeout) as session:
-            async with session.get(url, headers={"Accept": "application/json"}) as res:
-                status = res.status
-                if status == 429:
-                    log.warning("mee6 import is being rate limited!")
-                data = await res.json(content_type=None)
-                return data, status
-
-    @retry(
-        retry=retry_if_exception_type(json.JSONDecodeError),
-        wait=wait_random_exponential(min=120, max=600),
-        stop=stop_after_attempt(6),
-        reraise=True,
-    )
-    async def fetch_amari_payload(self, guild_id: int, page: int, key: str):
-        url = f"https://amaribot.com/api/v1/guild/leaderboard/{guild_id}?page={page}&limit=1000"
-        headers = {"Accept": "application/json", "Authorization": key}
-        timeout = ClientTimeout(total=60)
-        async with ClientSession(timeout=timeout) as session:
-            async with session.get(url, headers=headers) as res:
-                status = res.status
-                if status == 429:
-                    log.warning("amari import is being rate limited!")
-                data = await res.json(content_type=None)
-                return data, status
-
-    @retry(
-        retry=retry_if_exception_type(json.JSONDecodeError),
-        wait=wait_random_exponential(min=120, max=600),
-        stop=stop_after_attempt(6),
-        reraise=True,
-    )
-    async def fetch_polaris_payload(self, guild_id: int, page: int):
-        url = f"https://gdcolon.com/polaris/api/leaderboard/{guild_id}?page={page}"
-        timeout = ClientTimeout(total=60)
-        async with ClientSession(timeout=timeout) as session:
-            async with session.get(url, headers={"Accept": "application/json"}) as res:
-                status = res.status
-                if status == 429:
-                    log.warning("polaris import is being rate limited!")
-                data = await res.json(content_type=None)
-                return data, status
+    def merge_import(self, guild_id: int, users: Dict[str, dict], replace: bool, by_level: bool = False) -> int:
+        """
+        Fold imported stats into a guild in one pass
+
+        Stats are `xp`, `level`, `messages`, `stars` and `weekly_xp`, whichever the source has.
+        With `by_level` the level is imported and XP derived from it, otherwise the other way around.
+        """
+        conf = self.data[guild_id]
+        base = conf["base"]
+        exp = conf["exp"]
+        weekly = self.get_weekly_stats(guild_id) if conf["weekly"]["on"] else None
+        for uid, stats in users.items():
+            self.init_user(guild_id, uid)
+            user = conf["users"][uid]
+            if by_level and "level" in stats:
+                user["level"] = stats["level"] if replace else user["level"] + stats["level"]
+                user["xp"] = get_xp(user["level"], base, exp)
+            elif "xp" in stats:
+                user["xp"] = stats["xp"] if replace else user["xp"] + stats["xp"]
+                user["level"] = get_level(user["xp"], base, exp)
+            for key in ("messages", "stars"):
+                if key in stats:
+                    user[key] = stats[key] if replace else user[key] + stats[key]
+            if weekly is not None and "weekly_xp" in stats:
+                # Weekly stats are activity since the last reset, imported XP lands in the current hour
+                current = weekly.get(uid, {}).get("xp", 0) if replace else 0
+                self.get_activity(guild_id).add(uid, xp=stats["weekly_xp"] - current)
+            self.mark_dirty(guild_id, uid)
+        return len(users)
+
+    async def fetch_leaderboard(
+        self, ctx: commands.Context, msg: discord.Message, source: ImportSource
+    ) -> Optional[Tuple[LeaderboardImporter, ImportResult]]:
+        """Fetch a leaderboard for an import command, the importer is returned so its checkpoint can be cleared"""
+        checkpoint = cog_data_path(self) / "imports" / f"{source.name}-{source.guild_id}.jsonl"
+        importer = LeaderboardImporter(source, checkpoint)
+
+        async def progress(pages: int):
+            with contextlib.suppress(discord.HTTPException):
+                await msg.edit(content=_("Fetching leaderboard data, `{}` pages so far...").format(pages))
+
+        async with ctx.typing():
+            try:
+                result = await importer.run(progress)
+            except ImportFailed as e:
+                log.warning(f"Failed to fetch {source.name} leaderboard data in {ctx.guild}: {e}")
+                if e.status == 401:
+                    txt = _("Your leaderboard needs to be set to public!")
+                elif e.status == 429:
+                    txt = _("The API is rate limiting too heavily! Run the command again later to resume the import.")
+                else:
+                    txt = e.message or _("No data found!")
+                await msg.edit(content=txt)
+                return None
+        if result.resumed:
+            await ctx.send(_("Resumed from `{}` pages fetched by an earlier attempt").format(result.resumed))
+        return importer, result
+
+    async def finish_import(
+        self,
+        ctx: commands.Context,
+        msg: discord.Message,
+        importer: LeaderboardImporter,
+        users: Dict[str, dict],
+        replace: bool,
+        by_level: bool = False,
+        skipped: int = 0,
+        name: str = "",
+    ):
+        imported = self.merge_import(ctx.guild.id, users, replace, by_level)
+        importer.finish()
+        if not imported and not skipped:
+            return await msg.edit(content=_("No {} stats were found").format(name))
+        txt = _("Imported {} User(s)").format(str(imported))
+        if skipped:
+            txt += _(" ({} skipped since they are no longer in the discord)").format(str(skipped))
+        await msg.edit(content=txt)
+        self.reset_ranks(ctx.guild.id)
+        self.relevel(ctx.guild)
+        await ctx.tick()
+        await self.save_cache(ctx.guild)
 
     @admin_group.command(name="importmee6")
     @commands.guildowner()
@@ -1584,6 +2255,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         `all_users` - (True/False) if True, import ALL users regardless of if they are still in the server
         `i_agree` - (Yes/No) Just an extra option to make sure you want to execute this command
 
+        If the import gets interrupted, running it again picks up where it left off.
+
         **Note**
         Instead of typing true/false
         1 = True
@@ -1593,119 +2266,39 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             return await ctx.send(_("Not importing MEE6 levels"))
 
         msg = await ctx.send(_("Fetching mee6 leaderboard data, this could take a while..."))
+        fetched = await self.fetch_leaderboard(ctx, msg, MEE6Source(ctx.guild.id))
+        if not fetched:
+            return
+        importer, result = fetched
+        meta, players = result.meta, result.users
 
-        conf = self.data[ctx.guild.id]
-        base = conf["base"]
-        exp = conf["exp"]
-
-        pages = math.ceil(len(ctx.guild.members) / 1000)
-        players: List[dict] = []
-        failed_pages = 0
-        settings_imported = False
-
-        async with ctx.typing():
-            async for i in AsyncIter(range(pages), delay=5):
-                try:
-                    data, status = await self.fetch_mee6_payload(ctx.guild.id, i)
-                except Exception as e:
-                    log.warning(
-                        f"Failed to import page {i} of mee6 leaderboard data in {ctx.guild}",
-                        exc_info=e,
-                    )
-                    await ctx.send(f"Failed to import page {i} of mee6 leaderboard data: {e}")
-                    failed_pages += 1
-                    if isinstance(e, json.JSONDecodeError):
-                        await msg.edit(content=_("Mee6 is rate limiting too heavily! Import Failed!"))
-                        return
-                    continue
-
-                error = data.get("error", {})
-                error_msg = error.get("message", None)
-                if status != 200:
-                    if status == 401:
-                        return await ctx.send(_("Your leaderboard needs to be set to public!"))
-                    elif error_msg:
-                        return await ctx.send(error_msg)
-                    else:
-                        return await ctx.send(_("No data found!"))
-
-                if include_settings and not settings_imported:
-                    settings_imported = True
-                    if xp_rate := data.get("xp_rate"):
-                        self.data[ctx.guild.id]["base"] = round(xp_rate * 100)
-
-                    if xp_per_message := data.get("xp_per_message"):
-                        self.data[ctx.guild.id]["xp"] = xp_per_message
-
-                    if role_rewards := data.get("role_rewards"):
-                        for entry in role_rewards:
-                            level_requirement = entry["rank"]
-                            role_id = entry["role"]["id"]
-                            self.data[ctx.guild.id]["levelroles"][str(level_requirement)] = int(role_id)
-                    await ctx.send("Settings imported!")
+        if include_settings and meta:
+            if xp_rate := meta.get("xp_rate"):
+                self.data[ctx.guild.id]["base"] = round(xp_rate * 100)
 
-                player_data = data.get("players")
-                if not player_data:
-                    break
+            if xp_per_message := meta.get("xp_per_message"):
+                self.data[ctx.guild.id]["xp"] = xp_per_message
 
-                players.extend(player_data)
+            if role_rewards := meta.get("role_rewards"):
+                for entry in role_rewards:
+                    level_requirement = entry["rank"]
+                    role_id = entry["role"]["id"]
+                    self.data[ctx.guild.id]["levelroles"][str(level_requirement)] = int(role_id)
+            await ctx.send("Settings imported!")
 
-        if failed_pages:
-            await ctx.send(
-                _("{} pages failed to fetch from mee6 api, check logs for more info").format(str(failed_pages))
-            )
         if not players:
-            return await ctx.send(_("No leaderboard data found!"))
+            return await msg.edit(content=_("No leaderboard data found!"))
 
         await msg.edit(content=_("Data retrieved, importing..."))
-        imported = 0
-        failed = 0
-        async with ctx.typing():
-            async for user in AsyncIter(players):
-                uid = str(user["id"])
-                if not all_users:
-                    member = ctx.guild.get_member(int(uid)) or self.bot.get_user(int(uid))
-                    if not member:
-                        failed += 1
-                        continue
-
-                lvl = user["level"]
-                xp = user["xp"]
-                if uid not in self.data[ctx.guild.id]["users"]:
-                    self.init_user(ctx.guild.id, uid)
-
-                if replace:  # Replace stats
-                    if "l" in import_by.lower():
-                        self.data[ctx.guild.id]["users"][uid]["level"] = lvl
-                        newxp = get_xp(lvl, base, exp)
-                        self.data[ctx.guild.id]["users"][uid]["xp"] = newxp
-                    else:
-                        self.data[ctx.guild.id]["users"][uid]["xp"] = xp
-                        newlvl = get_level(xp, base, exp)
-                        self.data[ctx.guild.id]["users"][uid]["level"] = newlvl
-                    self.data[ctx.guild.id]["users"][uid]["messages"] = user["message_count"]
-                else:  # Add stats
-                    if "l" in import_by.lower():
-                        self.data[ctx.guild.id]["users"][uid]["level"] += lvl
-                        newxp = get_xp(self.data[ctx.guild.id]["users"][uid]["level"], base, exp)
-                        self.data[ctx.guild.id]["users"][uid]["xp"] = newxp
-                    else:
-                        self.data[ctx.guild.id]["users"][uid]["xp"] += xp
-                        newlvl = get_level(self.data[ctx.guild.id]["users"][uid]["xp"], base, exp)
-                        self.data[ctx.guild.id]["users"][uid]["level"] = newlvl
-                    self.data[ctx.guild.id]["users"][uid]["messages"] += user["message_count"]
-
-                imported += 1
-
-        if not imported and not failed:
-            await msg.edit(content=_("No MEE6 stats were found"))
-        else:
-            txt = _("Imported {} User(s)").format(str(imported))
-            if failed:
-                txt += _(" ({} skipped since they are no longer in the discord)").format(str(failed))
-            await msg.edit(content=txt)
-            await ctx.tick()
-            await self.save_cache(ctx.guild)
+        users = {}
+        skipped = 0
+        for uid, stats in players.items():
+            if not all_users and not (ctx.guild.get_member(int(uid)) or self.bot.get_user(int(uid))):
+                skipped += 1
+                continue
+            users[uid] = stats
+        by_level = "l" in import_by.lower()
+        await self.finish_import(ctx, msg, importer, users, replace, by_level, skipped, "MEE6")
 
     @admin_group.command(name="importamari")
     @commands.guildowner()
@@ -1724,6 +2317,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         `i_agree` - (Yes/No) Just an extra option to make sure you want to execute this command
         `api_key` - Your [AmariBot API Key](https://docs.google.com/forms/d/e/1FAIpQLScQDCsIqaTb1QR9BfzbeohlUJYA3Etwr-iSb0CRKbgjA-fq7Q/viewform?usp=send_form)
 
+        If the import gets interrupted, running it again picks up where it left off.
+
         **Note**
         Instead of typing true/false
         1 = True
@@ -1734,118 +2329,22 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
 
         msg = await ctx.send(_("Fetching AmariBot leaderboard data, this could take a while..."))
 
-        conf = self.data[ctx.guild.id]
-        base = conf["base"]
-        exp = conf["exp"]
-
-        pages = math.ceil(len(ctx.guild.members) / 1000)
-        players: List[dict] = []
-        failed_pages = 0
-
         with contextlib.suppress(discord.Forbidden, discord.HTTPException):
             await ctx.message.delete()
 
-        async with ctx.typing():
-            async for i in AsyncIter(range(pages), delay=5):
-                try:
-                    data, status = await self.fetch_amari_payload(ctx.guild.id, i, api_key)
-                except Exception as e:
-                    log.warning(
-                        f"Failed to import page {i} of AmariBot leaderboard data in {ctx.guild}",
-                        exc_info=e,
-                    )
-                    await ctx.send(f"Failed to import page {i} of AmariBot leaderboard data: {e}")
-                    failed_pages += 1
-                    if isinstance(e, json.JSONDecodeError):
-                        await msg.edit(content=_("AmariBot is rate limiting too heavily! Import Failed!"))
-                        return
-                    continue
-
-                error_msg = data.get("error", None)
-                if status == 501:
-                    # No more users
-                    break
-
-                if status != 200:
-                    if error_msg:
-                        return await ctx.send(error_msg)
-                    else:
-                        return await ctx.send(_("No data found!"))
-
-                player_data = data.get("data")
-                if not player_data:
-                    break
-
-                players.extend(player_data)
-
-        if failed_pages:
-            await ctx.send(
-                _("{} pages failed to fetch from AmariBot api, check logs for more info").format(str(failed_pages))
-            )
+        fetched = await self.fetch_leaderboard(ctx, msg, AmariSource(ctx.guild.id, api_key))
+        if not fetched:
+            return
+        importer, result = fetched
+        players = result.users
         if not players:
-            return await ctx.send(_("No leaderboard data found!"))
+            return await msg.edit(content=_("No leaderboard data found!"))
 
         await msg.edit(content=_("Data retrieved, importing..."))
-        imported = 0
-        failed = 0
-        async with ctx.typing():
-            async for user in AsyncIter(players):
-                uid = user["id"]
-                # username = user["username"]
-                xp = user["exp"]
-                lvl = user["level"]
-                weekly_exp = user["weeklyExp"]
-
-                member = ctx.guild.get_member(int(uid))
-                if not member:
-                    failed += 1
-                    continue
-
-                if uid not in self.data[ctx.guild.id]["users"]:
-                    self.init_user(ctx.guild.id, uid)
-
-                weekly_on = self.data[ctx.guild.id]["weekly"]["on"]
-
-                if weekly_on and uid not in self.data[ctx.guild.id]["weekly"]["users"]:
-                    self.init_user_weekly(ctx.guild.id, uid)
-
-                if replace:  # Replace stats
-                    if "l" in import_by.lower():
-                        self.data[ctx.guild.id]["users"][uid]["level"] = lvl
-                        newxp = get_xp(lvl, base, exp)
-                        self.data[ctx.guild.id]["users"][uid]["xp"] = newxp
-                    else:
-                        self.data[ctx.guild.id]["users"][uid]["xp"] = xp
-                        newlvl = get_level(xp, base, exp)
-                        self.data[ctx.guild.id]["users"][uid]["level"] = newlvl
-
-                    if weekly_on:
-                        self.data[ctx.guild.id]["weekly"]["users"][uid]["xp"] = weekly_exp
-
-                else:  # Add stats
-                    if "l" in import_by.lower():
-                        self.data[ctx.guild.id]["users"][uid]["level"] += lvl
-                        newxp = get_xp(self.data[ctx.guild.id]["users"][uid]["level"], base, exp)
-                        self.data[ctx.guild.id]["users"][uid]["xp"] = newxp
-                    else:
-                        self.data[ctx.guild.id]["users"][uid]["xp"] += xp
-                        newlvl = get_level(self.data[ctx.guild.id]["users"][uid]["xp"], base, exp)
-                        self.data[ctx.guild.id]["users"][uid]["level"] = newlvl
-
-                    if weekly_on:
-                        self.data[ctx.guild.id]["weekly"]["users"][uid]["xp"] += weekly_exp
-
-                imported += 1
-
-        if not imported and not failed:
-            await msg.edit(content=_("No AmariBot stats were found"))
-        else:
-            txt = _("Imported {} User(s)").format(str(imported))
-            if failed:
-                txt += _(" ({} skipped since they are no longer in the discord)").format(str(failed))
-            await msg.edit(content=txt)
-            await ctx.tick()
-            await self.save_cache(ctx.guild)
+        users = {uid: stats for uid, stats in players.items() if ctx.guild.get_member(int(uid))}
+        by_level = "l" in import_by.lower()
+        skipped = len(players) - len(users)
+        await self.finish_import(ctx, msg, importer, users, replace, by_level, skipped, "AmariBot")
 
     @admin_group.command(name="importpolaris")
     @commands.guildowner()
@@ -1867,6 +2366,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         `include_settings` - (True/False) import level roles and exp settings from Polaris
         `i_agree` - (Yes/No) Just an extra option to make sure you want to execute this command
 
+        If the import gets interrupted, running it again picks up where it left off.
+
         **Note**
         Instead of typing true/false
         1 = True
@@ -1876,110 +2377,38 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             return await ctx.send(_("Not importing Polaris levels"))
 
         msg = await ctx.send(_("Fetching Polaris leaderboard data, this could take a while..."))
+        fetched = await self.fetch_leaderboard(ctx, msg, PolarisSource(ctx.guild.id))
+        if not fetched:
+            return
+        importer, result = fetched
+        meta, players = result.meta, result.users
 
-        conf = self.data[ctx.guild.id]
-        base = conf["base"]
-        exp = conf["exp"]
-
-        players: List[dict] = []
-        failed_pages = 0
-        settings_imported = False
-
-        async with ctx.typing():
-            async for i in AsyncIter(range(10), delay=5):
-                page = i + 1
-                try:
-                    data, status = await self.fetch_polaris_payload(ctx.guild.id, page)
-                except Exception as e:
-                    log.warning(
-                        f"Failed to import page {page} of Polaris leaderboard data in {ctx.guild}",
-                        exc_info=e,
-                    )
-                    await ctx.send(f"Failed to import page {page} of Polaris leaderboard data: {e}")
-                    failed_pages += 1
-                    if isinstance(e, json.JSONDecodeError):
-                        await msg.edit(content=_("Polaris is rate limiting too heavily! Import Failed!"))
-                        return
-                    continue
-
-                error = data.get("error", {})
-                error_msg = error.get("message", None)
-                if status != 200:
-                    if status == 401:
-                        return await ctx.send(_("Your leaderboard needs to be set to public!"))
-                    elif error_msg:
-                        return await ctx.send(error_msg)
-                    else:
-                        return await ctx.send(_("No data found!"))
-
-                if include_settings and not settings_imported:
-                    settings_imported = True
-                    if settings := data.get("settings"):
-                        if gain := settings.get("gain"):
-                            self.data[ctx.guild.id]["xp"] = [gain["min"], gain["max"]]
-                            self.data[ctx.guild.id]["cooldown"] = gain["time"]
-
-                        if curve := settings.get("curve"):
-                            # The cubic curve doesn't translate to quadratic easily, so we won't import this
-                            # cubed = curve["3"]
-                            # squared = curve["2"]
-                            # base = curve["1"]
-                            self.data[ctx.guild.id]["base"] = curve["1"]
-
-                    if role_rewards := data.get("rewards"):
-                        for entry in role_rewards:
-                            self.data[ctx.guild.id]["levelroles"][str(entry["level"])] = int(entry["id"])
+        if include_settings and meta:
+            if settings := meta.get("settings"):
+                if gain := settings.get("gain"):
+                    self.data[ctx.guild.id]["xp"] = [gain["min"], gain["max"]]
+                    self.data[ctx.guild.id]["cooldown"] = gain["time"]
 
-                    await ctx.send("Settings imported!")
+                if curve := settings.get("curve"):
+                    # The cubic curve doesn't translate to quadratic easily, so we won't import this
+                    # cubed = curve["3"]
+                    # squared = curve["2"]
+                    # base = curve["1"]
+                    self.data[ctx.guild.id]["base"] = curve["1"]
 
-                player_data = data.get("leaderboard")
-                if not player_data:
-                    break
+            if role_rewards := meta.get("rewards"):
+                for entry in role_rewards:
+                    self.data[ctx.guild.id]["levelroles"][str(entry["level"])] = int(entry["id"])
 
-                players.extend(player_data)
+            await ctx.send("Settings imported!")
 
-        if failed_pages:
-            await ctx.send(
-                _("{} pages failed to fetch from Polaris api, check logs for more info").format(str(failed_pages))
-            )
         if not players:
-            return await ctx.send(_("No leaderboard data found!"))
+            return await msg.edit(content=_("No leaderboard data found!"))
 
         await msg.edit(content=_("Data retrieved, importing..."))
-        imported = 0
-        failed = 0
-        async with ctx.typing():
-            async for user in AsyncIter(players):
-                uid = str(user["id"])
-                member = ctx.guild.get_member(int(uid))
-                if not member:
-                    failed += 1
-                    continue
-
-                xp = user["xp"]
-                if uid not in self.data[ctx.guild.id]["users"]:
-                    self.init_user(ctx.guild.id, uid)
-
-                if replace:  # Replace stats
-                    self.data[ctx.guild.id]["users"][uid]["xp"] = xp
-                    newlvl = get_level(xp, base, exp)
-                    self.data[ctx.guild.id]["users"][uid]["level"] = newlvl
-                else:  # Add stats
-                    self.data[ctx.guild.id]["users"][uid]["xp"] += xp
-                    newlvl = get_level(self.data[ctx.guild.id]["users"][uid]["xp"], base, exp)
-                    self.data[ctx.guild.id]["users"][uid]["level"] = newlvl
-
-                imported += 1
-
-        if not imported and not failed:
-            await msg.edit(content=_("No Polaris stats were found"))
-        else:
-            txt = _("Imported {} User(s)").format(str(imported))
-            if failed:
-                txt += _(" ({} skipped since they are no longer in the discord)").format(str(failed))
-            await msg.edit(content=txt)
-            await ctx.tick()
-            await self.save_cache(ctx.guild)
+        users = {uid: stats for uid, stats in players.items() if ctx.guild.get_member(int(uid))}
+        skipped = len(players) - len(users)
+        await self.finish_import(ctx, msg, importer, users, replace, False, skipped, "Polaris")
 
     @admin_group.command(name="importfixator")
     @commands.is_owner()
@@ -2058,7 +2487,10 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             min_message_length = global_config.get("message_length", 0)
             mention = global_config.get("mention", False)
             xp_range = global_config.get("xp", [1, 5])
+            await self.load_guilds(self.bot.guilds)
             for guild in self.bot.guilds:
+                if guild.id not in self.data:
+                    continue
                 guild_id = str(guild.id)
                 ignored_channels = guild_config.get(str(guild.id), {}).get("ignored_channels", [])
                 self.data[guild.id]["ignoredchannels"] = ignored_channels
@@ -2075,34 +2507,21 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
                         level_req = data["level"]
                         self.data[guild.id]["levelroles"][level_req] = role.id
 
-                for user in guild.members:
-                    user_id = str(user.id)
+                # Look members up a chunk at a time rather than one query each
+                member_ids = [str(user.id) for user in guild.members]
+                users = {}
+                for i in range(0, len(member_ids), 1000):
+                    query = {"user_id": {"$in": member_ids[i : i + 1000]}}
                     try:
-                        userinfo = await self.db.users.find_one({"user_id": user_id})
+                        async for userinfo in self.db.users.find(query):
+                            stats = {"stars": int(userinfo["rep"]) if userinfo["rep"] else 0}
+                            # Import levels
+                            if level := userinfo["servers"].get(guild_id, {}).get("level"):
+                                stats["level"] = int(level)
+                            users[userinfo["user_id"]] = stats
                     except Exception as e:
-                        log.info(f"No data found for {user.name}: {e}")
-                        continue
-                    if not userinfo:
-                        continue
-                    if user_id not in self.data[guild.id]["users"]:
-                        self.init_user(guild.id, user_id)
-                    servers = userinfo["servers"]
-
-                    # Import levels
-                    if guild_id in servers:
-                        level = servers[guild_id]["level"]
-                    else:
-                        level = None
-                    if level:
-                        base = self.data[guild.id]["base"]
-                        exp = self.data[guild.id]["exp"]
-                        xp = get_xp(level, base, exp)
-                        self.data[guild.id]["users"][user_id]["level"] = int(level)
-                        self.data[guild.id]["users"][user_id]["xp"] = xp
-
-                    # Import rep
-                    self.data[guild.id]["users"][user_id]["stars"] = int(userinfo["rep"]) if userinfo["rep"] else 0
-                    users_imported += 1
+                        log.info(f"Failed to fetch Leveler users for {guild}: {e}")
+                users_imported += self.merge_import(guild.id, users, replace=True, by_level=True)
 
             embed = discord.Embed(
                 description=_("Importing Complete!\n") + f"{users_imported}" + _(" users imported"),
@@ -2110,6 +2529,11 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             )
             embed.set_thumbnail(url=self.loading)
             await msg.edit(embed=embed)
+            for guild in self.bot.guilds:
+                if guild.id not in self.data:
+                    continue
+                self.reset_ranks(guild.id)
+                self.relevel(guild)
             self._disconnect_mongo()
 
     def _disconnect_mongo(self):
@@ -2135,6 +2559,7 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         for uid in cleanup:
             del self.data[ctx.guild.id]["users"][uid]
             cleaned += 1
+        self.reset_ranks(ctx.guild.id)
         # cleaned_data, newdat = self.cleanup(self.data[ctx.guild.id].copy())
         if not cleanup and not cleaned:
             return await ctx.send(_("Nothing to clean"))
@@ -2424,6 +2849,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
             if uid not in self.data[gid]["users"]:
                 self.init_user(gid, uid)
             self.data[gid]["users"][uid]["xp"] += xp
+            self.mark_dirty(gid, uid)
+            self.update_rank(gid, uid)
             txt = str(xp) + _("xp has been added to ") + user_or_role.name
             await ctx.send(txt)
         else:
@@ -2437,6 +2864,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
                 if uid not in self.data[gid]["users"]:
                     self.init_user(gid, uid)
                 self.data[gid]["users"][uid]["xp"] += xp
+                self.mark_dirty(gid, uid)
+                self.update_rank(gid, uid)
             txt = _("Added ") + str(xp) + _(" xp to ") + humanize_number(len(users)) + _(" users that had the ")
             txt += user_or_role.name + _("role")
             await ctx.send(txt)
@@ -2455,6 +2884,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         xp = get_xp(int(level), base, exp)
         conf["users"][uid]["level"] = int(level)
         conf["users"][uid]["xp"] = xp
+        self.mark_dirty(ctx.guild.id, uid)
+        self.update_rank(ctx.guild.id, uid)
         txt = _("User ") + user.name + _(" is now level ") + str(level)
         await ctx.send(txt)
 
@@ -2478,6 +2909,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         emoji = prestige_data[p]["emoji"]
         self.data[ctx.guild.id]["users"][uid]["prestige"] = int(prestige)
         self.data[ctx.guild.id]["users"][uid]["emoji"] = emoji
+        self.mark_dirty(ctx.guild.id, uid)
+        self.update_rank(ctx.guild.id, uid)
         await ctx.tick()
         await self.save_cache(ctx.guild)
 
@@ -2494,6 +2927,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         Affects leveling on a more linear scale(higher values makes leveling take longer)
         """
         self.data[ctx.guild.id]["base"] = base_multiplier
+        self.reset_ranks(ctx.guild.id)
+        self.relevel(ctx.guild)
         await ctx.tick()
         await self.save_cache(ctx.guild)
 
@@ -2509,6 +2944,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         if exponent_multiplier > 10:
             return await ctx.send(_("Your exponent needs to be 10 or lower"))
         self.data[ctx.guild.id]["exp"] = exponent_multiplier
+        self.reset_ranks(ctx.guild.id)
+        self.relevel(ctx.guild)
         await ctx.tick()
         await self.save_cache(ctx.guild)
 
@@ -2579,15 +3016,11 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         cd = conf["cooldown"]
         xp_range = conf["xp"]
         txt = ""
-        x = []
-        y = []
-        for level in range(1, 21):
-            xp = get_xp(level, base, exp)
-            time = time_to_level(level, base, exp, cd, xp_range)
-            time = time_formatter(time)
-            txt += _("- lvl {}, {} xp, {}\n").format(level, xp, time)
-            x.append(level)
-            y.append(xp)
+        x = list(range(1, 21))
+        y = get_curve(base, exp).xp(x).tolist()
+        times = time_to_levels(x, base, exp, cd, xp_range)
+        for level, xp, time in zip(x, y, times):
+            txt += _("- lvl {}, {} xp, {}\n").format(level, xp, time_formatter(time))
         return txt, x, y
 
     @perf(max_entries=1000)
@@ -2750,8 +3183,6 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         perms = guild.me.guild_permissions.manage_roles
         if not perms:
             return await ctx.send(_("I dont have the proper permissions to manage roles!"))
-        roles_added = 0
-        roles_removed = 0
         embed = discord.Embed(
             description=_("Calculating roles, this may take a while..."),
             color=discord.Color.magenta(),
@@ -2759,116 +3190,23 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         embed.set_thumbnail(url=self.loading)
         msg = await ctx.send(embed=embed)
 
-        to_add: Dict[discord.Member, Set[discord.Role]] = {}
-        to_remove: Dict[discord.Member, Set[discord.Role]] = {}
-
-        conf = self.data[ctx.guild.id]
-        level_roles = conf["levelroles"]
-        prestiges = conf["prestigedata"]
-        autoremove = conf["autoremove"]
-        users = [i for i in conf["users"]]
-        for user_id in users:
-            user = guild.get_member(int(user_id))
-            if not user:
-                continue
-            to_add[user] = set()
-            to_remove[user] = set()
-
-            data = conf["users"][user_id]
-            user_level = data["level"]
-            prestige_level = data["prestige"]
-            if autoremove:
-                highest_level = 0
-                for level, role_id in level_roles.items():
-                    if int(user_level) >= int(level) >= highest_level:
-                        highest_level = int(level)
-
-                if highest_level:
-                    role_id = level_roles[str(highest_level)]
-                    if role := guild.get_role(role_id):
-                        to_add[user].add(role)
-                        for user_role in user.roles:
-                            if user_role.id in level_roles.values() and user_role.id != role.id:
-                                to_remove[user].add(user_role)
-
-                highest_prestige = 0
-                for prestige_level_requirement in prestiges:
-                    if int(prestige_level) >= int(prestige_level_requirement) >= highest_prestige:
-                        highest_prestige = int(prestige_level_requirement)
-
-                if highest_prestige:
-                    prestige_role_ids = [i["role"] for i in prestiges.values()]
-                    role_id = prestiges[str(highest_prestige)]
-                    if role := guild.get_role(role_id):
-                        to_add[user].add(role)
-                        for user_role in user.roles:
-                            if user_role.id in prestige_role_ids and user_role.id != role.id:
-                                to_remove[user].add(user_role)
-
-            else:
-                user_role_ids = [role.id for role in user.roles]
-                for lvl, role_id in level_roles.items():
-                    if role := guild.get_role(int(role_id)):
-                        if int(lvl) <= int(user_level) and role.id not in user_role_ids:
-                            to_add[user].add(role)
-
-                for lvl, prestige in prestiges.items():
-                    if role := guild.get_role(int(prestige["role"])):
-                        if int(lvl) <= int(prestige_level) and role.id not in user_role_ids:
-                            to_add[user].add(role)
-
-        embed.description = _("Assigning roles, this may take a while...")
-        await msg.edit(embed=embed)
-
-        add_fails = 0
-        remove_fails = 0
-        async with ctx.typing():
-            bot_top_role = max(role for role in guild.me.roles)
-            for user, adding in to_add.items():
-                removing = to_remove[user]
-
-                # Update what can actually be assigned/removed
-                adding = [role for role in adding if role < bot_top_role]
-                removing = [role for role in removing if role < bot_top_role]
-
-                for role in removing:
-                    if role in adding and role in user.roles:
-                        adding.discard(role)
-
-                for role in adding:
-                    if role in removing and role not in user.roles:
-                        removing.discard(role)
-
-                try:
-                    await user.add_roles(*adding)
-                    roles_added += len(adding)
-                except discord.Forbidden:
-                    log.warning(
-                        f"Failed to assign the following roles to {user} in {guild}: {humanize_list([r.name for r in adding])}"
-                    )
-                    add_fails += len(adding)
-
-                try:
-                    await user.remove_roles(*removing)
-                    roles_removed += len(removing)
-                except discord.Forbidden:
-                    log.warning(
-                        f"Failed to remove the following roles from {user} in {guild}: {humanize_list([r.name for r in removing])}"
-                    )
-                    remove_fails += len(removing)
+        queued = self.sync_level_roles(guild, list(self.data[guild.id]["users"]))
+        # Wait on the role sync worker, it paces itself around the guild's rate limits
+        last = None
+        while progress := self.role_sync.get_progress(guild.id):
+            if progress != last:
+                last = progress
+                embed.description = _("Assigning roles, this may take a while...\n`{}/{}` members updated").format(
+                    *progress
+                )
+                with contextlib.suppress(discord.HTTPException):
+                    await msg.edit(embed=embed)
+            await asyncio.sleep(5)
 
         desc = _("Role initialization completed!")
-        if roles_added:
-            desc += _("\nAdded `{}`").format(roles_added)
-            if add_fails:
-                desc += _(" (`{}` failed)").format(add_fails)
-
-        if roles_removed:
-            desc += _("\nRemoved `{}`").format(roles_removed)
-            if remove_fails:
-                desc += _(" (`{}` failed)").format(remove_fails)
-
-        if not roles_added and not roles_removed:
+        if queued:
+            desc += _("\nUpdated roles for `{}` members").format(queued)
+        else:
             desc += _("\nNo roles needed to be added or removed!")
 
         embed = discord.Embed(description=desc, color=discord.Color.green())
@@ -2931,6 +3269,7 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         Set to 0 to disable prestige
         """
         self.data[ctx.guild.id]["prestige"] = level
+        self.reset_ranks(ctx.guild.id)
         await ctx.tick()
         await self.save_cache(ctx.guild)
 
@@ -3267,6 +3606,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         level = level + 1
         xp = get_xp(level, base, exp)
         self.data[gid]["users"][uid]["xp"] = xp
+        self.mark_dirty(gid, uid)
+        self.update_rank(gid, uid)
         await asyncio.sleep(2)
         txt = _("Forced ") + person.name + _(" to level up!")
         await ctx.send(txt)
@@ -3292,6 +3633,8 @@ class LevelUp(UserCommands, Generator, commands.Cog, metaclass=CompositeMetaClas
         level = level - 1
         xp = get_xp(level, base, exp)
         self.data[gid]["users"][uid]["xp"] = xp
+        self.mark_dirty(gid, uid)
+        self.update_rank(gid, uid)
         await asyncio.sleep(2)
         txt = _("Forced ") + person.name + _(" to level down!")
         await ctx.send(txt)
@@ -0,0 +1,183 @@
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+STATS = ("xp", "messages", "voice", "stars")
+# Hours of history kept, enough for any window up to a month
+RING_HOURS = 24 * 35
+WINDOW_REGEX = re.compile(r"^(\d+)\s*(h|d|w)[a-z]*$", re.IGNORECASE)
+WINDOW_HOURS = {"h": 1, "d": 24, "w": 168}
+
+Snapshot = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, int]
+
+
+def current_hour(now: Optional[float] = None) -> int:
+    return int((time.time() if now is None else now) // 3600)
+
+
+def hours_since(timestamp: float, now: Optional[float] = None) -> int:
+    """Hours in a window starting at the hour `timestamp` falls in, capped to the history kept"""
+    return max(1, min(current_hour(now) - current_hour(timestamp) + 1, RING_HOURS))
+
+
+def parse_window(window: str) -> Optional[int]:
+    """Hours in a window like `24h`, `7d` or `2w`, None if it can't be read or is longer than the history kept"""
+    if window.lower() in ("month", "monthly"):
+        return 24 * 30
+    if window.lower() in ("today", "day", "daily"):
+        return 24
+    match = WINDOW_REGEX.match(window.strip())
+    if not match:
+        return None
+    hours = int(match.group(1)) * WINDOW_HOURS[match.group(2).lower()]
+    if not 0 < hours <= RING_HOURS:
+        return None
+    return hours
+
+
+class ActivityLog:
+    """
+    Hourly activity of a guild's users kept in a ring of RING_HOURS buckets
+
+    The open hour collects counts in a dict keyed by user row. When the hour rolls over it is sealed into a pair of
+    arrays (user rows, float32 counts per stat) in its ring slot, overwriting whatever hour held that slot before.
+    Memory scales with active user-hours rather than users times hours, and a window leaderboard is one bincount
+    per stat over the buckets in range.
+    """
+
+    __slots__ = ("users", "rows", "hours", "buckets", "hour", "current", "since")
+
+    def __init__(self, now: Optional[float] = None):
+        self.users: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.hours = np.full(RING_HOURS, -1, dtype=np.int64)
+        self.buckets: List[Optional[Tuple[np.ndarray, np.ndarray]]] = [None] * RING_HOURS
+        self.hour = current_hour(now)
+        self.current: Dict[int, List[float]] = {}
+        self.since = self.hour  # First hour this log has been recording
+
+    def row(self, uid: str) -> int:
+        row = self.rows.get(uid)
+        if row is None:
+            row = self.rows[uid] = len(self.users)
+            self.users.append(uid)
+        return row
+
+    def add(self, uid: str, xp: float = 0, messages: int = 0, voice: float = 0, stars: int = 0):
+        hour = current_hour()
+        if hour > self.hour:
+            self.roll(hour)
+        row = self.row(uid)
+        counts = self.current.get(row)
+        if counts is None:
+            self.current[row] = [xp, messages, voice, stars]
+            return
+        counts[0] += xp
+        counts[1] += messages
+        counts[2] += voice
+        counts[3] += stars
+
+    def roll(self, hour: int):
+        self.seal()
+        self.hour = hour
+        self.current = {}
+
+    def seal(self):
+        if not self.current:
+            return
+        rows = np.fromiter(self.current.keys(), dtype=np.int32, count=len(self.current))
+        values = np.array(list(self.current.values()), dtype=np.float32)
+        slot = self.hour % RING_HOURS
+        self.hours[slot] = self.hour
+        self.buckets[slot] = (rows, values)
+
+    def covers(self, hours: int) -> bool:
+        """Whether the log has been recording for the whole window"""
+        return self.since <= current_hour() - hours + 1
+
+    def totals(self, hours: int) -> np.ndarray:
+        """(users, stats) sums over the last `hours` hours, the current hour included"""
+        hour = current_hour()
+        if hour > self.hour:
+            self.roll(hour)
+        start = hour - hours + 1
+        size = len(self.users)
+        out = np.zeros((size, len(STATS)), dtype=np.float64)
+        slots = np.flatnonzero((self.hours >= start) & (self.hours < self.hour))
+        parts = [self.buckets[i] for i in slots.tolist() if self.buckets[i] is not None]
+        if parts:
+            rows = np.concatenate([i[0] for i in parts])
+            values = np.concatenate([i[1] for i in parts])
+            for col in range(len(STATS)):
+                out[:, col] = np.bincount(rows, weights=values[:, col], minlength=size)
+        if self.current and self.hour >= start:
+            rows = np.fromiter(self.current.keys(), dtype=np.int64, count=len(self.current))
+            out[rows] += np.array(list(self.current.values()), dtype=np.float64)
+        return out
+
+    def leaderboard(self, hours: int, stat: str) -> List[Tuple[str, float]]:
+        """(user ID, value) of everyone with activity for a stat in the window"""
+        values = self.totals(hours)[:, STATS.index(stat)]
+        return [(self.users[i], float(values[i])) for i in np.flatnonzero(values).tolist()]
+
+    def stats(self, hours: int) -> Dict[str, Dict[str, float]]:
+        """Stats of everyone with any activity in the window, keyed by user ID like the user table"""
+        totals = self.totals(hours)
+        out = {}
+        for i in np.flatnonzero(totals.any(axis=1)).tolist():
+            xp, messages, voice, stars = totals[i].tolist()
+            out[self.users[i]] = {"xp": xp, "messages": int(messages), "voice": voice, "stars": int(stars)}
+        return out
+
+    def snapshot(self) -> Snapshot:
+        """Flatten every bucket and the open hour into arrays, cheap enough to run on the event loop"""
+        users = np.array(self.users, dtype=str)
+        parts = [(int(self.hours[i]), b) for i, b in enumerate(self.buckets) if b is not None]
+        if self.current:
+            rows = np.fromiter(self.current.keys(), dtype=np.int32, count=len(self.current))
+            parts.append((self.hour, (rows, np.array(list(self.current.values()), dtype=np.float32))))
+        if not parts:
+            empty = np.zeros(0, dtype=np.int32)
+            return users, empty, empty.astype(np.int64), np.zeros((0, len(STATS)), dtype=np.float32), self.since
+        hours = np.concatenate([np.full(len(b[0]), h, dtype=np.int64) for h, b in parts])
+        rows = np.concatenate([b[0] for _, b in parts])
+        values = np.concatenate([b[1] for _, b in parts])
+        return users, rows, hours, values, self.since
+
+    @staticmethod
+    def write(path: Path, snapshot: Snapshot):
+        users, rows, hours, values, since = snapshot
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            np.savez(f, users=users, rows=rows, hours=hours, values=values, since=np.int64(since))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "ActivityLog":
+        log = cls()
+        with np.load(path) as f:
+            users, rows, hours, values = f["users"], f["rows"], f["hours"], f["values"]
+            log.since = int(f["since"])
+        keep = hours > log.hour - RING_HOURS
+        rows, hours, values = rows[keep], hours[keep], values[keep]
+        # Drop users with nothing left in the ring
+        used, rows = np.unique(rows, return_inverse=True)
+        log.users = users[used].tolist()
+        log.rows = {uid: i for i, uid in enumerate(log.users)}
+        rows = rows.astype(np.int32)
+        order = np.argsort(hours, kind="stable")
+        rows, hours, values = rows[order], hours[order], values[order]
+        bucket_hours, starts = np.unique(hours, return_index=True)
+        ends = np.append(starts[1:], len(hours))
+        for hour, start, end in zip(bucket_hours.tolist(), starts.tolist(), ends.tolist()):
+            if hour == log.hour:
+                log.current = {int(r): v.tolist() for r, v in zip(rows[start:end], values[start:end])}
+                continue
+            slot = hour % RING_HOURS
+            log.hours[slot] = hour
+            log.buckets[slot] = (rows[start:end], values[start:end])
+        return log
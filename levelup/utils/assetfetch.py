@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+from aiohttp import ClientSession, ClientTimeout
+
+log = logging.getLogger("red.vrt.levelup.assetfetch")
+
+# Discord CDN urls contain the asset hash, so the content behind them never changes
+IMMUTABLE_HOSTS = ("cdn.discordapp.com", "media.discordapp.net")
+
+
+class AssetFetcher:
+    """
+    Fetches avatars, banners, role icons and other image urls on a shared session
+
+    Results are cached on disk keyed by url. Discord CDN assets are treated as immutable,
+    anything else is refetched once it is older than `max_age` seconds.
+    Single assets over `max_asset_bytes` are refused and the cache folder is trimmed oldest first
+    once it grows past `max_cache_bytes`.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_asset_bytes: int = 8 * 1024**2,
+        max_cache_bytes: int = 256 * 1024**2,
+        max_age: int = 86400,
+        timeout: int = 15,
+    ):
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(exist_ok=True)
+        self.max_asset_bytes = max_asset_bytes
+        self.max_cache_bytes = max_cache_bytes
+        self.max_age = max_age
+        self.timeout = timeout
+        self.session: Optional[ClientSession] = None
+        self.cache_size: Optional[int] = None
+        self.size_lock = threading.Lock()  # Downloads are stored from worker threads
+        self.hits = 0
+        self.misses = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def get_session(self) -> ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = ClientSession(timeout=ClientTimeout(total=self.timeout))
+        return self.session
+
+    def path(self, url: str) -> Path:
+        return self.cache_dir / hashlib.sha1(url.encode()).hexdigest()
+
+    def is_fresh(self, url: str, path: Path) -> bool:
+        if not path.exists():
+            return False
+        if urlparse(url).hostname in IMMUTABLE_HOSTS:
+            return True
+        return time.time() - path.stat().st_mtime < self.max_age
+
+    async def fetch(self, url: Optional[str]) -> Optional[bytes]:
+        """Get the content of a url from the disk cache, or download it"""
+        if not url or str(url) == "None":
+            return None
+        url = str(url)
+        # Concurrent requests for the same url share one download
+        if url in self._pending:
+            return await asyncio.shield(self._pending[url])
+        future = asyncio.get_running_loop().create_future()
+        self._pending[url] = future
+        try:
+            data = await self._fetch(url)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_result(None)
+            log.error(f"Failed to get image from url: {url}", exc_info=e)
+            return None
+        finally:
+            # Cancelled before it finished, waiters get nothing rather than waiting forever
+            if not future.done():
+                future.set_result(None)
+            del self._pending[url]
+
+    async def fetch_many(self, urls: Iterable[Optional[str]]) -> Dict[str, Optional[bytes]]:
+        """Fetch several urls at once, returning their content keyed by url"""
+        urls = list({str(url) for url in urls if url})
+        results = await asyncio.gather(*(self.fetch(url) for url in urls))
+        return dict(zip(urls, results))
+
+    async def _fetch(self, url: str) -> Optional[bytes]:
+        path = self.path(url)
+        if await asyncio.to_thread(self.is_fresh, url, path):
+            self.hits += 1
+            return await asyncio.to_thread(path.read_bytes)
+
+        self.misses += 1
+        async with self.get_session().get(url) as resp:
+            if resp.status != 200:
+                log.info(f"Got status {resp.status} fetching {url}")
+                return None
+            if resp.content_length and resp.content_length > self.max_asset_bytes:
+                log.info(f"Refusing {url}, it is {resp.content_length} bytes")
+                return None
+            data = bytearray()
+            async for chunk in resp.content.iter_chunked(65536):
+                data.extend(chunk)
+                if len(data) > self.max_asset_bytes:
+                    log.info(f"Refusing {url}, it is over {self.max_asset_bytes} bytes")
+                    return None
+        data = bytes(data)
+        await asyncio.to_thread(self.store, path, data)
+        return data
+
+    def store(self, path: Path, data: bytes):
+        with self.size_lock:
+            if self.cache_size is None:
+                self.cache_size = sum(f.stat().st_size for f in self.cache_dir.iterdir() if f.is_file())
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+            self.cache_size += len(data)
+            if self.cache_size > self.max_cache_bytes:
+                self.trim()
+
+    def trim(self):
+        """Delete the oldest cached assets until the cache is back under 90% of its budget"""
+        files = sorted(
+            (f for f in self.cache_dir.iterdir() if f.is_file()),
+            key=lambda f: f.stat().st_mtime,
+        )
+        size = sum(f.stat().st_size for f in files)
+        target = int(self.max_cache_bytes * 0.9)
+        for file in files:
+            if size <= target:
+                break
+            size -= file.stat().st_size
+            file.unlink(missing_ok=True)
+        self.cache_size = size
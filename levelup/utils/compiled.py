@@ -0,0 +1,47 @@
+import re
+from types import MappingProxyType
+from typing import FrozenSet, Mapping, NamedTuple, Tuple
+
+# Mentions and custom emojis don't count towards the minimum message length
+MENTION_EMOJI_REGEX = re.compile(r"<(@!|#)[0-9]{18}>|<a{0,1}:[a-zA-Z0-9_.]{2,32}:[0-9]{18,19}>")
+
+XPRange = Tuple[int, int]
+
+
+class GuildSettings(NamedTuple):
+    """
+    Read-only view of the guild settings checked for every message
+
+    Built from a guild's config with int IDs in frozensets and int-keyed bonus tables,
+    so the message hot path does set lookups instead of list scans and str() conversions.
+    """
+
+    ignored_roles: FrozenSet[int]
+    ignored_channels: FrozenSet[int]
+    ignored_users: FrozenSet[int]
+    xp: XPRange
+    cooldown: int
+    length: int
+    role_bonuses: Mapping[int, XPRange]
+    channel_bonuses: Mapping[int, XPRange]
+
+    @property
+    def checks_roles(self) -> bool:
+        return bool(self.ignored_roles or self.role_bonuses)
+
+
+def _xp_range(value: list) -> XPRange:
+    return int(value[0]), int(value[1])
+
+
+def compile_settings(conf: dict) -> GuildSettings:
+    return GuildSettings(
+        ignored_roles=frozenset(int(i) for i in conf["ignoredroles"]),
+        ignored_channels=frozenset(int(i) for i in conf["ignoredchannels"]),
+        ignored_users=frozenset(int(i) for i in conf["ignoredusers"]),
+        xp=_xp_range(conf["xp"]),
+        cooldown=conf["cooldown"],
+        length=conf["length"],
+        role_bonuses=MappingProxyType({int(k): _xp_range(v) for k, v in conf["rolebonuses"]["msg"].items()}),
+        channel_bonuses=MappingProxyType({int(k): _xp_range(v) for k, v in conf["channelbonuses"]["msg"].items()}),
+    )
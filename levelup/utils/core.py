@@ -1,9 +1,10 @@
 from __future__ import annotations
 
 import math
+from io import BytesIO
 from typing import (
     TYPE_CHECKING,
-    Dict,
+    List,
     Optional,
     SupportsInt,
     Tuple,
@@ -14,12 +15,10 @@ from typing import (
 
 from PIL import Image, ImageDraw, ImageFont
 
-from .helpers import NodeType, getsize, to_nodes
-from .source import BaseSource, HTTPBasedSource, Twemoji, _has_requests
+from .helpers import Node, NodeType, getsize, to_nodes
+from .source import BaseSource, Twemoji
 
 if TYPE_CHECKING:
-    from io import BytesIO
-
     FontT = Union[ImageFont.ImageFont, ImageFont.FreeTypeFont, ImageFont.TransposedFont]
     ColorT = Union[int, Tuple[int, int, int], Tuple[int, int, int, int], str]
 
@@ -41,8 +40,9 @@ class Pilmoji:
     source: Union[:class:`~.BaseSource`, Type[:class:`~.BaseSource`]]
         The emoji image source to use.
         This defaults to :class:`~.TwitterEmojiSource`.
+        Pass a source instance to share its session between renderers, it is left open when this one closes.
     cache: bool
-        Whether or not to cache emojis given from source.
+        Whether or not to cache emojis given from source in the process-wide :data:`~.emoji_cache`.
         Enabling this is recommended and by default.
     draw: :class:`PIL.ImageDraw.ImageDraw`
         The drawing instance to use. If left unfilled,
@@ -70,6 +70,7 @@ class Pilmoji:
         self.image: Image.Image = image
         self.draw: ImageDraw.ImageDraw = draw
 
+        self._owns_source: bool = isinstance(source, type)
         if isinstance(source, type):
             if not issubclass(source, BaseSource):
                 raise TypeError(f"source must inherit from BaseSource, not {source}.")
@@ -89,9 +90,6 @@ class Pilmoji:
         self._default_emoji_scale_factor: float = emoji_scale_factor
         self._default_emoji_position_offset: Tuple[int, int] = emoji_position_offset
 
-        self._emoji_cache: Dict[str, BytesIO] = {}
-        self._discord_emoji_cache: Dict[int, BytesIO] = {}
-
         self._create_draw()
 
     def open(self) -> None:
@@ -106,11 +104,6 @@ class Pilmoji:
         if not self._closed:
             raise ValueError("Renderer is already open.")
 
-        if _has_requests and isinstance(self.source, HTTPBasedSource):
-            from requests import Session
-
-            self.source._requests_session = Session()
-
         self._create_draw()
         self._closed = False
 
@@ -132,19 +125,6 @@ class Pilmoji:
             del self.draw
             self.draw = None
 
-        if _has_requests and isinstance(self.source, HTTPBasedSource):
-            self.source._requests_session.close()
-
-        if self._cache:
-            for stream in self._emoji_cache.values():
-                stream.close()
-
-            for stream in self._discord_emoji_cache.values():
-                stream.close()
-
-            self._emoji_cache = {}
-            self._discord_emoji_cache = {}
-
         self._closed = True
 
     def _create_draw(self) -> None:
@@ -153,32 +133,38 @@ class Pilmoji:
             self.draw = ImageDraw.Draw(self.image)
 
     def _get_emoji(self, emoji: str, /) -> Optional[BytesIO]:
-        if self._cache and emoji in self._emoji_cache:
-            entry = self._emoji_cache[emoji]
-            entry.seek(0)
-            return entry
-
-        if stream := self.source.get_emoji(emoji):
-            if self._cache:
-                self._emoji_cache[emoji] = stream
-
-            stream.seek(0)
-            return stream
+        if not self._cache:
+            return self.source.get_emoji(emoji)
+        if data := self.source.cached_emoji(emoji):
+            return BytesIO(data)
 
     def _get_discord_emoji(self, id: SupportsInt, /) -> Optional[BytesIO]:
         id = int(id)
+        if not self._cache:
+            return self.source.get_discord_emoji(id)
+        if data := self.source.cached_discord_emoji(id):
+            return BytesIO(data)
+
+    def _prefetch_nodes(self, lines: List[List[Node]]) -> None:
+        if not self._cache:
+            return
+        emojis = [n.content for line in lines for n in line if n.type is NodeType.emoji]
+        discord_ids = []
+        if self._render_discord_emoji:
+            discord_ids = [n.content for line in lines for n in line if n.type is NodeType.discord_emoji]
+        if emojis or discord_ids:
+            self.source.prefetch(emojis, discord_ids)
+
+    def prefetch(self, *texts: str) -> None:
+        """Fetch every emoji in the given texts in one concurrent batch,
+        so the texts can then be rendered without waiting on the source.
 
-        if self._cache and id in self._discord_emoji_cache:
-            entry = self._discord_emoji_cache[id]
-            entry.seek(0)
-            return entry
-
-        if stream := self.source.get_discord_emoji(id):
-            if self._cache:
-                self._discord_emoji_cache[id] = stream
-
-            stream.seek(0)
-            return stream
+        Parameters
+        ----------
+        texts: str
+            The texts that are going to be rendered.
+        """
+        self._prefetch_nodes([line for text in texts for line in to_nodes(text)])
 
     def getsize(
         self,
@@ -288,6 +274,7 @@ class Pilmoji:
         x, y = xy
         original_x = x
         nodes = to_nodes(text)
+        self._prefetch_nodes(nodes)
 
         for line in nodes:
             x = original_x
@@ -1,9 +1,8 @@
 import logging
 import math
-import random
 from datetime import datetime, timedelta
 from io import StringIO
-from typing import List, Union
+from typing import Dict, List, Union
 
 import discord
 from aiocache import cached
@@ -12,6 +11,9 @@ from redbot.core import commands
 from redbot.core.i18n import Translator
 from redbot.core.utils.chat_formatting import box, humanize_number
 
+from .levelcurve import get_curve, time_to_levels
+from .rankindex import RankIndex
+
 DPY2 = True if discord.__version__ > "1.7.3" else False
 _ = Translator("LevelUp", __file__)
 log = logging.getLogger("red.vrt.levelup.formatter")
@@ -19,7 +21,7 @@ log = logging.getLogger("red.vrt.levelup.formatter")
 
 # Get a level that would be achieved from the amount of XP
 def get_level(xp: int, base: int, exp: int) -> int:
-    return int((xp / base) ** (1 / exp))
+    return get_curve(base, exp).level(xp)
 
 
 # Get how much XP is needed to reach a level
@@ -27,6 +29,14 @@ def get_xp(level: int, base: int, exp: int) -> int:
     return math.ceil(base * (level**exp))
 
 
+# Get a user's XP including the XP they gave up to prestige
+def get_effective_xp(user: dict, conf: dict) -> int:
+    xp = int(user["xp"])
+    if prestige := int(user["prestige"]):
+        xp += prestige * get_xp(conf["prestige"], conf["base"], conf["exp"])
+    return xp
+
+
 # Estimate how much time it would take to reach a certain level based on current algorithm
 def time_to_level(
     level: int,
@@ -35,22 +45,7 @@ def time_to_level(
     cooldown: int,
     xp_range: list,
 ) -> int:
-    xp_needed = get_xp(level, base, exp)
-    xp_obtained = 0
-    time_to_reach_level = 0  # Seconds
-    while True:
-        xp = random.choice(range(xp_range[0], xp_range[1] + 1))
-        xp_obtained += xp
-
-        if random.random() < 0.5:
-            # Wait up to an hour after cooldown for a little more realism
-            wait = cooldown + random.randint(30, 3600)
-        else:
-            wait = cooldown + random.randint(5, 300)
-
-        time_to_reach_level += wait
-        if xp_obtained >= xp_needed:
-            return time_to_reach_level
+    return time_to_levels([level], base, exp, cooldown, xp_range)[0]
 
 
 # Convert a hex color to an RGB tuple
@@ -144,56 +139,146 @@ def get_attachments(ctx) -> List[discord.Attachment]:
     return content
 
 
+def get_stat_key(stat: str) -> str:
+    """Resolve a (possibly abbreviated) leaderboard stat name to its user data key"""
+    stat = stat.lower()
+    if "v" in stat:
+        return "voice"
+    elif "m" in stat:
+        return "messages"
+    elif "s" in stat:
+        return "stars"
+    return "xp"
+
+
+def format_stat(key: str, value: Union[int, float]) -> str:
+    if key == "voice":
+        return time_formatter(value)
+    if value > 999999999:
+        return f"{round(value / 1000000000, 1)}B"
+    elif value > 999999:
+        return f"{round(value / 1000000, 1)}M"
+    elif value > 9999:
+        return f"{round(value / 1000, 1)}K"
+    return str(round(value))
+
+
+class LeaderboardSource:
+    """
+    Lazily built leaderboard pages
+
+    Behaves like a list of embeds for the menus, but each page is only sliced out of the
+    presorted index and formatted the first time it is viewed.
+    """
+
+    per_page = 10
+
+    def __init__(
+        self,
+        ctx: commands.Context,
+        index: RankIndex,
+        users: dict,
+        key: str,
+        title: str,
+        desc: str,
+        show_level: bool,
+    ):
+        self.ctx = ctx
+        self.index = index
+        self.users = users
+        self.key = key
+        self.title = title
+        self.desc = desc
+        self.show_level = show_level
+        self.count = index.nonzero()
+        self.pages = math.ceil(self.count / self.per_page)
+        self.cache: Dict[int, discord.Embed] = {}
+
+        self.you = ""
+        position = index.nonzero_position(str(ctx.author.id))
+        if position and position <= self.count:
+            self.you = _("You: ") + f"{position}/{self.count}\n"
+
+    def __len__(self) -> int:
+        return self.pages
+
+    def __getitem__(self, page: int) -> discord.Embed:
+        if page < 0:
+            page += self.pages
+        # The index keeps changing while the menu is open, the page count is fixed when it's built
+        page = min(max(page, 0), self.pages - 1)
+        if page not in self.cache:
+            self.cache[page] = self.format_page(page)
+        return self.cache[page]
+
+    def format_page(self, page: int) -> discord.Embed:
+        start = page * self.per_page
+        stop = min(start + self.per_page, self.count)
+        guild = self.ctx.guild
+        buf = StringIO()
+        for place, (uid, value) in enumerate(self.index.nonzero_slice(start, stop), start=start + 1):
+            user_obj = guild.get_member(int(uid)) or self.ctx.bot.get_user(int(uid))
+            user = user_obj.name if user_obj else uid
+            stat = format_stat(self.key, value)
+            if self.show_level:
+                if lvl := self.users.get(uid, {}).get("level"):
+                    stat += f" 🎖{lvl}"
+            buf.write(f"{place}. {user} ({stat})\n")
+
+        embed = discord.Embed(
+            title=self.title,
+            description=self.desc + box(buf.getvalue(), lang="python"),
+            color=discord.Color.random(),
+        )
+        if DPY2:
+            icon = guild.icon
+        else:
+            icon = guild.icon_url
+
+        if self.you:
+            embed.set_footer(text=_("Pages ") + f"{page + 1}/{self.pages} | {self.you}", icon_url=icon)
+        else:
+            embed.set_footer(text=_("Pages ") + f"{page + 1}/{self.pages}", icon_url=icon)
+        return embed
+
+
 def get_leaderboard(
     ctx: commands.Context,
     settings: dict,
+    index: RankIndex,
     stat: str,
     lbtype: str,
     is_global: bool,
-) -> Union[List[discord.Embed], str]:
+    window: str = None,
+) -> Union[LeaderboardSource, str]:
     if lbtype == "weekly":
-        lb = settings["weekly"]["users"]
         title = _("Global Weekly ") if is_global else _("Weekly ")
+    elif lbtype == "window":
+        title = _("Last {} ").format(window)
     else:
-        lb = settings["users"]
         title = _("Global LevelUp ") if is_global else _("LevelUp ")
 
-        if "xp" in stat.lower():
-            lb = {uid: data.copy() for uid, data in settings["users"].items()}
-            if prestige_req := settings.get("prestige"):
-                # If this isnt pulled its global lb
-                for uid, data in lb.items():
-                    if prestige := data["prestige"]:
-                        data["xp"] += prestige * get_xp(prestige_req, settings["base"], settings["exp"])
-
-    if "v" in stat.lower():
-        sorted_users = sorted(lb.items(), key=lambda x: x[1]["voice"], reverse=True)
+    key = get_stat_key(stat)
+    if key == "voice":
         title += _("Voice Leaderboard")
-        key = "voice"
         col = "🎙️"
         statname = _("Voicetime")
-        total = time_formatter(sum(v["voice"] for v in lb.values()))
-    elif "m" in stat.lower():
-        sorted_users = sorted(lb.items(), key=lambda x: x[1]["messages"], reverse=True)
+        total = time_formatter(index.total)
+    elif key == "messages":
         title += _("Message Leaderboard")
-        key = "messages"
         col = "💬"
         statname = _("Messages")
-        total = humanize_number(round(sum(v["messages"] for v in lb.values())))
-    elif "s" in stat.lower():
-        sorted_users = sorted(lb.items(), key=lambda x: x[1]["stars"], reverse=True)
+        total = humanize_number(round(index.total))
+    elif key == "stars":
         title += _("Star Leaderboard")
-        key = "stars"
         col = "⭐"
         statname = _("Stars")
-        total = humanize_number(round(sum(v["stars"] for v in lb.values())))
+        total = humanize_number(round(index.total))
     else:  # Exp
-        sorted_users = sorted(lb.items(), key=lambda x: x[1]["xp"], reverse=True)
         title += _("Exp Leaderboard")
-        key = "xp"
         col = "💡"
         statname = _("Exp")
-        total = humanize_number(round(sum(v["xp"] for v in lb.values())))
+        total = humanize_number(round(index.total))
 
     if lbtype == "weekly":
         w = settings["weekly"]
@@ -207,76 +292,17 @@ def get_leaderboard(
     else:
         desc = _("Total") + f" {statname}: `{total}`{col}\n"
 
-    for i in sorted_users.copy():
-        if not i[1][key]:
-            sorted_users.remove(i)
-
-    if not sorted_users:
+    if not index.nonzero():
         if lbtype == "weekly":
             txt = _("There is no data for the weekly ") + statname.lower() + _(" leaderboard yet")
+        elif lbtype == "window":
+            txt = _("Nobody has any {} in the last {}").format(statname.lower(), window)
         else:
             txt = _("There is no data for the ") + statname.lower() + _(" leaderboard yet")
         return txt
 
-    you = ""
-    for i in sorted_users:
-        if i[0] == str(ctx.author.id):
-            you = _("You: ") + f"{sorted_users.index(i) + 1}/{len(sorted_users)}\n"
-
-    pages = math.ceil(len(sorted_users) / 10)
-    start = 0
-    stop = 10
-    embeds = []
-    for p in range(pages):
-        if stop > len(sorted_users):
-            stop = len(sorted_users)
-
-        buf = StringIO()
-        for i in range(start, stop, 1):
-            uid = sorted_users[i][0]
-            user_obj = ctx.guild.get_member(int(uid)) or ctx.bot.get_user(int(uid))
-            user = user_obj.name if user_obj else uid
-            data = sorted_users[i][1]
-
-            place = i + 1
-            if key == "voice":
-                stat = time_formatter(data[key])
-            else:
-                v = data[key]
-                if v > 999999999:
-                    stat = f"{round(v / 1000000000, 1)}B"
-                elif v > 999999:
-                    stat = f"{round(v / 1000000, 1)}M"
-                elif v > 9999:
-                    stat = f"{round(v / 1000, 1)}K"
-                else:
-                    stat = str(round(v))
-
-                if key == "xp" and lbtype != "weekly":
-                    if lvl := data.get("level"):
-                        stat += f" 🎖{lvl}"
-
-            buf.write(f"{place}. {user} ({stat})\n")
-
-        embed = discord.Embed(
-            title=title,
-            description=desc + box(buf.getvalue(), lang="python"),
-            color=discord.Color.random(),
-        )
-        if DPY2:
-            icon = ctx.guild.icon
-        else:
-            icon = ctx.guild.icon_url
-
-        if you:
-            embed.set_footer(text=_("Pages ") + f"{p + 1}/{pages} | {you}", icon_url=icon)
-        else:
-            embed.set_footer(text=_("Pages ") + f"{p + 1}/{pages}", icon_url=icon)
-
-        embeds.append(embed)
-        start += 10
-        stop += 10
-    return embeds
+    show_level = key == "xp" and lbtype == "normal"
+    return LeaderboardSource(ctx, index, settings["users"], key, title, desc, show_level)
 
 
 @cached(ttl=3600)
@@ -291,30 +317,5 @@ async def get_content_from_url(url: str):
         return None
 
 
-async def get_user_position(conf: dict, user_id: str) -> dict:
-    base = conf["base"]
-    exp = conf["exp"]
-    prestige_req = conf["prestige"]
-    leaderboard = {}
-    total_xp = 0
-    user_xp = 0
-    for user, data in conf["users"].items():
-        xp = int(data["xp"])
-        prestige = int(data["prestige"])
-        if prestige:
-            add_xp = get_xp(prestige_req, base, exp)
-            xp = int(xp + (prestige * add_xp))
-        leaderboard[user] = xp
-        total_xp += xp
-        if user == user_id:
-            user_xp = xp
-    sorted_users = sorted(leaderboard.items(), key=lambda x: x[1], reverse=True)
-    for i in sorted_users:
-        if i[0] == user_id:
-            if total_xp:
-                percent = round((user_xp / total_xp) * 100, 2)
-            else:
-                percent = 100
-            pos = sorted_users.index(i) + 1
-            pos_data = {"p": pos, "pr": percent}
-            return pos_data
+def get_user_position(index: RankIndex, user_id: str) -> dict:
+    return {"p": index.position(user_id), "pr": index.percent(user_id)}
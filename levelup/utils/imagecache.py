@@ -0,0 +1,64 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# Encoded image bytes and their file extension
+CachedImage = Tuple[bytes, str]
+
+
+def render_key(params: dict, *extra) -> str:
+    """Hash the inputs of a render so identical renders share a cache entry"""
+    dump = json.dumps([params, extra], sort_keys=True, default=str)
+    return hashlib.sha1(dump.encode()).hexdigest()
+
+
+class ImageCache:
+    """
+    Least recently used cache of encoded images
+
+    Entries are evicted oldest first once the total size of the cached bytes goes over the budget.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, CachedImage]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[CachedImage]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CachedImage):
+        if key in self._entries:
+            self.size -= len(self._entries.pop(key)[0])
+        if len(entry[0]) > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.size += len(entry[0])
+        self.evict()
+
+    def pop(self, key: str):
+        if key in self._entries:
+            self.size -= len(self._entries.pop(key)[0])
+
+    def resize(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def evict(self):
+        while self.size > self.max_bytes and self._entries:
+            __, (raw, __) = self._entries.popitem(last=False)
+            self.size -= len(raw)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
@@ -0,0 +1,292 @@
+import asyncio
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from aiohttp import ClientError, ClientSession, ClientTimeout
+
+log = logging.getLogger("red.vrt.levelup.importer")
+
+# (url, headers) -> (status, decoded json body)
+Fetch = Callable[[str, Dict[str, str]], Awaitable[Tuple[int, Any]]]
+# Checkpoints older than this belong to an abandoned import and are started over
+CHECKPOINT_TTL = 86400
+
+
+class ImportFailed(Exception):
+    def __init__(self, status: int, message: Optional[str] = None):
+        super().__init__(message or f"HTTP {status}")
+        self.status = status
+        self.message = message
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: Optional[float] = None):
+        self.retry_after = retry_after
+
+
+class ImportResult(NamedTuple):
+    meta: dict  # First page of the leaderboard without its entries, holds the bot's settings
+    users: Dict[str, dict]  # User ID -> imported stats
+    pages: int
+    resumed: int  # Pages taken from the checkpoint of an earlier attempt
+
+
+class HTTPFetch:
+    """Default fetch layer, one session for every page of an import"""
+
+    def __init__(self, timeout: int = 60):
+        self.timeout = timeout
+        self.session: Optional[ClientSession] = None
+
+    async def __call__(self, url: str, headers: Dict[str, str]) -> Tuple[int, Any]:
+        if self.session is None or self.session.closed:
+            self.session = ClientSession(timeout=ClientTimeout(total=self.timeout))
+        async with self.session.get(url, headers=headers) as res:
+            return res.status, await res.json(content_type=None)
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+
+class ImportSource(ABC):
+    """
+    A paged leaderboard API
+
+    Subclasses say where each page lives, how a page past the end looks and how to read users off a page.
+    `base_url` can be pointed at a local server for testing.
+    """
+
+    name = ""
+    base_url = ""
+    entries_key = ""
+    first_page = 0
+    max_pages: Optional[int] = None
+
+    def __init__(self, guild_id: int, base_url: Optional[str] = None):
+        self.guild_id = guild_id
+        if base_url:
+            self.base_url = base_url.rstrip("/")
+
+    @abstractmethod
+    def url(self, page: int) -> str:
+        ...
+
+    def headers(self) -> Dict[str, str]:
+        return {"Accept": "application/json"}
+
+    def is_end(self, status: int, data: Any) -> bool:
+        return status == 200 and not data.get(self.entries_key)
+
+    def error(self, data: Any) -> Optional[str]:
+        error = data.get("error") if isinstance(data, dict) else None
+        if isinstance(error, dict):
+            return error.get("message")
+        return error
+
+    @abstractmethod
+    def parse(self, entry: dict) -> Tuple[str, dict]:
+        ...
+
+    def users(self, data: dict) -> List[Tuple[str, dict]]:
+        return [self.parse(entry) for entry in data[self.entries_key]]
+
+
+class MEE6Source(ImportSource):
+    name = "mee6"
+    base_url = "https://mee6.xyz/api/plugins/levels/leaderboard"
+    entries_key = "players"
+
+    def url(self, page: int) -> str:
+        return f"{self.base_url}/{self.guild_id}?page={page}&limit=1000"
+
+    def parse(self, entry: dict) -> Tuple[str, dict]:
+        return str(entry["id"]), {"xp": entry["xp"], "level": entry["level"], "messages": entry["message_count"]}
+
+
+class AmariSource(ImportSource):
+    name = "amari"
+    base_url = "https://amaribot.com/api/v1/guild/leaderboard"
+    entries_key = "data"
+
+    def __init__(self, guild_id: int, api_key: str, base_url: Optional[str] = None):
+        super().__init__(guild_id, base_url)
+        self.api_key = api_key
+
+    def url(self, page: int) -> str:
+        return f"{self.base_url}/{self.guild_id}?page={page}&limit=1000"
+
+    def headers(self) -> Dict[str, str]:
+        return {"Accept": "application/json", "Authorization": self.api_key}
+
+    def is_end(self, status: int, data: Any) -> bool:
+        # Amari answers 501 once the pages run out
+        return status == 501 or super().is_end(status, data)
+
+    def parse(self, entry: dict) -> Tuple[str, dict]:
+        return str(entry["id"]), {"xp": entry["exp"], "level": entry["level"], "weekly_xp": entry["weeklyExp"]}
+
+
+class PolarisSource(ImportSource):
+    name = "polaris"
+    base_url = "https://gdcolon.com/polaris/api/leaderboard"
+    entries_key = "leaderboard"
+    first_page = 1
+    max_pages = 10
+
+    def url(self, page: int) -> str:
+        return f"{self.base_url}/{self.guild_id}?page={page}"
+
+    def parse(self, entry: dict) -> Tuple[str, dict]:
+        return str(entry["id"]), {"xp": entry["xp"]}
+
+
+class LeaderboardImporter:
+    """
+    Fetches every page of a leaderboard a few at a time and checkpoints each page to disk
+
+    Requests share one pace: the gap between them doubles (or follows the API's retry_after) whenever a page gets
+    rate limited and eases back down as pages come through. A rate limited page is retried up to `max_attempts` times.
+    Pages land in a JSON lines checkpoint as they arrive, so running the same import again after a failure
+    only fetches what is missing. The checkpoint is deleted by `finish` once the users have been merged.
+    """
+
+    def __init__(
+        self,
+        source: ImportSource,
+        checkpoint: Path,
+        fetch: Optional[Fetch] = None,
+        concurrency: int = 3,
+        min_delay: float = 1.0,
+        max_delay: float = 600.0,
+        max_attempts: int = 6,
+    ):
+        self.source = source
+        self.checkpoint = checkpoint
+        self.fetch = fetch
+        self.concurrency = concurrency
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.delay = min_delay
+        self.next_request = 0.0
+
+    def load_checkpoint(self) -> Tuple[Optional[dict], Dict[int, list], Optional[int]]:
+        meta, pages, end = None, {}, None
+        if not self.checkpoint.exists():
+            return meta, pages, end
+        if time.time() - self.checkpoint.stat().st_mtime > CHECKPOINT_TTL:
+            self.checkpoint.unlink()
+            return meta, pages, end
+        with self.checkpoint.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Interrupted mid write, the page will be fetched again
+                    continue
+                if "meta" in record:
+                    meta = record["meta"]
+                elif "end" in record:
+                    end = record["end"] if end is None else min(end, record["end"])
+                else:
+                    pages[record["page"]] = record["users"]
+        return meta, pages, end
+
+    def save(self, record: dict):
+        self.checkpoint.parent.mkdir(parents=True, exist_ok=True)
+        with self.checkpoint.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def finish(self):
+        self.checkpoint.unlink(missing_ok=True)
+
+    async def wait_turn(self):
+        now = time.monotonic()
+        start = max(now, self.next_request)
+        self.next_request = start + self.delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def get_page(self, fetch: Fetch, page: int) -> Tuple[int, Any]:
+        url = self.source.url(page)
+        headers = self.source.headers()
+        for attempt in range(1, self.max_attempts + 1):
+            await self.wait_turn()
+            try:
+                status, data = await fetch(url, headers)
+                if status == 429:
+                    retry_after = data.get("retry_after") if isinstance(data, dict) else None
+                    raise RateLimited(float(retry_after) if retry_after else None)
+            except (RateLimited, json.JSONDecodeError, ClientError, asyncio.TimeoutError) as e:
+                # Some of these APIs answer with an html page instead of a 429 when they are rate limiting
+                retry_after = e.retry_after if isinstance(e, RateLimited) else None
+                self.delay = min(max(self.delay * 2, retry_after or 0), self.max_delay)
+                log.warning(
+                    f"{self.source.name} page {page} failed (attempt {attempt}), slowing down to one request every {self.delay}s: {type(e).__name__}"
+                )
+                if attempt == self.max_attempts:
+                    raise ImportFailed(429, f"{type(e).__name__} after {attempt} attempts")
+                continue
+            self.delay = max(self.delay * 0.75, self.min_delay)
+            return status, data
+
+    async def run(self, progress: Optional[Callable[[int], Awaitable]] = None) -> ImportResult:
+        """
+        Fetch every page not in the checkpoint yet
+
+        Raises ImportFailed if the API refuses a page, pages fetched up to that point stay checkpointed.
+        """
+        meta, pages, end = self.load_checkpoint()
+        resumed = len(pages)
+        fetch = self.fetch or HTTPFetch()
+        first = self.source.first_page
+        last = first + self.source.max_pages if self.source.max_pages else None
+        page = first
+        try:
+            while True:
+                batch = []
+                while len(batch) < self.concurrency:
+                    if (end is not None and page >= end) or (last is not None and page >= last):
+                        break
+                    if page not in pages:
+                        batch.append(page)
+                    page += 1
+                if not batch:
+                    break
+                results = await asyncio.gather(*(self.get_page(fetch, i) for i in batch), return_exceptions=True)
+                failed = None
+                for i, result in zip(batch, results):
+                    if isinstance(result, BaseException):
+                        failed = failed or result
+                        continue
+                    status, data = result
+                    if self.source.is_end(status, data):
+                        end = i if end is None else min(end, i)
+                        self.save({"end": i})
+                        continue
+                    if status != 200:
+                        raise ImportFailed(status, self.source.error(data))
+                    if i == first:
+                        meta = {k: v for k, v in data.items() if k != self.source.entries_key}
+                        self.save({"meta": meta})
+                    pages[i] = self.source.users(data)
+                    self.save({"page": i, "users": pages[i]})
+                if failed is not None:
+                    raise failed
+                if progress is not None:
+                    await progress(len(pages))
+        finally:
+            if self.fetch is None:
+                await fetch.close()
+
+        users = {}
+        for i in sorted(pages):
+            if end is None or i < end:
+                users.update(pages[i])
+        return ImportResult(meta or {}, users, len(pages), resumed)
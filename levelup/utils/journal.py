@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+log = logging.getLogger("red.vrt.levelup.journal")
+
+# (guild ID, user ID) -> latest journaled record for that user
+Records = Dict[Tuple[int, str], dict]
+
+
+class XPJournal:
+    """
+    Append-only log of user stat changes, written as JSON lines and fsynced once per batch
+
+    User records hold the user's full stats (or null once removed) so replaying them is idempotent.
+    A guild record marks that guild as fully saved to config, and drops the user records before it on replay.
+    Compaction rotates the log aside, folds the changed users into config, then deletes the rotated log.
+    If that fails, the rotated log stays and is replayed ahead of the live one.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.rotated = path.with_suffix(path.suffix + ".old")
+
+    @staticmethod
+    def encode(record: dict) -> str:
+        """Serialize a record, done on the event loop so the writer thread never reads live cache dicts"""
+        return json.dumps(record, separators=(",", ":")) + "\n"
+
+    def write(self, lines: List[str]):
+        if not lines:
+            return
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def rotate(self):
+        """Move the live log aside before compacting, appending to a rotated log left by a failed compaction"""
+        if not self.path.exists():
+            return
+        if not self.rotated.exists():
+            os.replace(self.path, self.rotated)
+            return
+        with self.rotated.open("a", encoding="utf-8") as f:
+            f.write(self.path.read_text(encoding="utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self.path.unlink()
+
+    def commit(self):
+        """Drop the rotated log once everything in it is in config"""
+        self.rotated.unlink(missing_ok=True)
+
+    def replay(self) -> Records:
+        """Latest record of every user changed since their guild was last saved"""
+        records: Records = {}
+        for path in (self.rotated, self.path):
+            if not path.exists():
+                continue
+            with path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn write from a crash can only be the last line
+                        log.warning(f"Skipping unreadable journal line in {path.name}")
+                        continue
+                    gid = record["g"]
+                    if "u" not in record:
+                        records = {k: v for k, v in records.items() if k[0] != gid}
+                        continue
+                    records[(gid, record["u"])] = record
+        return records
+
+    def size(self) -> int:
+        return sum(i.stat().st_size for i in (self.rotated, self.path) if i.exists())
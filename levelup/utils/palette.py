@@ -0,0 +1,85 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+RGB = Tuple[int, int, int]
+
+# Images are downsampled so their longest side is about this many pixels before sampling
+SAMPLE_SIZE = 64
+# Bits kept per channel when bucketing pixels into palette colors
+BUCKET_BITS = 3
+MAX_CACHED = 1024
+
+# (image key, crop box, what was extracted) -> result
+_cache: "OrderedDict[tuple, object]" = OrderedDict()
+# Renders and asset prefetches sample colors from several threads at once
+_lock = threading.Lock()
+
+
+def image_key(img: Image.Image) -> str:
+    """Hash of an image's pixels, compute it once and pass it along when sampling several boxes of one image"""
+    return hashlib.blake2b(img.tobytes(), digest_size=16).hexdigest()
+
+
+def sample(img: Image.Image, box: Optional[tuple] = None) -> np.ndarray:
+    """Downsampled (N, 3) array of the opaque pixels in an image or a box of it"""
+    if box:
+        img = img.crop(box)
+    img = img.convert("RGBA")
+    factor = max(1, max(img.size) // SAMPLE_SIZE)
+    if factor > 1:
+        img = img.reduce(factor)
+    pixels = np.asarray(img).reshape(-1, 4)
+    opaque = pixels[pixels[:, 3] >= 128, :3]
+    return opaque if len(opaque) else pixels[:, :3]
+
+
+def _cached(key: tuple, func, *args):
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    # Computed outside the lock, two threads missing on the same key just both compute it
+    result = func(*args)
+    with _lock:
+        _cache[key] = result
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+    return result
+
+
+def _mean(img: Image.Image, box: Optional[tuple]) -> RGB:
+    pixels = sample(img, box)
+    return tuple(int(i) for i in pixels.mean(axis=0).round())
+
+
+def _palette(img: Image.Image, amount: int) -> List[RGB]:
+    pixels = sample(img).astype(np.int64)
+    shift = 8 - BUCKET_BITS
+    buckets = (
+        (pixels[:, 0] >> shift) << (BUCKET_BITS * 2) | (pixels[:, 1] >> shift) << BUCKET_BITS | (pixels[:, 2] >> shift)
+    )
+    size = 1 << (BUCKET_BITS * 3)
+    counts = np.bincount(buckets, minlength=size)
+    # Average the real colors that fell in each bucket rather than using the bucket corner
+    sums = np.stack([np.bincount(buckets, weights=pixels[:, i], minlength=size) for i in range(3)], axis=1)
+    top = np.argsort(counts)[::-1][:amount]
+    top = top[counts[top] > 0]
+    means = sums[top] / counts[top, None]
+    return [tuple(int(i) for i in color) for color in means.round()]
+
+
+def mean_color(img: Image.Image, box: Optional[tuple] = None, key: Optional[str] = None) -> RGB:
+    """Average color of an image, or of a box within it"""
+    key = key or image_key(img)
+    return _cached((key, box, "mean"), _mean, img, box)
+
+
+def palette(img: Image.Image, amount: int, key: Optional[str] = None) -> List[RGB]:
+    """The most common colors of an image, most common first"""
+    key = key or image_key(img)
+    return list(_cached((key, None, amount), _palette, img, amount))
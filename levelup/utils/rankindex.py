@@ -0,0 +1,112 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+Number = Union[int, float]
+
+
+class RankIndex:
+    """
+    Sorted leaderboard of a single stat for a guild
+
+    Entries are kept as (-value, user_id) tuples in a sorted list so the highest value sits at index 0.
+    Updates are a bisect + list insert/delete and position lookups are a single bisect.
+    """
+
+    __slots__ = ("_keys", "_values", "total")
+
+    def __init__(self):
+        self._keys: List[Tuple[Number, str]] = []
+        self._values: Dict[str, Number] = {}
+        self.total: Number = 0
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[str, Number]]) -> "RankIndex":
+        index = cls()
+        for uid, value in items:
+            index._values[uid] = value
+            index.total += value
+        index._keys = sorted((-v, uid) for uid, v in index._values.items())
+        return index
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._values
+
+    def get(self, uid: str) -> Optional[Number]:
+        return self._values.get(uid)
+
+    def update(self, uid: str, value: Number):
+        """Set the value for a user, moving them to their new place in the index"""
+        old = self._values.get(uid)
+        if old is not None:
+            if old == value:
+                return
+            self._discard(uid, old)
+        self._values[uid] = value
+        self.total += value
+        insort(self._keys, (-value, uid))
+
+    def add(self, uid: str, amount: Number):
+        """Increment the value for a user"""
+        self.update(uid, self._values.get(uid, 0) + amount)
+
+    def remove(self, uid: str):
+        old = self._values.get(uid)
+        if old is None:
+            return
+        self._discard(uid, old)
+        del self._values[uid]
+
+    def _discard(self, uid: str, value: Number):
+        key = (-value, uid)
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+        self.total -= value
+
+    def position(self, uid: str) -> Optional[int]:
+        """1-indexed place of a user, or None if they aren't indexed"""
+        value = self._values.get(uid)
+        if value is None:
+            return None
+        return bisect_left(self._keys, (-value, uid)) + 1
+
+    def percent(self, uid: str) -> float:
+        """Percentage of the total held by a user"""
+        value = self._values.get(uid, 0)
+        if not self.total:
+            return 100
+        return round((value / self.total) * 100, 2)
+
+    def _zeros(self) -> Tuple[int, int]:
+        """Start and stop of the entries with a value of 0, they sit between the positive and negative values"""
+        return bisect_left(self._keys, (0, "")), bisect_right(self._keys, (0, "\U0010ffff"))
+
+    def nonzero(self) -> int:
+        """Count of entries with a value other than 0"""
+        start, stop = self._zeros()
+        return len(self._keys) - (stop - start)
+
+    def nonzero_position(self, uid: str) -> Optional[int]:
+        """1-indexed place of a user among the nonzero entries, or None if they aren't indexed or have 0"""
+        value = self._values.get(uid)
+        if not value:
+            return None
+        position = bisect_left(self._keys, (-value, uid)) + 1
+        if value < 0:
+            start, stop = self._zeros()
+            position -= stop - start
+        return position
+
+    def slice(self, start: int, stop: int) -> List[Tuple[str, Number]]:
+        """Get (user_id, value) pairs between two 0-indexed places"""
+        return [(uid, -v) for v, uid in self._keys[start:stop]]
+
+    def nonzero_slice(self, start: int, stop: int) -> List[Tuple[str, Number]]:
+        """Get (user_id, value) pairs between two 0-indexed places, skipping over entries with 0"""
+        zero_start, zero_stop = self._zeros()
+        skip = zero_stop - zero_start
+        keys = self._keys[start : min(stop, zero_start)] + self._keys[max(start, zero_start) + skip : stop + skip]
+        return [(uid, -v) for v, uid in keys]
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import discord
+
+log = logging.getLogger("red.vrt.levelup.rolesync")
+
+# Seconds between role edits in one guild, the pace adapts within these bounds
+MIN_DELAY = 0.25
+MAX_DELAY = 15.0
+# A request taking longer than this most likely sat out a rate limit inside discord.py
+SLOW_REQUEST = 1.5
+
+
+class RoleSyncQueue:
+    """
+    Background worker that applies level and prestige role changes
+
+    Changes are queued per member and merged, so any number of level ups before the worker gets to a member
+    turns into a single edit(roles=...) call. Each guild has its own worker and pace: the delay between edits doubles
+    whenever a request was slowed down by a rate limit or failed with one, and eases back down while requests go through.
+    """
+
+    def __init__(self, reason: str = "Level roles"):
+        self.reason = reason
+        # Guild ID -> member ID -> (role IDs to add, role IDs to remove)
+        self.pending: Dict[int, Dict[int, Tuple[Set[int], Set[int]]]] = {}
+        self.delays: Dict[int, float] = {}
+        # Guild ID -> [done, total] for the current run of the guild's worker
+        self.progress: Dict[int, list] = {}
+        self.workers: Dict[int, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return sum(len(i) for i in self.pending.values())
+
+    def enqueue(
+        self,
+        member: discord.Member,
+        add: Iterable[discord.Role] = (),
+        remove: Iterable[discord.Role] = (),
+    ):
+        """Queue roles for a member to gain and lose, merged with anything already pending for them"""
+        add = {role.id for role in add}
+        remove = {role.id for role in remove}
+        if not add and not remove:
+            return
+        if self.merge(member.guild.id, member.id, add, remove):
+            progress = self.progress.setdefault(member.guild.id, [0, 0])
+            progress[1] += 1
+        self.start(member.guild)
+
+    def merge(self, guild_id: int, member_id: int, add: Set[int], remove: Set[int], latest: bool = True) -> bool:
+        """Merge role changes into a member's pending ones, returns whether the member wasn't queued yet"""
+        guild_pending = self.pending.setdefault(guild_id, {})
+        if member_id not in guild_pending:
+            guild_pending[member_id] = (set(add), set(remove))
+            return True
+        adding, removing = guild_pending[member_id]
+        if latest:
+            # The latest request for a role wins
+            adding.difference_update(remove)
+            removing.difference_update(add)
+            adding.update(add)
+            removing.update(remove)
+        else:
+            # Older changes only fill in roles the pending ones don't mention
+            add, remove = add - removing, remove - adding
+            adding.update(add)
+            removing.update(remove)
+        return False
+
+    def start(self, guild: discord.Guild):
+        worker = self.workers.get(guild.id)
+        if worker is None or worker.done():
+            self.workers[guild.id] = asyncio.create_task(self.run(guild))
+
+    def stop(self):
+        for worker in self.workers.values():
+            worker.cancel()
+        self.workers.clear()
+
+    def get_progress(self, guild_id: int) -> Optional[Tuple[int, int]]:
+        """Members done and members queued since the guild's worker last went idle"""
+        if guild_id not in self.progress:
+            return None
+        done, total = self.progress[guild_id]
+        return done, total
+
+    async def run(self, guild: discord.Guild):
+        gid = guild.id
+        try:
+            while self.pending.get(gid):
+                member_id = next(iter(self.pending[gid]))
+                add, remove = self.pending[gid].pop(member_id)
+                try:
+                    limited = await self.apply(guild, member_id, add, remove)
+                except Exception as e:
+                    # Role or member gone mid run, the rest of the queue still goes through
+                    log.error(f"Failed to update level roles for member {member_id} in {guild}", exc_info=e)
+                    limited = False
+                self.progress[gid][0] += 1
+                delay = self.delays.get(gid, MIN_DELAY)
+                delay = min(delay * 2, MAX_DELAY) if limited else max(delay * 0.8, MIN_DELAY)
+                self.delays[gid] = delay
+                await asyncio.sleep(delay)
+        finally:
+            self.pending.pop(gid, None)
+            self.progress.pop(gid, None)
+
+    async def apply(self, guild: discord.Guild, member_id: int, add: Set[int], remove: Set[int]) -> bool:
+        """Edit a member's roles in one request, returns whether it ran into a rate limit"""
+        member = guild.get_member(member_id)
+        if not member or not guild.me.guild_permissions.manage_roles:
+            return False
+        top = guild.me.top_role
+        current = {role.id: role for role in member.roles if not role.is_default()}
+        roles = dict(current)
+        for role_id in add:
+            role = guild.get_role(role_id)
+            if role and role < top and not role.managed:
+                roles[role_id] = role
+        for role_id in remove:
+            role = current.get(role_id)
+            if role and role < top and not role.managed:
+                roles.pop(role_id)
+        if roles.keys() == current.keys():
+            return False
+
+        start = monotonic()
+        try:
+            await member.edit(roles=list(roles.values()), reason=self.reason)
+        except discord.HTTPException as e:
+            if e.status == 429:
+                # Try them again once the pace has backed off, under anything queued for them since
+                if self.merge(guild.id, member_id, add, remove, latest=False):
+                    self.progress[guild.id][1] += 1
+                return True
+            log.warning(f"Failed to update level roles for {member} in {guild}: {e}")
+            return False
+        return monotonic() - start > SLOW_REQUEST
@@ -1,7 +1,14 @@
+import hashlib
+import os
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from typing import Any, ClassVar, Dict, Optional
-from urllib.error import HTTPError
+from pathlib import Path
+from typing import Any, Callable, ClassVar, Dict, Iterable, Optional
+from urllib.error import URLError
 from urllib.parse import quote_plus
 from urllib.request import Request, urlopen
 
@@ -14,6 +21,8 @@ except ImportError:
     _has_requests = False
 
 __all__ = (
+    "EmojiCache",
+    "emoji_cache",
     "BaseSource",
     "HTTPBasedSource",
     "DiscordEmojiSourceMixin",
@@ -31,15 +40,110 @@ __all__ = (
     "MozillaEmojiSource",
     "OpenmojiEmojiSource",
     "TwemojiEmojiSource",
+    "LocalTwemojiSource",
     "FacebookMessengerEmojiSource",
     "Twemoji",
     "Openmoji",
 )
 
 
+class EmojiCache:
+    """A process-wide, size-bounded cache of emoji images.
+
+    Images are kept in memory up to ``max_bytes`` and least recently used ones are dropped first.
+    Once :meth:`configure` is given a folder, images are also written there and read back on a memory miss,
+    so renderers in other processes and after restarts don't fetch them again.
+    Emojis a source could not get are remembered in memory for ``missing_seconds``,
+    so they aren't requested on every render but a failed request is retried later.
+
+    Parameters
+    ----------
+    max_bytes: int
+        The most image bytes to keep in memory.
+    missing_seconds: float
+        How long to wait before asking a source again for an emoji it could not get.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024**2, missing_seconds: float = 600) -> None:
+        self.max_bytes = max_bytes
+        self.missing_seconds = missing_seconds
+        self.path: Optional[Path] = None
+        self.size = 0
+        self._missing: Dict[str, float] = {}
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, path: Optional[Path], max_disk_bytes: int = 64 * 1024**2) -> None:
+        """Set the folder images are persisted to, trimming it oldest first to ``max_disk_bytes``."""
+        self.path = path
+        if path is None:
+            return
+        path.mkdir(parents=True, exist_ok=True)
+        files = sorted(path.iterdir(), key=lambda f: f.stat().st_mtime)
+        total = sum(f.stat().st_size for f in files)
+        for file in files:
+            if total <= max_disk_bytes:
+                break
+            total -= file.stat().st_size
+            file.unlink(missing_ok=True)
+
+    def _file(self, key: str) -> Path:
+        return self.path / hashlib.sha1(key.encode()).hexdigest()
+
+    def is_missing(self, key: str) -> bool:
+        expires = self._missing.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            self._missing.pop(key, None)
+            return False
+        return True
+
+    def mark_missing(self, key: str) -> None:
+        self._missing[key] = time.monotonic() + self.missing_seconds
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+        if self.path is not None:
+            file = self._file(key)
+            if file.exists():
+                data = file.read_bytes()
+                self._remember(key, data)
+                return data
+        return None
+
+    def put(self, key: str, data: bytes) -> None:
+        self._remember(key, data)
+        if self.path is not None:
+            file = self._file(key)
+            tmp = file.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, file)
+
+    def _remember(self, key: str, data: bytes) -> None:
+        with self._lock:
+            if key in self._images:
+                return
+            self._images[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes and len(self._images) > 1:
+                __, dropped = self._images.popitem(last=False)
+                self.size -= len(dropped)
+
+
+emoji_cache = EmojiCache()
+_prefetch_pool: Optional[ThreadPoolExecutor] = None
+
+
 class BaseSource(ABC):
     """The base class for an emoji image source."""
 
+    #: Whether this source has to reach the network for emojis it has not seen before
+    REMOTE: ClassVar[bool] = False
+
     @abstractmethod
     def get_emoji(self, emoji: str, /) -> Optional[BytesIO]:
         """Retrieves a :class:`io.BytesIO` stream for the image of the given emoji.
@@ -76,6 +180,60 @@ class BaseSource(ABC):
         """
         raise NotImplementedError
 
+    def _key(self, emoji: str) -> str:
+        return f"{self.__class__.__name__}:{emoji}"
+
+    def cached_emoji(self, emoji: str, /) -> Optional[bytes]:
+        """Get an emoji image through the shared :data:`emoji_cache`, fetching it from this source on a miss."""
+        key = self._key(emoji)
+        if emoji_cache.is_missing(key):
+            return None
+        if (data := emoji_cache.get(key)) is not None:
+            return data
+        return self._fetch(key, self.get_emoji, emoji)
+
+    def cached_discord_emoji(self, id: int, /) -> Optional[bytes]:
+        """Get a Discord emoji image through the shared :data:`emoji_cache`, fetching it from this source on a miss."""
+        # Discord emojis look the same whichever source renders them
+        key = f"discord:{id}"
+        if emoji_cache.is_missing(key):
+            return None
+        if (data := emoji_cache.get(key)) is not None:
+            return data
+        return self._fetch(key, self.get_discord_emoji, id)
+
+    @staticmethod
+    def _fetch(key: str, getter: Callable[[Any], Optional[BytesIO]], arg: Any) -> Optional[bytes]:
+        stream = getter(arg)
+        data = stream.getvalue() if stream is not None else b""
+        # Failed requests are never written to the cache, only skipped for a while
+        if not data:
+            emoji_cache.mark_missing(key)
+            return None
+        emoji_cache.put(key, data)
+        return data
+
+    def prefetch(self, emojis: Iterable[str] = (), discord_ids: Iterable[int] = ()) -> None:
+        """Fetch every given emoji that isn't cached yet in one concurrent batch.
+
+        Parameters
+        ----------
+        emojis: Iterable[str]
+            Unicode emojis to fetch.
+        discord_ids: Iterable[int]
+            Snowflake IDs of Discord emojis to fetch.
+        """
+        global _prefetch_pool
+        jobs = [(self.cached_emoji, e) for e in set(emojis)]
+        jobs += [(self.cached_discord_emoji, int(i)) for i in set(discord_ids)]
+        if len(jobs) < 2 or not self.REMOTE:
+            for func, arg in jobs:
+                func(arg)
+            return
+        if _prefetch_pool is None:
+            _prefetch_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pilmoji")
+        list(_prefetch_pool.map(lambda job: job[0](job[1]), jobs))
+
     def __repr__(self) -> str:
         return f"<{self.__class__.__name__}>"
 
@@ -83,13 +241,22 @@ class BaseSource(ABC):
 class HTTPBasedSource(BaseSource):
     """Represents an HTTP-based source."""
 
+    REMOTE = True
+
     REQUEST_KWARGS: ClassVar[Dict[str, Any]] = {
         "headers": {"User-Agent": "Mozilla/5.0"}
     }
 
     def __init__(self) -> None:
-        if _has_requests:
-            self._requests_session = requests.Session()
+        # Sessions aren't thread safe and prefetching requests from several threads, so each thread gets its own
+        self._local = threading.local()
+
+    @property
+    def _requests_session(self) -> "requests.Session":
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
 
     def request(self, url: str) -> bytes:
         """Makes a GET request to the given URL.
@@ -109,12 +276,12 @@ class HTTPBasedSource(BaseSource):
         Raises
         ------
         Union[:class:`requests.HTTPError`, :class:`urllib.error.HTTPError`]
-            There was an error requesting from the URL.
+            There was an error requesting from the URL, or it did not respond with a success status.
         """
         if _has_requests:
             with self._requests_session.get(url, **self.REQUEST_KWARGS) as response:
-                if response.ok:
-                    return response.content
+                response.raise_for_status()
+                return response.content
         else:
             req = Request(url, **self.REQUEST_KWARGS)
             with urlopen(req) as response:
@@ -140,7 +307,7 @@ class DiscordEmojiSourceMixin(HTTPBasedSource):
 
     def get_discord_emoji(self, id: int, /) -> Optional[BytesIO]:
         url = self.BASE_DISCORD_EMOJI_URL + str(id) + ".png"
-        _to_catch = HTTPError if not _has_requests else requests.HTTPError
+        _to_catch = URLError if not _has_requests else requests.RequestException
 
         try:
             return BytesIO(self.request(url))
@@ -164,7 +331,7 @@ class EmojiCDNSource(DiscordEmojiSourceMixin):
             + "?style="
             + quote_plus(self.STYLE)
         )
-        _to_catch = HTTPError if not _has_requests else requests.HTTPError
+        _to_catch = URLError if not _has_requests else requests.RequestException
 
         try:
             return BytesIO(self.request(url))
@@ -244,6 +411,50 @@ class MozillaEmojiSource(EmojiCDNSource):
     STYLE = "mozilla"
 
 
+class LocalTwemojiSource(BaseSource):
+    """A source that reads Twemoji images from a local folder, falling back to another source for anything missing.
+
+    The folder holds the Twemoji PNG set as published in the twemoji repository's ``assets/72x72`` directory,
+    with files named after the emoji's lowercase hex codepoints joined by ``-``, e.g. ``1f468-200d-1f4bb.png``.
+    Without a fallback the source never touches the network, and emojis missing from the folder are rendered as text.
+
+    Parameters
+    ----------
+    directory: :class:`pathlib.Path`
+        The folder to read emoji images from.
+    fallback: Optional[:class:`BaseSource`]
+        The source to ask for emojis missing from the folder, and for Discord emojis.
+    """
+
+    def __init__(self, directory: Path, fallback: Optional[BaseSource] = None) -> None:
+        self.directory = directory
+        self.fallback = fallback
+        # Only batch prefetches across threads when lookups can go out to the network
+        self.REMOTE = fallback is not None and fallback.REMOTE
+
+    @staticmethod
+    def has_assets(directory: Path) -> bool:
+        """Whether a folder holds any emoji images to use."""
+        return directory.is_dir() and next(directory.glob("*.png"), None) is not None
+
+    def get_emoji(self, emoji: str, /) -> Optional[BytesIO]:
+        codepoints = [f"{ord(char):x}" for char in emoji]
+        # Twemoji drops the variation selector from file names unless the emoji is a ZWJ sequence
+        names = ["-".join(codepoints), "-".join(c for c in codepoints if c != "fe0f")]
+        for name in names:
+            file = self.directory / f"{name}.png"
+            if file.exists():
+                return BytesIO(file.read_bytes())
+        if self.fallback is not None:
+            return self.fallback.get_emoji(emoji)
+        return None
+
+    def get_discord_emoji(self, id: int, /) -> Optional[BytesIO]:
+        if self.fallback is not None:
+            return self.fallback.get_discord_emoji(id)
+        return None
+
+
 # Aliases
 Openmoji = OpenmojiEmojiSource
 FacebookMessengerEmojiSource = MessengerEmojiSource
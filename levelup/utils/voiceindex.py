@@ -0,0 +1,85 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+import discord
+
+
+class VoiceSession:
+    """A member sitting in a voice channel, and the state they have been in since `since`"""
+
+    __slots__ = ("channel_id", "since", "muted", "deafened", "streaming")
+
+    def __init__(self, channel_id: int, since: datetime, muted: bool, deafened: bool, streaming: bool):
+        self.channel_id = channel_id
+        self.since = since
+        self.muted = muted
+        self.deafened = deafened
+        self.streaming = streaming
+
+
+class VoiceIndex:
+    """
+    Members currently in voice, kept up to date from voice state updates
+
+    Sessions are keyed by guild ID then member ID, and each voice channel keeps the set of humans in it
+    so the solo check doesn't need to look at the channel's members. Bots are never indexed.
+    """
+
+    def __init__(self):
+        self.sessions: Dict[int, Dict[int, VoiceSession]] = {}
+        self.channels: Dict[int, Dict[int, Set[int]]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(i) for i in self.sessions.values())
+
+    def guild(self, guild_id: int) -> Dict[int, VoiceSession]:
+        return self.sessions.get(guild_id, {})
+
+    def get(self, guild_id: int, member_id: int) -> Optional[VoiceSession]:
+        return self.sessions.get(guild_id, {}).get(member_id)
+
+    def humans(self, guild_id: int, channel_id: int) -> int:
+        """Count of non-bot members in a voice channel"""
+        return len(self.channels.get(guild_id, {}).get(channel_id, ()))
+
+    def members(self, guild_id: int, channel_id: int) -> List[int]:
+        return list(self.channels.get(guild_id, {}).get(channel_id, ()))
+
+    def join(self, guild_id: int, member_id: int, state: discord.VoiceState, now: datetime):
+        self.leave(guild_id, member_id)
+        session = VoiceSession(state.channel.id, now, state.self_mute, state.self_deaf, state.self_stream)
+        self.sessions.setdefault(guild_id, {})[member_id] = session
+        self.channels.setdefault(guild_id, {}).setdefault(state.channel.id, set()).add(member_id)
+
+    def leave(self, guild_id: int, member_id: int) -> Optional[VoiceSession]:
+        session = self.sessions.get(guild_id, {}).pop(member_id, None)
+        if session is None:
+            return None
+        channel = self.channels[guild_id].get(session.channel_id)
+        if channel is not None:
+            channel.discard(member_id)
+            if not channel:
+                del self.channels[guild_id][session.channel_id]
+        return session
+
+    def update(self, guild_id: int, member_id: int, state: discord.VoiceState):
+        """Refresh the mute, deaf and stream flags of a member without moving them"""
+        session = self.get(guild_id, member_id)
+        if session is None:
+            return
+        session.muted = state.self_mute
+        session.deafened = state.self_deaf
+        session.streaming = state.self_stream
+
+    def clear(self, guild_id: int):
+        self.sessions.pop(guild_id, None)
+        self.channels.pop(guild_id, None)
+
+    def seed(self, guild: discord.Guild, now: datetime):
+        """Index everyone already in voice, used when a guild is first loaded"""
+        self.clear(guild.id)
+        for channel in [*guild.voice_channels, *guild.stage_channels]:
+            for member in channel.members:
+                if member.bot or not member.voice:
+                    continue
+                self.join(guild.id, member.id, member.voice, now)